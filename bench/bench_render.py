@@ -0,0 +1,360 @@
+"""
+卡片渲染压测
+用接近真实数据的样例渲染templates/下的每个卡片模板，依次在并发1/4/8/16下各渲染若干次，
+统计耗时分位数、吞吐、生成的图片大小、浏览器进程的CPU时间和整个进程树的内存峰值，
+结果写入JSON文件，用于评估页面池、缓存等渲染优化的收益。
+
+渲染后端：
+    jinja       只渲染HTML，不启动浏览器，衡量模板本身的开销
+    playwright  插件实际使用的Chromium截图渲染
+playwright后端的模式：
+    default     与插件一致，共用一个浏览器上下文，每次渲染新开页面，设备像素比为2
+    scale1      设备像素比改为1，对比高清截图带来的额外开销
+
+用法（在仓库根目录下）：
+    python -m bench.bench_render --output bench_render.json
+    python -m bench.bench_render --backends jinja --concurrency 1 16 --iterations 64
+"""
+import argparse
+import asyncio
+import datetime
+import json
+import os
+import platform
+import shutil
+import tempfile
+import time
+from pathlib import Path
+from typing import Any, Awaitable, Callable
+
+from .bench_watchers import _latency_summary
+
+BACKENDS = ('jinja', 'playwright')
+PLAYWRIGHT_MODES = ('default', 'scale1')
+
+
+# 各模板的样例数据，字段与插件中调用渲染器的地方一致
+BATTLE_RECORD = {
+    'user_name': '小企鹅突击队', 'title': '百万撤离！', 'time': '2026-10-19 21:13:45',
+    'map_name': '航天基地-机密', 'result': '撤离成功', 'duration': '28分17秒', 'kill_count': 4,
+    'price': '1.6M', 'loss': '312.5K', 'is_gain': True, 'main_value': '1.3M',
+}
+TDM_BATTLE_RECORD = {
+    'user_name': '小企鹅突击队', 'title': '战场高光！', 'time': '2026-10-19 21:42:08',
+    'map_name': '攀升-攻防', 'result': '胜利', 'gametime': '27分3秒', 'armed_force': '威龙',
+    'kill_count': 112, 'death_count': 23, 'assist_count': 17, 'total_score': 31820,
+    'avg_score_per_minute': 1176, 'is_good': True, 'main_label': '捞薯大师', 'main_value': '112',
+    'badge_text': '100+杀',
+}
+SINGLE_BATTLE_CARD = {
+    'user_name': '小企鹅突击队', 'time': '2026-10-19 20:31:02', 'map_name': '长弓溪谷-机密',
+    'armed_force': '红狼', 'result': '撤离失败', 'duration': '12分40秒', 'kill_count': 2,
+    'price': '87.2K', 'profit': '-245.0K', 'title': '#3',
+}
+SINGLE_TDM_CARD = {
+    'title': '#2', 'time': '2026-10-19 19:55:31', 'user_name': '小企鹅突击队', 'map_name': '临界点-攻防',
+    'armed_force': '牧羊人', 'result': '失败', 'gametime': '24分58秒', 'kill_count': 38,
+    'death_count': 19, 'assist_count': 22, 'rescue_count': 6, 'total_score': 15240,
+    'avg_score_per_minute': 610,
+}
+PLAYER_INFO = {
+    'user_name': '小企鹅突击队', 'money': '12.4M', 'propcapital': '86.3M', 'rankpoint': 5321,
+    'soltotalfght': 1843, 'solttotalescape': 1107, 'soltotalkill': 3390, 'solescaperatio': '60%',
+    'profitLossRatio': '1.8K', 'highKillDeathRatio': '1.92', 'medKillDeathRatio': '1.47',
+    'lowKillDeathRatio': '1.13', 'totalGainedPrice': '1.2G', 'totalGameTime': '612小时5分钟',
+    'tdmrankpoint': 4210, 'avgkillperminute': '0.94', 'tdmtotalfight': 926, 'totalwin': 517,
+    'tdmtotalkill': 21834, 'tdmduration': '387小时12分钟', 'tdmsuccessratio': '56%',
+    'avgScorePerMinute': '512.30', 'totalVehicleDestroyed': 842, 'totalVehicleKill': 1307,
+}
+SAFEHOUSE_DEVICES = [
+    {'place_name': '技术中心', 'status': 'producing', 'object_name': '高级子弹生产零件',
+     'left_time': '3小时12分钟', 'finish_time': '10-20 01:05:00', 'progress': 60.0},
+    {'place_name': '工作台', 'status': 'producing', 'object_name': '电子干扰器',
+     'left_time': '47分钟', 'finish_time': '10-19 22:40:00', 'progress': 84.3},
+    {'place_name': '制药台', 'status': 'idle'},
+    {'place_name': '防具台', 'status': 'producing', 'object_name': '精英防弹背心',
+     'left_time': '7小时58分钟', 'finish_time': '10-20 05:51:00', 'progress': 12.5},
+]
+PASSWORDS = [
+    {'map_name': '零号大坝', 'secret': '4827'},
+    {'map_name': '长弓溪谷', 'secret': '1093'},
+    {'map_name': '巴克什', 'secret': '7715'},
+    {'map_name': '航天基地', 'secret': '3368'},
+    {'map_name': '潮汐监狱', 'secret': '5502'},
+]
+DAILY_REPORT = {
+    'report_date': '2026-10-18', 'gain': 2384000, 'gain_str': '2.4M',
+    'collections': '非洲之心、显卡、军用信息终端、高速磁盘阵列',
+}
+WEEKLY_REPORT = {
+    'user_name': '小企鹅突击队', 'statDate_str': '2026-10-12 ~ 2026-10-18', 'Gained_Price_Str': '38.6M',
+    'consume_Price_Str': '21.3M', 'rise_Price_Str': '9.8M', 'profit_str': '17.3M',
+    'total_ArmedForceId_num_list': [
+        {'ArmedForceId': 10007, 'inum': 41}, {'ArmedForceId': 30008, 'inum': 23},
+        {'ArmedForceId': 10010, 'inum': 12}, {'ArmedForceId': 30010, 'inum': 7},
+    ],
+    'total_mapid_num_list': [
+        {'MapId': 2202, 'inum': 30}, {'MapId': 1902, 'inum': 24},
+        {'MapId': 2231, 'inum': 18}, {'MapId': 1901, 'inum': 11},
+    ],
+    'friend_list': [
+        {'charac_name': f'队友{i}', 'sol_num': 30 - i * 5, 'kill_num': 40 - i * 6, 'death_num': 12 + i,
+         'escape_num': 18 - i * 2, 'fail_num': 12 - i * 3, 'gained_str': '6.2M', 'consume_str': '3.1M',
+         'profit_str': '3.1M' if i % 2 == 0 else '-820.0K'}
+        for i in range(4)
+    ],
+    'profit': 17300000, 'rise_price': 9800000, 'total_sol_num': 83, 'total_Online_Time_str': '31小时24分钟',
+    'total_Kill_Player': 147, 'total_Death_Count': 52, 'total_exacuation_num': '51',
+    'GainedPrice_overmillion_num': 9,
+    'price_list': ['76500000', '78100000', '77200000', '80900000', '83400000', '84000000', '86300000'],
+}
+AI_COMMENT = {
+    'user_name': '小企鹅突击队', 'date_range': '2026-10-12 ~ 2026-10-18', 'score': 7.5,
+    'comment': '本周83场烽火，撤离率六成出头，百万撤离9次，红狼用得最多也打得最好。'
+               '战损主要集中在机密大坝的开局交火，建议少在主楼前停留，把带入控制在收益的一半以内。' * 3,
+}
+
+# 模板 -> 调用渲染器的方式，经过渲染器的公开方法以包含周报等卡片的数据预处理
+FIXTURES: dict[str, Callable[[Any], Awaitable[bytes]]] = {
+    'help.html': lambda r: r.render_card('help.html', {}),
+    'login_success.html': lambda r: r.render_login_success('小企鹅突击队', '12.4M'),
+    'player_info.html': lambda r: r.render_player_info(PLAYER_INFO),
+    'safehouse.html': lambda r: r.render_safehouse(SAFEHOUSE_DEVICES),
+    'password.html': lambda r: r.render_password(PASSWORDS),
+    'daily_report.html': lambda r: r.render_daily_report(**DAILY_REPORT),
+    'weekly_report.html': lambda r: r.render_weekly_report(**WEEKLY_REPORT),
+    'battle_record.html': lambda r: r.render_battle_record(BATTLE_RECORD),
+    'single_battle_card.html': lambda r: r.render_single_battle_card(SINGLE_BATTLE_CARD),
+    'ai_comment.html': lambda r: r.render_ai_comment(**AI_COMMENT),
+    'tdm_battle_record.html': lambda r: r.render_tdm_battle_record(TDM_BATTLE_RECORD),
+    'single_tdm_card.html': lambda r: r.render_single_tdm_card(SINGLE_TDM_CARD),
+}
+
+
+def _process_tree() -> list[int]:
+    """当前进程及其所有子孙进程的pid，非Linux系统上只返回当前进程"""
+    pid = os.getpid()
+    proc = Path('/proc')
+    if not proc.exists():
+        return [pid]
+    children: dict[int, list[int]] = {}
+    for entry in proc.iterdir():
+        if not entry.name.isdigit():
+            continue
+        try:
+            stat = (entry / 'stat').read_text()
+        except OSError:
+            continue
+        # 进程名可能包含空格和括号，从最后一个右括号之后解析
+        ppid = int(stat.rsplit(')', 1)[1].split()[1])
+        children.setdefault(ppid, []).append(int(entry.name))
+    tree, stack = [], [pid]
+    while stack:
+        current = stack.pop()
+        tree.append(current)
+        stack.extend(children.get(current, []))
+    return tree
+
+def _tree_usage() -> tuple[float|None, float|None]:
+    """
+    子孙进程（Chromium及Playwright驱动）累计的CPU时间（秒）和进程树的总内存占用（MB）
+
+    非Linux系统上返回(None, None)
+    """
+    if not Path('/proc').exists():
+        return None, None
+    self_pid = os.getpid()
+    ticks = os.sysconf('SC_CLK_TCK')
+    page_size = os.sysconf('SC_PAGE_SIZE')
+    cpu = rss = 0.0
+    for pid in _process_tree():
+        try:
+            fields = Path(f'/proc/{pid}/stat').read_text().rsplit(')', 1)[1].split()
+            rss += int(Path(f'/proc/{pid}/statm').read_text().split()[1]) * page_size
+        except OSError:
+            continue
+        if pid != self_pid:
+            # utime和stime是stat中的第14、15个字段，右括号之后从第3个字段开始
+            cpu += (int(fields[11]) + int(fields[12])) / ticks
+    return cpu, rss / 1024 / 1024
+
+
+def _create_jinja_renderer():
+    """只渲染HTML的后端，复用CardRenderer的模板环境和各卡片的数据预处理"""
+    from nonebot_plugin_delta_helper_modified.render import CardRenderer
+
+    class JinjaRenderer(CardRenderer):
+        async def render_card(self, template_name: str, data: dict[str, Any]) -> bytes:
+            return self.env.get_template(template_name).render(**data).encode()
+
+    return JinjaRenderer()
+
+
+async def _create_renderer(backend: str, mode: str):
+    if backend == 'jinja':
+        return _create_jinja_renderer()
+    from nonebot_plugin_delta_helper_modified.render import CardRenderer
+    renderer = CardRenderer()
+    await renderer.init()
+    if mode == 'scale1':
+        await renderer.context.close()
+        renderer.context = await renderer.browser.new_context(
+            viewport={'width': 500, 'height': 800},
+            device_scale_factor=1,
+            locale='zh-CN'
+        )
+    return renderer
+
+async def _close_renderer(renderer) -> None:
+    if renderer.browser:
+        await renderer.close()
+
+
+async def _bench_template(renderer, template: str, concurrency: int, iterations: int) -> dict[str, Any]:
+    render = FIXTURES[template]
+    durations: list[float] = []
+    sizes: list[int] = []
+    errors = 0
+    peak_rss = 0.0
+    running = True
+
+    async def sample_memory() -> None:
+        nonlocal peak_rss
+        while running:
+            _, rss = _tree_usage()
+            peak_rss = max(peak_rss, rss or 0.0)
+            await asyncio.sleep(0.05)
+
+    semaphore = asyncio.Semaphore(concurrency)
+    async def timed() -> None:
+        nonlocal errors
+        async with semaphore:
+            start = time.perf_counter()
+            try:
+                image = await render(renderer)
+            except Exception:
+                errors += 1
+                return
+            durations.append(time.perf_counter() - start)
+            sizes.append(len(image))
+
+    cpu_before, _ = _tree_usage()
+    sampler = asyncio.create_task(sample_memory())
+    start = time.perf_counter()
+    await asyncio.gather(*(timed() for _ in range(iterations)))
+    wall = time.perf_counter() - start
+    running = False
+    await sampler
+    cpu_after, _ = _tree_usage()
+
+    return {
+        'template': template,
+        'concurrency': concurrency,
+        'renders': len(durations),
+        'errors': errors,
+        'wall_s': round(wall, 3),
+        'renders_per_s': round(len(durations) / wall, 1) if wall else 0,
+        **_latency_summary(durations),
+        'avg_bytes': round(sum(sizes) / len(sizes)) if sizes else 0,
+        'browser_cpu_s': round(cpu_after - cpu_before, 3) if cpu_before is not None else None,
+        'peak_rss_mb': round(peak_rss, 1) if peak_rss else None,
+    }
+
+
+async def _run(args: argparse.Namespace, data_dir: Path) -> dict[str, Any]:
+    import nonebot
+    from nonebot.adapters.onebot.v11 import Adapter
+
+    nonebot.init(
+        driver='~none',
+        log_level=args.log_level,
+        sqlalchemy_database_url=f'sqlite+aiosqlite:///{data_dir / "bench.sqlite3"}',
+        alembic_startup_check=False,
+        localstore_data_dir=str(data_dir / 'data'),
+        localstore_cache_dir=str(data_dir / 'cache'),
+        localstore_config_dir=str(data_dir / 'config'),
+    )
+    nonebot.get_driver().register_adapter(Adapter)
+    nonebot.load_plugin('nonebot_plugin_delta_helper_modified')
+
+    templates = args.templates or list(FIXTURES)
+    results: list[dict[str, Any]] = []
+    skipped: list[dict[str, str]] = []
+    for backend in args.backends:
+        modes = args.modes if backend == 'playwright' else ['default']
+        for mode in modes:
+            try:
+                renderer = await _create_renderer(backend, mode)
+            except Exception as e:
+                print(f'跳过 {backend}/{mode}: {e}', flush=True)
+                skipped.append({'backend': backend, 'mode': mode, 'reason': str(e)})
+                continue
+            try:
+                # 预热：加载模板、字体和页面资源，不计入结果
+                for template in templates:
+                    await FIXTURES[template](renderer)
+                for concurrency in args.concurrency:
+                    for template in templates:
+                        result = await _bench_template(renderer, template, concurrency, args.iterations)
+                        results.append({'backend': backend, 'mode': mode, **result})
+                        print(
+                            f"{backend}/{mode} {template} 并发{concurrency}: {result['renders_per_s']}/s "
+                            f"p50 {result['p50_ms']}ms p99 {result['p99_ms']}ms {result['avg_bytes']}B",
+                            flush=True
+                        )
+            finally:
+                await _close_renderer(renderer)
+
+    # 按后端、模式和并发汇总，便于横向对比
+    summary = []
+    groups: dict[tuple[str, str, int], list[dict[str, Any]]] = {}
+    for result in results:
+        groups.setdefault((result['backend'], result['mode'], result['concurrency']), []).append(result)
+    for (backend, mode, concurrency), group in groups.items():
+        renders = sum(result['renders'] for result in group)
+        wall = sum(result['wall_s'] for result in group)
+        cpu = [result['browser_cpu_s'] for result in group if result['browser_cpu_s'] is not None]
+        summary.append({
+            'backend': backend,
+            'mode': mode,
+            'concurrency': concurrency,
+            'renders_per_s': round(renders / wall, 1) if wall else 0,
+            'avg_p50_ms': round(sum(result['p50_ms'] for result in group) / len(group), 2),
+            'max_p99_ms': max(result['p99_ms'] for result in group),
+            'browser_cpu_s_per_render': round(sum(cpu) / renders, 4) if cpu and renders else None,
+            'peak_rss_mb': max((result['peak_rss_mb'] or 0) for result in group) or None,
+        })
+
+    return {
+        'benchmark': 'render',
+        'timestamp': datetime.datetime.now().isoformat(timespec='seconds'),
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'args': vars(args),
+        'skipped': skipped,
+        'results': results,
+        'summary': summary,
+    }
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description='卡片渲染压测')
+    parser.add_argument('--backends', nargs='+', choices=BACKENDS, default=list(BACKENDS))
+    parser.add_argument('--modes', nargs='+', choices=PLAYWRIGHT_MODES, default=list(PLAYWRIGHT_MODES), help='playwright后端的模式')
+    parser.add_argument('--templates', nargs='+', choices=list(FIXTURES), help='只压测指定模板，默认全部')
+    parser.add_argument('--concurrency', nargs='+', type=int, default=[1, 4, 8, 16], help='并发级别')
+    parser.add_argument('--iterations', type=int, default=32, help='每个模板在每个并发级别下的渲染次数')
+    parser.add_argument('--log-level', default='CRITICAL')
+    parser.add_argument('--output', default='bench_render.json', help='结果JSON文件路径')
+    args = parser.parse_args()
+
+    data_dir = Path(tempfile.mkdtemp(prefix='delta_bench_'))
+    try:
+        result = asyncio.run(_run(args, data_dir))
+    finally:
+        shutil.rmtree(data_dir, ignore_errors=True)
+    Path(args.output).write_text(json.dumps(result, ensure_ascii=False, indent=2), encoding='utf-8')
+    print(json.dumps(result['summary'], ensure_ascii=False, indent=2))
+    print(f'结果已写入 {args.output}')
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,256 @@
+"""
+监控任务端到端压测
+在临时目录中启动插件（SQLite数据库 + 模拟上游），写入N个开启战绩播报和特勤处提醒的用户，
+按轮次驱动战绩监控和特勤处监控，每轮把模拟上游的时钟向前推进一个监控间隔以产生新的战绩，
+统计每秒完成的检查数、单次检查耗时分位数、每次检查的数据库语句数和上游请求数、
+打开的套接字数和内存占用，结果写入JSON文件，便于在部署前发现热路径的性能退化。
+
+播报消息不会真正发送，卡片渲染默认替换为空渲染器，只统计次数。
+
+用法（在仓库根目录下）：
+    python -m bench.bench_watchers --users 1000 --rounds 5 --output bench_watchers.json
+"""
+import argparse
+import asyncio
+import datetime
+import json
+import os
+import platform
+import resource
+import shutil
+import sys
+import tempfile
+import time
+from pathlib import Path
+from typing import Any
+
+from .fake_upstream import FakeUpstream
+
+
+def _percentile(values: list[float], q: float) -> float:
+    """最近秩法计算分位数"""
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    index = max(0, min(len(ordered) - 1, int(round(q / 100 * len(ordered) + 0.5)) - 1))
+    return ordered[index]
+
+def _latency_summary(durations: list[float]) -> dict[str, float]:
+    return {
+        'p50_ms': round(_percentile(durations, 50) * 1000, 2),
+        'p99_ms': round(_percentile(durations, 99) * 1000, 2),
+        'max_ms': round(max(durations, default=0) * 1000, 2),
+    }
+
+def _process_stats() -> dict[str, Any]:
+    """当前进程打开的文件数、套接字数和内存占用，非Linux系统上部分字段为None"""
+    open_fds = open_sockets = rss_mb = None
+    fd_dir = Path('/proc/self/fd')
+    if fd_dir.exists():
+        targets = []
+        for fd in fd_dir.iterdir():
+            try:
+                targets.append(os.readlink(fd))
+            except OSError:
+                continue
+        open_fds = len(targets)
+        open_sockets = sum(target.startswith('socket:') for target in targets)
+    statm = Path('/proc/self/statm')
+    if statm.exists():
+        rss_mb = round(int(statm.read_text().split()[1]) * os.sysconf('SC_PAGE_SIZE') / 1024 / 1024, 1)
+    peak_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # macOS上ru_maxrss的单位是字节，Linux上是KB
+    peak_rss_mb = round(peak_rss / 1024 / (1024 if sys.platform == 'darwin' else 1), 1)
+    return {'open_fds': open_fds, 'open_sockets': open_sockets, 'rss_mb': rss_mb, 'peak_rss_mb': peak_rss_mb}
+
+
+class _NullRenderer:
+    """不启动浏览器的渲染器，只统计渲染次数"""
+
+    def __init__(self):
+        self.calls = 0
+
+    def __getattr__(self, name: str):
+        if not name.startswith('render_'):
+            raise AttributeError(name)
+        async def render(*args, **kwargs) -> bytes:
+            self.calls += 1
+            return b'\x89PNG\r\n\x1a\n'
+        return render
+
+
+async def _run(args: argparse.Namespace, data_dir: Path) -> dict[str, Any]:
+    import nonebot
+    from nonebot.adapters.onebot.v11 import Adapter
+
+    nonebot.init(
+        driver='~none',
+        log_level=args.log_level,
+        sqlalchemy_database_url=f'sqlite+aiosqlite:///{data_dir / "bench.sqlite3"}',
+        alembic_startup_check=False,
+        localstore_data_dir=str(data_dir / 'data'),
+        localstore_cache_dir=str(data_dir / 'cache'),
+        localstore_config_dir=str(data_dir / 'config'),
+        delta_helper_request_rate_limit=20 if args.rate_limit else 0,
+        delta_helper_sqlite_optimize=not args.no_sqlite_optimize,
+    )
+    nonebot.get_driver().register_adapter(Adapter)
+    plugin = nonebot.load_plugin('nonebot_plugin_delta_helper_modified').module
+
+    from nonebot_plugin_orm import get_session, init_orm
+    from sqlalchemy import event
+    from nonebot_plugin_delta_helper_modified.deltaapi import set_upstream_transport
+    from nonebot_plugin_delta_helper_modified.model import UserData
+
+    # 上游时钟从rounds个间隔之前开始，最后一轮追上当前时间，只有最后几轮的战绩在播报时效内
+    clock_start = time.time() - args.rounds * args.interval
+    clock_offset = 0.0
+    upstream = FakeUpstream(
+        users=args.users, latency=args.latency, error_rate=args.error_rate,
+        timeout_rate=args.timeout_rate, expired_rate=args.expired_rate,
+        match_interval=args.match_interval, highlight_rate=args.highlight_rate,
+        clock=lambda: clock_start + clock_offset,
+    )
+    set_upstream_transport(upstream.transport())
+
+    broadcasts = 0
+    async def send_record_broadcast(result, group_id, user_name, record_id):
+        nonlocal broadcasts
+        broadcasts += 1
+    plugin.send_record_broadcast = send_record_broadcast
+    if not args.render:
+        renderer = _NullRenderer()
+        async def get_renderer():
+            return renderer
+        plugin.get_renderer = get_renderer
+
+    await init_orm()
+    if not args.no_sqlite_optimize:
+        await plugin.optimize_sqlite()
+
+    session = get_session()
+    engine = session.get_bind(UserData)
+    statements = 0
+    def count_statement(*_):
+        nonlocal statements
+        statements += 1
+    event.listen(engine, 'before_cursor_execute', count_statement)
+
+    qq_ids = [100000 + i for i in range(args.users)]
+    for i, qq_id in enumerate(qq_ids):
+        access_token, openid = upstream.credentials(i)
+        session.add(UserData(
+            qq_id=qq_id, group_id=1 + i % args.groups, access_token=access_token, openid=openid,
+            platform='qq', if_remind_safehouse=True, if_broadcast_record=True,
+        ))
+    await session.commit()
+    await session.close()
+
+    semaphore = asyncio.Semaphore(args.concurrency)
+    async def timed(watcher, qq_id: int, durations: list[float]) -> None:
+        async with semaphore:
+            start = time.perf_counter()
+            await watcher(qq_id)
+            durations.append(time.perf_counter() - start)
+
+    async def run_phase(name: str, watcher) -> dict[str, Any]:
+        durations: list[float] = []
+        statements_before = statements
+        requests_before = sum(upstream.stats.values())
+        broadcasts_before = broadcasts
+        start = time.perf_counter()
+        await asyncio.gather(*(timed(watcher, qq_id, durations) for qq_id in qq_ids))
+        wall = time.perf_counter() - start
+        ticks = len(durations)
+        return {
+            'phase': name,
+            'ticks': ticks,
+            'wall_s': round(wall, 3),
+            'polls_per_s': round(ticks / wall, 1) if wall else 0,
+            **_latency_summary(durations),
+            'db_statements_per_tick': round((statements - statements_before) / ticks, 2),
+            'upstream_requests_per_tick': round((sum(upstream.stats.values()) - requests_before) / ticks, 2),
+            'broadcasts': broadcasts - broadcasts_before,
+        }
+
+    rounds = []
+    for round_index in range(args.rounds):
+        clock_offset = (round_index + 1) * args.interval
+        phases = [await run_phase('record', plugin.watch_all_record)]
+        if not args.no_safehouse:
+            phases.append(await run_phase('safehouse', plugin.watch_safehouse))
+        rounds.append({'round': round_index + 1, 'phases': phases, **_process_stats()})
+        summary = ', '.join(f"{phase['phase']} {phase['polls_per_s']}/s p99 {phase['p99_ms']}ms" for phase in phases)
+        print(f'第{round_index + 1}轮: {summary}', flush=True)
+
+    total = {}
+    for name in ('record', 'safehouse'):
+        phases = [phase for round_result in rounds for phase in round_result['phases'] if phase['phase'] == name]
+        if not phases:
+            continue
+        ticks = sum(phase['ticks'] for phase in phases)
+        wall = sum(phase['wall_s'] for phase in phases)
+        total[name] = {
+            'ticks': ticks,
+            'polls_per_s': round(ticks / wall, 1) if wall else 0,
+            # 首轮需要初始化检查点和角色名，单独列出稳定后的延迟
+            'steady_p50_ms': round(sum(phase['p50_ms'] for phase in phases[1:]) / max(len(phases) - 1, 1), 2),
+            'steady_p99_ms': round(sum(phase['p99_ms'] for phase in phases[1:]) / max(len(phases) - 1, 1), 2),
+            'db_statements_per_tick': round(sum(phase['db_statements_per_tick'] * phase['ticks'] for phase in phases) / ticks, 2),
+            'upstream_requests_per_tick': round(sum(phase['upstream_requests_per_tick'] * phase['ticks'] for phase in phases) / ticks, 2),
+            'broadcasts': sum(phase['broadcasts'] for phase in phases),
+        }
+
+    await _dispose_engine(engine)
+    return {
+        'benchmark': 'watchers',
+        'timestamp': datetime.datetime.now().isoformat(timespec='seconds'),
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'args': vars(args),
+        'upstream_requests': dict(upstream.stats),
+        'upstream_errors': dict(upstream.errors),
+        'rounds': rounds,
+        'summary': {**total, **_process_stats()},
+    }
+
+async def _dispose_engine(engine) -> None:
+    from sqlalchemy.ext.asyncio import AsyncEngine
+    await AsyncEngine(engine).dispose()
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description='监控任务端到端压测')
+    parser.add_argument('--users', type=int, default=1000, help='模拟用户数')
+    parser.add_argument('--rounds', type=int, default=5, help='监控轮数')
+    parser.add_argument('--interval', type=float, default=120, help='每轮推进的上游时间（秒），与插件的监控间隔一致')
+    parser.add_argument('--match-interval', type=float, default=600, help='模拟玩家两局之间的间隔（秒）')
+    parser.add_argument('--highlight-rate', type=float, default=0.05, help='需要播报的战绩比例')
+    parser.add_argument('--latency', type=float, default=0.02, help='模拟上游的平均延迟（秒）')
+    parser.add_argument('--error-rate', type=float, default=0.0)
+    parser.add_argument('--timeout-rate', type=float, default=0.0)
+    parser.add_argument('--expired-rate', type=float, default=0.0)
+    parser.add_argument('--groups', type=int, default=50, help='用户分布的群数')
+    parser.add_argument('--concurrency', type=int, default=64, help='同时执行的检查数')
+    parser.add_argument('--rate-limit', action='store_true', help='保留插件的上游限流')
+    parser.add_argument('--render', action='store_true', help='使用真实的浏览器渲染播报卡片')
+    parser.add_argument('--no-safehouse', action='store_true', help='不压测特勤处监控')
+    parser.add_argument('--no-sqlite-optimize', action='store_true', help='不应用SQLite连接参数')
+    parser.add_argument('--log-level', default='CRITICAL')
+    parser.add_argument('--keep', action='store_true', help='保留临时数据库目录')
+    parser.add_argument('--output', default='bench_watchers.json', help='结果JSON文件路径')
+    args = parser.parse_args()
+
+    data_dir = Path(tempfile.mkdtemp(prefix='delta_bench_'))
+    try:
+        result = asyncio.run(_run(args, data_dir))
+    finally:
+        if args.keep:
+            print(f'临时数据目录: {data_dir}')
+        else:
+            shutil.rmtree(data_dir, ignore_errors=True)
+    Path(args.output).write_text(json.dumps(result, ensure_ascii=False, indent=2), encoding='utf-8')
+    print(json.dumps(result['summary'], ensure_ascii=False, indent=2))
+    print(f'结果已写入 {args.output}')
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,389 @@
+"""
+离线上游模拟
+用httpx.MockTransport模拟腾讯官方的游戏数据接口（ide/）和角色信息接口，
+按openid确定性地生成玩家数据，战绩随时间不断产生，特勤处设备按周期生产，
+可以配置响应延迟、错误率、超时率和凭证失效用户比例，用于在本地压测DeltaApi和监控任务。
+
+用法：
+    from bench.fake_upstream import FakeUpstream
+    from nonebot_plugin_delta_helper_modified.deltaapi import set_upstream_transport
+
+    upstream = FakeUpstream(users=10000, latency=0.05, error_rate=0.01)
+    set_upstream_transport(upstream.transport())
+    # 模拟用户的登录凭证为 upstream.credentials(i) -> (access_token, openid)
+
+直接运行时对所有模拟用户各请求一轮战绩和特勤处状态并输出吞吐：
+    python -m bench.fake_upstream --users 10000 --latency 0.05
+"""
+import argparse
+import asyncio
+import datetime
+import json
+import random
+import time
+import urllib.parse
+from collections import Counter
+from typing import Any, Callable
+
+import httpx
+
+SOL_MAP_IDS = ['2231', '2232', '2201', '2202', '1901', '1902', '3901', '3902', '8102', '8103', '8803']
+TDM_MAP_IDS = ['34', '33', '54', '75', '103', '107', '108', '111', '112', '113']
+ARMED_FORCE_IDS = [30009, 10010, 10011, 30010, 30008, 10012, 10007, 20004, 20003, 40005, 40010]
+SAFEHOUSE_PLACES = [('1', '技术中心'), ('2', '工作台'), ('3', '制药台'), ('4', '防具台')]
+SAFEHOUSE_OBJECTS = {15080050001: '非洲之心', 15090010002: '军用无人机', 14060000002: '高级头盔', 13080000005: '急救箱'}
+
+
+def _format_time(timestamp: float) -> str:
+    return datetime.datetime.fromtimestamp(timestamp).strftime('%Y-%m-%d %H:%M:%S')
+
+def _json(data: dict, status_code: int = 200) -> httpx.Response:
+    return httpx.Response(status_code, content=json.dumps(data, ensure_ascii=False).encode(), headers={'Content-Type': 'application/json'})
+
+def _ok(jdata: Any) -> httpx.Response:
+    return _json({'ret': 0, 'iRet': 0, 'sMsg': 'ok', 'jData': jdata})
+
+
+class FakePlayer:
+    """模拟玩家，所有数据由openid和时间确定性地生成"""
+
+    def __init__(self, index: int, match_interval: float, expired: bool):
+        self.index = index
+        self.openid = f'fake_openid_{index}'
+        self.access_token = f'fake_token_{index}'
+        self.name = f'模拟玩家{index}'
+        self.match_interval = match_interval
+        self.expired = expired
+        seed = random.Random(self.openid)
+        # 各玩家的对局时间错开
+        self.phase = seed.uniform(0, match_interval)
+        self.safehouse_cycle = seed.randint(1800, 7200)
+
+    def _random(self, *key: Any) -> random.Random:
+        return random.Random(f'{self.openid}:{":".join(map(str, key))}')
+
+    def _latest_index(self, now: float) -> int:
+        return int((now - self.phase) // self.match_interval)
+
+    def sol_record(self, k: int, million_rate: float) -> dict:
+        rng = self._random('sol', k)
+        escaped = rng.random() < 0.6
+        if rng.random() < million_rate:
+            gained = rng.randint(1_000_001, 5_000_000) if escaped else 0
+            final_price = gained + rng.randint(0, 300_000) if escaped else rng.randint(1_100_000, 3_000_000)
+        else:
+            gained = rng.randint(0, 600_000) if escaped else 0
+            final_price = gained + rng.randint(0, 400_000)
+        return {
+            'dtEventTime': _format_time(self.phase + k * self.match_interval),
+            'MapId': rng.choice(SOL_MAP_IDS),
+            'EscapeFailReason': 1 if escaped else 2,
+            'DurationS': rng.randint(120, 1800),
+            'KillCount': rng.randint(0, 8),
+            'FinalPrice': str(final_price),
+            'flowCalGainedPrice': gained,
+            'ArmedForceId': rng.choice(ARMED_FORCE_IDS),
+            'RoomId': f'sol_{self.index}_{k}',
+        }
+
+    def tdm_record(self, k: int, highlight_rate: float) -> dict:
+        rng = self._random('tdm', k)
+        game_time = rng.randint(600, 1800)
+        kill_num = rng.randint(100, 160) if rng.random() < highlight_rate else rng.randint(5, 60)
+        return {
+            'dtEventTime': _format_time(self.phase + k * self.match_interval - game_time),
+            'MapID': rng.choice(TDM_MAP_IDS),
+            'MatchResult': rng.choice([1, 1, 2, 3]),
+            'KillNum': kill_num,
+            'Death': rng.randint(5, 40),
+            'Assist': rng.randint(0, 30),
+            'TotalScore': rng.randint(3000, 30000),
+            'gametime': game_time,
+            'GameTime': game_time,
+            'ArmedForceId': rng.choice(ARMED_FORCE_IDS),
+            'RoomId': f'tdm_{self.index}_{k}',
+        }
+
+    def records(self, type_id: int, page: int, page_size: int, now: float, highlight_rate: float) -> list[dict]:
+        """获取一页战绩，按时间倒序"""
+        latest = self._latest_index(now)
+        start = latest - (page - 1) * page_size
+        indexes = [k for k in range(start, start - page_size, -1) if k >= 0]
+        if type_id == 4:
+            return [self.sol_record(k, highlight_rate) for k in indexes]
+        return [self.tdm_record(k, highlight_rate) for k in indexes]
+
+    def tdm_detail(self, room_id: str) -> dict:
+        rng = self._random('detail', room_id)
+        players = []
+        for i in range(32):
+            players.append({
+                'isCurrentUser': i == 0,
+                'openid': self.openid if i == 0 else f'fake_teammate_{rng.randint(0, 10**9)}',
+                'rescueTeammateCount': rng.randint(0, 12),
+                'killNum': rng.randint(0, 60),
+                'death': rng.randint(0, 40),
+                'assist': rng.randint(0, 30),
+                'totalScore': rng.randint(1000, 30000),
+                'armedForceId': rng.choice(ARMED_FORCE_IDS),
+            })
+        return {'mpDetailList': players}
+
+    def safehouse(self, now: float) -> dict:
+        """各设备按周期循环生产，每个周期的后四分之一闲置"""
+        place_data = []
+        relate_map = {}
+        for offset, (place_id, place_name) in enumerate(SAFEHOUSE_PLACES):
+            cycle_start = now - (now + offset * self.safehouse_cycle / 4 + self.phase) % self.safehouse_cycle
+            producing_until = cycle_start + self.safehouse_cycle * 3 / 4
+            rng = self._random('safehouse', place_id, int(cycle_start))
+            if producing_until > now:
+                object_id = rng.choice(list(SAFEHOUSE_OBJECTS))
+                relate_map[str(object_id)] = {'objectName': SAFEHOUSE_OBJECTS[object_id]}
+                place_data.append({
+                    'Id': place_id, 'placeName': place_name, 'objectId': object_id,
+                    'leftTime': int(producing_until - now), 'pushTime': int(producing_until),
+                })
+            else:
+                place_data.append({'Id': place_id, 'placeName': place_name, 'objectId': 0, 'leftTime': 0, 'pushTime': 0})
+        return {'placeData': place_data, 'relateMap': relate_map}
+
+    def player_info(self) -> dict:
+        rng = self._random('info')
+        return {
+            'userData': {'charac_name': urllib.parse.quote(self.name)},
+            'careerData': {
+                'rankpoint': rng.randint(1000, 7000), 'soltotalfght': rng.randint(100, 3000),
+                'solttotalescape': rng.randint(50, 1500), 'soltotalkill': rng.randint(100, 8000),
+                'solescaperatio': f'{rng.randint(20, 80)}%', 'tdmrankpoint': rng.randint(1000, 7000),
+                'avgkillperminute': rng.randint(50, 300), 'tdmtotalfight': rng.randint(100, 3000),
+                'totalwin': rng.randint(50, 1500), 'tdmduration': rng.randint(1000, 90000),
+                'tdmsuccessratio': f'{rng.randint(20, 80)}%',
+            },
+        }
+
+    def person_resource(self) -> dict:
+        rng = self._random('resource')
+        return {
+            'solDetail': {
+                'profitLossRatio': rng.randint(10000, 500000), 'highKillDeathRatio': rng.randint(50, 400),
+                'medKillDeathRatio': rng.randint(50, 400), 'lowKillDeathRatio': rng.randint(50, 400),
+                'totalGainedPrice': rng.randint(10**7, 10**10), 'totalGameTime': rng.randint(10**5, 10**7),
+                'recentGainDate': _format_time(time.time() - 86400)[:10], 'recentGain': rng.randint(-10**6, 10**7),
+                'userCollectionTop': {'list': [{'objectID': object_id} for object_id in list(SAFEHOUSE_OBJECTS)[:2]]},
+            },
+            'mpDetail': {
+                'avgScorePerMinute': rng.randint(10000, 200000), 'totalVehicleDestroyed': rng.randint(0, 3000),
+                'totalVehicleKill': rng.randint(0, 3000),
+            },
+        }
+
+    def weekly_report(self) -> dict:
+        rng = self._random('weekly')
+        armed_forces = '#'.join(f"{{'ArmedForceId':{force_id},'inum':{rng.randint(1, 40)}}}" for force_id in rng.sample(ARMED_FORCE_IDS, 5))
+        maps = '#'.join(f"{{'MapId':{map_id},'inum':{rng.randint(1, 40)}}}" for map_id in rng.sample(SOL_MAP_IDS, 5))
+        prices = ','.join(f'day-{i}-{rng.randint(10**7, 10**9)}' for i in range(7))
+        return {
+            'total_ArmedForceId_num': armed_forces, 'total_mapid_num': maps, 'Total_Price': prices,
+            'Gained_Price': rng.randint(10**6, 10**9), 'consume_Price': rng.randint(10**6, 10**9),
+            'rise_Price': rng.randint(-10**8, 10**8), 'total_sol_num': rng.randint(10, 200),
+            'total_exacuation_num': rng.randint(5, 100), 'GainedPrice_overmillion_num': rng.randint(0, 20),
+            'total_Kill_Player': rng.randint(10, 800), 'total_Death_Count': rng.randint(5, 100),
+            'total_Online_Time': rng.randint(3600, 360000),
+        }
+
+    def weekly_friend_report(self) -> dict:
+        rng = self._random('friend')
+        friends = []
+        for i in range(rng.randint(0, 6)):
+            friends.append({
+                'friend_openid': f'fake_openid_{rng.randint(0, 10**6)}',
+                'Friend_is_Escape1_num': rng.randint(0, 40), 'Friend_is_Escape2_num': rng.randint(0, 40),
+                'Friend_Escape1_consume_Price': rng.randint(0, 10**8), 'Friend_Escape2_consume_Price': rng.randint(0, 10**8),
+                'Friend_Sum_Escape1_Gained_Price': rng.randint(0, 10**8), 'Friend_Sum_Escape2_Gained_Price': rng.randint(0, 10**8),
+                'Friend_total_sol_KillPlayer': rng.randint(0, 200), 'Friend_total_sol_DeathCount': rng.randint(0, 60),
+                'Friend_total_sol_num': rng.randint(1, 80),
+            })
+        return {'friends_sol_record': friends}
+
+
+class FakeUpstream:
+    """模拟的官方接口"""
+
+    def __init__(
+        self,
+        users: int = 1000,
+        latency: float = 0.05,
+        jitter: float = 0.5,
+        error_rate: float = 0.0,
+        timeout_rate: float = 0.0,
+        expired_rate: float = 0.0,
+        match_interval: float = 1800,
+        highlight_rate: float = 0.02,
+        page_size: int = 10,
+        seed: int = 0,
+        clock: Callable[[], float] = time.time,
+    ):
+        """
+        Args:
+            users: 模拟玩家数
+            latency: 平均响应延迟（秒）
+            jitter: 延迟的随机浮动比例
+            error_rate: 返回HTTP 503的请求比例
+            timeout_rate: 抛出读取超时的请求比例
+            expired_rate: 登录凭证已失效的玩家比例
+            match_interval: 每个玩家两局之间的平均间隔（秒）
+            highlight_rate: 百万撤离/战损和战场百杀等需要播报的战绩比例
+            page_size: 战绩接口每页条数
+            seed: 延迟和错误注入的随机种子
+            clock: 模拟上游使用的时钟，压测时可以传入虚拟时钟快进战绩和特勤处的生产
+        """
+        self.clock = clock
+        self.latency = latency
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self.timeout_rate = timeout_rate
+        self.highlight_rate = highlight_rate
+        self.page_size = page_size
+        self._rng = random.Random(seed)
+        expired_rng = random.Random(f'expired:{seed}')
+        self.players = [FakePlayer(i, match_interval, expired_rng.random() < expired_rate) for i in range(users)]
+        self._by_openid = {player.openid: player for player in self.players}
+        # 按接口统计的请求数，接口名为method或iChartId
+        self.stats: Counter[str] = Counter()
+        self.errors: Counter[str] = Counter()
+
+    def credentials(self, index: int) -> tuple[str, str]:
+        """获取模拟玩家的(access_token, openid)"""
+        player = self.players[index]
+        return player.access_token, player.openid
+
+    def transport(self) -> httpx.MockTransport:
+        return httpx.MockTransport(self.handle)
+
+    async def handle(self, request: httpx.Request) -> httpx.Response:
+        fields = dict(request.url.params)
+        if request.content and request.headers.get('Content-Type', '').startswith('application/x-www-form-urlencoded'):
+            fields.update(urllib.parse.parse_qsl(request.content.decode()))
+        endpoint = fields.get('method') or fields.get('iChartId') or request.url.host
+        self.stats[endpoint] += 1
+
+        if self.latency > 0:
+            await asyncio.sleep(self.latency * self._rng.uniform(1 - self.jitter, 1 + self.jitter))
+        roll = self._rng.random()
+        if roll < self.timeout_rate:
+            self.errors['timeout'] += 1
+            raise httpx.ReadTimeout('模拟上游超时', request=request)
+        if roll < self.timeout_rate + self.error_rate:
+            self.errors['503'] += 1
+            return httpx.Response(503, request=request)
+
+        if request.url.host == 'comm.aci.game.qq.com':
+            return httpx.Response(200, text=f"_cb({{retCode:0,propcapital={random.Random(fields.get('sAMSAppOpenId')).randint(10**7, 10**10)}}})")
+
+        player = self._by_openid.get(self._cookie(request, 'openid'))
+        if player is None or player.expired:
+            self.errors['expired'] += 1
+            return _json({'ret': 101, 'iRet': 101, 'sMsg': '非常抱歉，请先登录！', 'jData': []})
+        return self._route(player, fields)
+
+    @staticmethod
+    def _cookie(request: httpx.Request, name: str) -> str:
+        for part in request.headers.get('Cookie', '').split(';'):
+            key, _, value = part.strip().partition('=')
+            if key == name:
+                return value
+        return ''
+
+    def _route(self, player: FakePlayer, fields: dict[str, str]) -> httpx.Response:
+        chart_id = fields.get('iChartId', '')
+        method = fields.get('method', '')
+        param = json.loads(fields['param']) if fields.get('param') else {}
+        now = self.clock()
+
+        if chart_id == '319386':
+            type_id = int(fields.get('type', 4))
+            if type_id == 3:
+                return _ok({'data': [{'totalMoney': str(random.Random(f"{player.openid}:{fields.get('item')}").randint(10**6, 10**9))}]})
+            records = player.records(type_id, int(fields.get('page', 1)), self.page_size, now, self.highlight_rate)
+            return _ok({'data': records})
+        if chart_id == '317814':
+            return _ok(player.player_info())
+        if chart_id == '365589':
+            return _ok({'data': {'data': player.safehouse(now)}})
+        if chart_id in ('316964', '316965'):
+            return _ok({'bindarea': {'area': 36, 'platid': 1, 'partition': 36, 'roleid': player.openid}})
+        if chart_id == '369172':
+            return _ok({'data': {'charac_name': urllib.parse.quote(player.name)}})
+        if method == 'dfm/center.day.secret':
+            return _ok({'data': {'data': {'list': [{'mapName': map_name, 'secret': f'{i}{i}{i}{i}'} for i, map_name in enumerate(['零号大坝', '长弓溪谷', '巴克什', '航天基地', '潮汐监狱'])]}}})
+        if method == 'dfm/center.recent.detail':
+            return _ok({'data': {'data': {'solDetail': player.person_resource()['solDetail']}}})
+        if method == 'dfm/object.list':
+            object_id = int(param.get('objectID', 0))
+            return _ok({'data': {'data': {'list': [{'objectID': object_id, 'objectName': SAFEHOUSE_OBJECTS.get(object_id, f'物品{object_id}')}]}}})
+        if method == 'dfm/center.person.resource':
+            return _ok({'data': {'data': player.person_resource()}})
+        if method == 'dfm/center.game.detail':
+            return _ok({'data': {'data': player.tdm_detail(param.get('roomID', ''))}})
+        if method == 'dfm/weekly.sol.record':
+            return _ok({'data': {'data': player.weekly_report()}})
+        if method == 'dfm/weekly.sol.friend.record':
+            return _ok({'data': {'data': player.weekly_friend_report()}})
+        self.errors['unknown'] += 1
+        return _json({'ret': -1, 'iRet': -1, 'sMsg': f'未模拟的接口: {chart_id} {method}', 'jData': []})
+
+
+async def _run_once(args: argparse.Namespace) -> None:
+    import nonebot
+    nonebot.init(log_level=args.log_level)
+    from nonebot_plugin_delta_helper_modified import deltaapi as deltaapi_module
+
+    upstream = FakeUpstream(
+        users=args.users, latency=args.latency, error_rate=args.error_rate,
+        timeout_rate=args.timeout_rate, expired_rate=args.expired_rate,
+    )
+    deltaapi_module.set_upstream_transport(upstream.transport())
+    if not args.rate_limit:
+        deltaapi_module.upstream_limiter = None
+
+    semaphore = asyncio.Semaphore(args.concurrency)
+    failures = Counter()
+    async def poll(index: int) -> None:
+        access_token, openid = upstream.credentials(index)
+        async with semaphore:
+            api = deltaapi_module.DeltaApi('qq', background=True)
+            try:
+                for res in await asyncio.gather(
+                    api.get_record(access_token, openid, 4),
+                    api.get_record(access_token, openid, 5),
+                    api.get_safehousedevice_status(access_token, openid),
+                ):
+                    if not res['status']:
+                        failures[res['message']] += 1
+            finally:
+                await api.close()
+
+    start = time.perf_counter()
+    await asyncio.gather(*(poll(i) for i in range(args.users)))
+    elapsed = time.perf_counter() - start
+    total = sum(upstream.stats.values())
+    print(f'{args.users}个用户，{total}次请求，耗时{elapsed:.2f}秒，{total / elapsed:.0f}次/秒')
+    print(f'接口请求数: {dict(upstream.stats)}')
+    print(f'注入的错误: {dict(upstream.errors)}')
+    print(f'失败的调用: {dict(failures)}')
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description='用模拟上游对所有用户请求一轮战绩和特勤处状态')
+    parser.add_argument('--users', type=int, default=1000)
+    parser.add_argument('--latency', type=float, default=0.05)
+    parser.add_argument('--error-rate', type=float, default=0.0)
+    parser.add_argument('--timeout-rate', type=float, default=0.0)
+    parser.add_argument('--expired-rate', type=float, default=0.0)
+    parser.add_argument('--concurrency', type=int, default=200)
+    parser.add_argument('--rate-limit', action='store_true', help='保留插件的上游限流')
+    parser.add_argument('--log-level', default='CRITICAL', help='插件日志级别，默认只输出严重错误')
+    asyncio.run(_run_once(parser.parse_args()))
+
+if __name__ == '__main__':
+    main()
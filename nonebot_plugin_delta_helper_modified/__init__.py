@@ -1,7 +1,9 @@
 import asyncio
 import base64
 import json
-from typing import Union, Literal
+import os
+import socket
+from typing import Union
 import urllib.parse
 import httpx
 from openai import AsyncOpenAI
@@ -13,25 +15,41 @@ from nonebot.adapters.onebot.v11 import Message
 from nonebot.adapters.onebot.v11.event import MessageEvent, GroupMessageEvent
 from nonebot.exception import FinishedException
 from nonebot.params import CommandArg
+from nonebot.drivers import ASGIMixin, HTTPServerSetup, Request, Response, URL
 import datetime
+import time
+from collections import OrderedDict
 
 require("nonebot_plugin_saa")
 require("nonebot_plugin_orm")
 require("nonebot_plugin_apscheduler")
 require("nonebot_plugin_limiter")
+require("nonebot_plugin_localstore")
 
 from .config import Config
-from .deltaapi import DeltaApi
-from .db import UserDataDatabase
-from .model import UserData, SafehouseRecord, LatestRecord
+from .deltaapi import DeltaApi, upstream_available
+from .db import UserDataDatabase, SQLITE_PRAGMAS, apply_sqlite_profile
+from .model import UserData, SafehouseRecord, LatestRecord, TokenQuarantine
 from .util import Util
 from .render import get_renderer, close_renderer
+from .report import WeeklyReportEngine, parse_weekly_report
+from .records import Record, SolRecord, TdmRecord
+from .leaderboard import group_leaderboard, LEADERBOARD_METRICS, LEADERBOARD_ALIASES
+from .timer import DeadlineQueue
+from .cluster import ShardCoordinator, LeaderElector
+from .trace import trace_command, span, flush_traces, TRACE_FLUSH_INTERVAL
+from .profiler import run_profile, is_profiling
+from .loopmonitor import LoopLagMonitor
+from .offload import run_cpu, cpu_policy
+from .jsonlib import JSON_BACKEND
+from .metrics import registry, CONTENT_TYPE, instrument_engine, watcher_tick_latency, watcher_backlog, cache_requests, broadcasts_sent
 from . import migrations
 
 from nonebot_plugin_saa import Image, Text, TargetQQGroup, Mention, AggregatedMessageFactory, enable_auto_select_bot
 from nonebot_plugin_orm import async_scoped_session, get_session
 from nonebot_plugin_apscheduler import scheduler
 from nonebot_plugin_limiter import UserScope, Cooldown, GlobalScope, Increaser
+from nonebot_plugin_localstore import get_plugin_data_dir
 
 
 driver = get_driver()
@@ -62,12 +80,71 @@ __plugin_meta__ = PluginMetadata(
 config = get_plugin_config(Config)
 interval = 120
 BROADCAST_EXPIRED_MINUTES = 7
-SAFEHOUSE_CHECK_INTERVAL = 600  # 特勤处检查间隔（秒）
+RECORD_MAX_PAGES = 3  # 每次监控最多向前翻的战绩页数
+SAFEHOUSE_CHECK_INTERVAL = 600  # 特勤处有闲置设备时的检查间隔（秒）
+SAFEHOUSE_GUARD_INTERVAL = 10800  # 特勤处设备都在生产时的最长检查间隔（秒），用于发现在app中取消或加速的生产
+SAFEHOUSE_FINISH_DELAY = 10  # 设备完成后延迟检查的时间（秒）
+SAFEHOUSE_POLL_CONCURRENCY = 8  # 同时检查特勤处状态的用户数
+SAFEHOUSE_OUTAGE_RETRY_INTERVAL = 60  # 上游熔断期间推迟检查的时间（秒）
+SHARD_HEARTBEAT_INTERVAL = 30  # 分片监控实例心跳间隔（秒）
+SHARD_LEASE_TTL = 90  # 分片监控实例租约有效期（秒）
+SHARD_RESCAN_INTERVAL = 300  # 分片监控或主实例重新扫描监控名单的间隔（秒），用于接管在其他实例登录的用户
+LEADER_LEASE_TTL = 30  # 主实例租约有效期（秒），主实例失联后其他实例最迟在该时间加一次续期间隔后接管
+LEADER_RENEW_INTERVAL = 10  # 主实例租约续期间隔（秒）
+LEADERBOARD_REFRESH_INTERVAL = 1800  # 群排行榜从数据库重建间隔（秒）
+TOKEN_QUARANTINE_BASE_DELAY = 600  # 登录凭证失效后首次重新检查的间隔（秒），之后每次翻倍
+TOKEN_QUARANTINE_MAX_RETRIES = 5  # 登录凭证失效后最多重新检查的次数，超过后停止监控直到重新登录
+METRICS_DUMP_INTERVAL = 60  # 运行指标写入文件的间隔（秒）
+PROFILE_DEFAULT_SECONDS = 30  # 性能分析默认采样时长（秒）
+PROFILE_MAX_SECONDS = 300  # 性能分析最长采样时长（秒）
+
+# 监控用户的角色名缓存 qq_id -> 角色名
+user_name_cache: dict[int, str] = {}
+# 对局救援数缓存 (openid, RoomId) -> 救援数，对局结束后详情不再变化
+RESCUE_COUNT_CACHE_SIZE = 4096
+rescue_count_cache: OrderedDict[tuple[str, str], int] = OrderedDict()
+# 本实例监控的用户中登录凭证失效的用户 qq_id -> 下一次检查时间戳，0表示已停止监控
+quarantined_users: dict[int, int] = {}
+
 ai_api_key = config.delta_helper_ai_api_key
 ai_base_url = config.delta_helper_ai_base_url
 ai_model = config.delta_helper_ai_model
 ai_proxy = config.delta_helper_ai_proxy
 enable_broadcast_record = config.delta_helper_enable_broadcast_record
+enable_sqlite_optimize = config.delta_helper_sqlite_optimize
+enable_shard = config.delta_helper_shard_enable
+enable_leader = config.delta_helper_leader_enable
+instance_id = config.delta_helper_instance_id or f"{socket.gethostname()}-{os.getpid()}"
+metrics_path = config.delta_helper_metrics_path
+metrics_file = config.delta_helper_metrics_file
+slow_callback_threshold = config.delta_helper_slow_callback_threshold
+
+# 分片监控协调器，未开启分片时为None
+shard_coordinator = ShardCoordinator(instance_id, SHARD_LEASE_TTL) if enable_shard else None
+# 主实例选举，未开启时为None
+leader_elector = LeaderElector('global', instance_id, LEADER_LEASE_TTL) if enable_leader else None
+# 事件循环延迟监控，阈值为0时为None
+loop_lag_monitor = LoopLagMonitor(slow_callback_threshold) if slow_callback_threshold > 0 else None
+
+def is_leader() -> bool:
+    """判断本实例是否负责执行全局任务"""
+    return leader_elector is None or leader_elector.is_leader
+
+async def verify_watch_owner(user_data_database: UserDataDatabase) -> bool:
+    """
+    未分片的主实例模式下，播报和写入数据库前按数据库中的租约令牌确认本实例仍是主实例，
+    避免失去租约但本地还未察觉的旧主实例与新主实例重复播报
+    """
+    if shard_coordinator is not None or leader_elector is None:
+        return True
+    return await leader_elector.verify(user_data_database)
+
+def is_watch_owner(qq_id: int) -> bool:
+    """判断用户的监控任务是否由本实例负责"""
+    if shard_coordinator is not None:
+        return shard_coordinator.owns(qq_id)
+    # 未分片时所有用户都由主实例监控
+    return is_leader()
 
 bind_delta_help = on_command("三角洲帮助")
 bind_delta_login = on_command("三角洲登录", aliases={"三角洲登陆"})
@@ -80,8 +157,12 @@ bind_delta_weekly_report = on_command("三角洲周报")
 bind_delta_ai_comment = on_command("三角洲AI锐评", aliases={"三角洲ai锐评"})
 bind_delta_get_record = on_command("三角洲战绩")
 bind_delta_broadcast_record_open_close = on_command("三角洲战绩播报")
+bind_delta_leaderboard = on_command("三角洲排行榜", aliases={"三角洲排行"})
+bind_delta_token_report = on_command("三角洲失效账号", permission=SUPERUSER)
+bind_delta_profile = on_command("三角洲性能分析", permission=SUPERUSER)
 
 @bind_delta_help.handle()
+@trace_command("三角洲帮助")
 async def _(event: MessageEvent, session: async_scoped_session):
     try:
         renderer = await get_renderer()
@@ -103,64 +184,66 @@ async def _(event: MessageEvent, session: async_scoped_session):
 7. 三角洲周报：查看三角洲周报
 8. 三角洲AI锐评：ai锐评玩家数据
 9. 三角洲战绩 [模式] [页码] L[战绩条数上限]：查看三角洲战绩，模式可选：烽火/战场，默认烽火，页码可选任意正整数，不指定页码则显示第一页，单页战绩条数上限可选任意正整数，不指定默认20
-10. 三角洲战绩播报 [操作]：用户开启或关闭自己的战绩播报功能，操作可选：开启/关闭""")
-
-
-def generate_record_id(record_data: dict) -> str:
-    """生成战绩唯一标识"""
-    # 使用时间戳作为唯一标识
-    event_time = record_data.get('dtEventTime', '')
-    return event_time
-
-async def format_record_message(record_data: dict, user_name: str) -> bytes|str|None:
+10. 三角洲战绩播报 [操作]：用户开启或关闭自己的战绩播报功能，操作可选：开启/关闭
+11. 三角洲排行榜 [榜单]：查看本群本周排行榜，榜单可选：收益/击杀/百万撤离/分均，默认收益""")
+
+
+async def get_rescue_teammate_count(deltaapi: DeltaApi, access_token: str, openid: str, room_id: str) -> int:
+    """获取玩家在对局中的救援数，获取失败返回0"""
+    key = (openid, room_id)
+    if key in rescue_count_cache:
+        cache_requests.inc(cache='rescue_count', result='hit')
+        rescue_count_cache.move_to_end(key)
+        return rescue_count_cache[key]
+    cache_requests.inc(cache='rescue_count', result='miss')
+
+    res = await deltaapi.get_tdm_detail(access_token, openid, room_id)
+    if not res['status'] or not res['data']:
+        logger.error(f"获取战绩详情失败: {res['message']}")
+        return 0
+    rescue_count = 0
+    for mpDetail in res['data'].get('mpDetailList', []):
+        if mpDetail.get('isCurrentUser', False):
+            rescue_count = mpDetail.get('rescueTeammateCount', 0)
+            break
+    rescue_count_cache[key] = rescue_count
+    if len(rescue_count_cache) > RESCUE_COUNT_CACHE_SIZE:
+        rescue_count_cache.popitem(last=False)
+    return rescue_count
+
+async def format_record_message(record: SolRecord, user_name: str) -> bytes|str|None:
     """格式化战绩播报消息"""
     try:
-        # 解析时间
-        event_time = record_data.get('dtEventTime', '')
-        # 解析地图ID
-        map_id = record_data.get('MapId', '')
-        # 解析结果
-        escape_fail_reason = record_data.get('EscapeFailReason', 0)
-        # 解析时长（秒）
-        duration_seconds = record_data.get('DurationS', 0)
-        if not duration_seconds:
+        # 先判断是否需要播报，不需要播报的战绩不再格式化
+        record_type = record.classify()
+        if not record_type:
             return None
-        # 解析击杀数
-        kill_count = record_data.get('KillCount', 0)
-        # 解析收益
-        final_price = record_data.get('FinalPrice', '0')
-        # 解析纯利润
-        flow_cal_gained_price = record_data.get('flowCalGainedPrice', 0)
+
+        event_time = record.event_time_str
+        map_id = record.map_id
+        kill_count = record.kill_count
         
         # 格式化时长
-        minutes = duration_seconds // 60
-        seconds = duration_seconds % 60
+        minutes = record.duration // 60
+        seconds = record.duration % 60
         duration_str = f"{minutes}分{seconds}秒"
         
         # 格式化结果
-        if escape_fail_reason == 1:
+        if record.is_escape:
             result_str = "撤离成功"
         else:
             result_str = "撤离失败"
         
         # 格式化收益
-        price_int = int(final_price)
-        try:
-            price_str = Util.trans_num_easy_for_read(price_int)
-        except:
-            price_str = final_price
+        price_str = Util.trans_num_easy_for_read(record.final_price)
 
         # 计算战损
-        loss_int = int(final_price) - int(flow_cal_gained_price)
-        loss_str = Util.trans_num_easy_for_read(loss_int)
+        loss_str = Util.trans_num_easy_for_read(record.loss)
         
         # 计算纯收益（带出价值 - 战损）
-        pure_profit = int(flow_cal_gained_price)
-        pure_profit_str = Util.trans_num_easy_for_read(pure_profit)
+        pure_profit_str = Util.trans_num_easy_for_read(record.flow_cal_gained_price)
 
-        # logger.debug(f"获取到玩家{user_name}的战绩：时间：{event_time}，地图：{get_map_name(map_id)}，结果：{result_str}，存活时长：{duration_str}，击杀干员：{kill_count}，带出：{price_str}，战损：{loss_str}")
-        
-        if pure_profit > 1000000:
+        if record_type == "gain":
             # 构建消息
             message = f"🎯 {user_name} 百万撤离！\n"
             message += f"⏰ 时间: {event_time}\n"
@@ -190,7 +273,7 @@ async def format_record_message(record_data: dict, user_name: str) -> bytes|str|
                 logger.exception(f"渲染战绩卡片失败: {e}")
                 # 降级到文本模式
             return message
-        elif loss_int > 1000000:
+        elif record_type == "loss":
             message = f"🎯 {user_name} 百万战损！\n"
             message += f"⏰ 时间: {event_time}\n"
             message += f"🗺️ 地图: {Util.get_map_name(map_id)}\n"
@@ -226,26 +309,11 @@ async def format_record_message(record_data: dict, user_name: str) -> bytes|str|
         logger.exception(f"格式化战绩消息失败: {e}")
         return None
 
-async def format_tdm_record_message(record_data: dict, user_name: str) -> bytes|str|None:
+async def format_tdm_record_message(record: TdmRecord, user_name: str) -> bytes|str|None:
     """格式化战场战绩播报消息"""
     try:
-        # 解析时间
-        event_time = record_data.get('dtEventTime', '')
-        # 解析地图
-        map_id = record_data.get('MapID', '')
-        map_name = Util.get_map_name(map_id)
-        # 解析结果
-        match_result = Util.get_tdm_match_result(record_data.get('MatchResult', 0))
-        # 解析KDA
-        kill_num: int = record_data.get('KillNum', 0)
-        death_num: int = record_data.get('Death', 0)
-        assist_num: int = record_data.get('Assist', 0)
-        # 分数与时长
-        total_score: int = record_data.get('TotalScore', 0)
-        game_time: int = record_data.get('gametime', 0)  # 秒
-        game_time_str = Util.seconds_to_duration(game_time)
-        # 分均得分（避免除零）
-        avg_score_per_minute: int = int(total_score * 60 / game_time) if game_time and game_time > 0 else 0
+        kill_num = record.kill_num
+        avg_score_per_minute = record.avg_score_per_minute
 
         # 触发条件
         trigger_kill = kill_num >= 100
@@ -253,13 +321,22 @@ async def format_tdm_record_message(record_data: dict, user_name: str) -> bytes|
         if not (trigger_kill or trigger_avg):
             return None
 
+        event_time = record.event_time_str
+        map_name = Util.get_map_name(record.map_id)
+        match_result = Util.get_tdm_match_result(record.match_result)
+        death_num = record.death
+        assist_num = record.assist
+        total_score = record.total_score
+        game_time_str = Util.seconds_to_duration(record.game_time)
+        armed_force_name = Util.get_armed_force_name(record.armed_force_id)
+
         # 文本播报（回退或同时使用）
         if trigger_kill:
             message = f"🎯 {user_name} 捞薯大师！\n"
         else:
             message = f"🎯 {user_name} 刷分大王！\n"
         message += f"⏰ 时间: {event_time}\n"
-        message += f"👤 干员: {Util.get_armed_force_name(record_data.get('ArmedForceId', 0))}\n"
+        message += f"👤 干员: {armed_force_name}\n"
         message += f"🗺️ 地图: {map_name}\n"
         message += f"📊 结果: {match_result}\n"
         message += f"⏱️ 时长: {game_time_str}\n"
@@ -284,7 +361,7 @@ async def format_tdm_record_message(record_data: dict, user_name: str) -> bytes|
             'map_name': map_name,
             'result': match_result,
             'gametime': game_time_str,
-            'armed_force': Util.get_armed_force_name(record_data.get('ArmedForceId', 0)),
+            'armed_force': armed_force_name,
             'kill_count': kill_num,
             'death_count': death_num,
             'assist_count': assist_num,
@@ -307,35 +384,15 @@ async def format_tdm_record_message(record_data: dict, user_name: str) -> bytes|
         logger.exception(f"格式化战场战绩消息失败: {e}")
         return None
 
-def is_record_within_time_limit(record_data: dict, max_age_minutes: int = BROADCAST_EXPIRED_MINUTES, mode: Literal["sol", "tdm"] = "sol") -> bool:
-    """检查战绩是否在时间限制内"""
-    try:
-        event_time_str = record_data.get('dtEventTime', '')
-        if not event_time_str:
-            return False
-        
-        # 解析时间字符串 "2025-07-20 20: 04: 29"
-        # 注意时间格式中有空格，需要处理
-        event_time_str = event_time_str.replace(' : ', ':')
-        
-        # 解析时间
-        if mode == "sol":
-            event_time = datetime.datetime.strptime(event_time_str, '%Y-%m-%d %H:%M:%S')
-        elif mode == "tdm":
-            gametime = record_data.get('GameTime', 0)
-            event_time = datetime.datetime.strptime(event_time_str, '%Y-%m-%d %H:%M:%S') + datetime.timedelta(seconds=gametime)
-        current_time = datetime.datetime.now()
-        
-        # 计算时间差
-        time_diff = current_time - event_time
-        time_diff_minutes = time_diff.total_seconds() / 60
-        
-        return time_diff_minutes <= max_age_minutes
-    except Exception as e:
-        logger.error(f"检查战绩时间限制失败: {e}")
+def is_record_within_time_limit(record: Record, max_age_minutes: int = BROADCAST_EXPIRED_MINUTES) -> bool:
+    """检查战绩是否在时间限制内，战场战绩以对局结束时间计算"""
+    if not record.end_time:
         return False
+    time_diff = datetime.datetime.now() - record.end_time
+    return time_diff.total_seconds() / 60 <= max_age_minutes
 
 @bind_delta_safehouse_remind_open_close.handle()
+@trace_command("三角洲特勤处提醒")
 async def safehouse_remind_open_close(event: MessageEvent, session: async_scoped_session, args: Message = CommandArg()):
     user_data_database = UserDataDatabase(session)
     user_data = await user_data_database.get_user_data(event.user_id)
@@ -355,7 +412,8 @@ async def safehouse_remind_open_close(event: MessageEvent, session: async_scoped
         await user_data_database.update_user_data(user_data)
         await user_data_database.commit()
         logger.info(f"启动特勤处监控任务: {qq_id}")
-        scheduler.add_job(watch_safehouse, 'interval', seconds=SAFEHOUSE_CHECK_INTERVAL, id=f'delta_watch_safehouse_{qq_id}', next_run_time=datetime.datetime.now() + datetime.timedelta(seconds=10), replace_existing=True, kwargs={'qq_id': qq_id}, max_instances=1)
+        if is_watch_owner(qq_id):
+            safehouse_poll_queue.push(qq_id, time.time())
         await bind_delta_safehouse_remind_open_close.finish("特勤处提醒功能已开启", reply_message=True)
     
     elif arg == "关闭":
@@ -368,16 +426,13 @@ async def safehouse_remind_open_close(event: MessageEvent, session: async_scoped
         
         await user_data_database.update_user_data(user_data)
         await user_data_database.commit()
-        try:
-            scheduler.remove_job(f'delta_watch_safehouse_{qq_id}')
-        except Exception:
-            # 任务可能不存在，忽略错误
-            pass
+        safehouse_poll_queue.remove(qq_id)
         await bind_delta_safehouse_remind_open_close.finish("特勤处提醒功能已关闭", reply_message=True)
     else:
         await bind_delta_safehouse_remind_open_close.finish("参数错误，请使用\"三角洲特勤处提醒 开启\"或\"三角洲特勤处提醒 关闭\"", reply_message=True)
 
 @bind_delta_broadcast_record_open_close.handle()
+@trace_command("三角洲战绩播报")
 async def broadcast_record_open_close(event: MessageEvent, session: async_scoped_session, args: Message = CommandArg()):
     user_data_database = UserDataDatabase(session)
     user_data = await user_data_database.get_user_data(event.user_id)
@@ -406,7 +461,8 @@ async def broadcast_record_open_close(event: MessageEvent, session: async_scoped
 
         if enable_broadcast_record:
             logger.info(f"启动战绩监控任务: {qq_id} - {user_name}")
-            scheduler.add_job(watch_all_record, 'interval', seconds=interval, id=f'delta_watch_record_{qq_id}', next_run_time=datetime.datetime.now() + datetime.timedelta(seconds=10), replace_existing=True, kwargs={'user_name': user_name, 'qq_id': qq_id}, max_instances=1)
+            if is_watch_owner(qq_id):
+                scheduler.add_job(watch_all_record, 'interval', seconds=interval, id=f'delta_watch_record_{qq_id}', next_run_time=datetime.datetime.now() + datetime.timedelta(seconds=10), replace_existing=True, kwargs={'user_name': user_name, 'qq_id': qq_id}, max_instances=1)
             await bind_delta_broadcast_record_open_close.finish("战绩播报功能已开启", reply_message=True)
         else:
             await bind_delta_broadcast_record_open_close.finish("已更新播报监控状态，但bot配置未开启播报功能", reply_message=True)
@@ -421,6 +477,7 @@ async def broadcast_record_open_close(event: MessageEvent, session: async_scoped
         
         await user_data_database.update_user_data(user_data)
         await user_data_database.commit()
+        group_leaderboard.remove_user(qq_id)
         try:
             scheduler.remove_job(f'delta_watch_record_{qq_id}')
         except Exception:
@@ -474,13 +531,18 @@ async def _(event: MessageEvent, session: async_scoped_session, args: Message =
                         await bind_delta_login.finish(f"绑定失败：{res['message']}", reply_message=True)
                     res = await deltaapi.get_player_info(access_token=access_token, openid=openid)
                     if res['status']:
-                        user_data = UserData(qq_id=qq_id, group_id=group_id, access_token=access_token, openid=openid, platform=platform)
+                        user_name = res['data']['player']['charac_name']
+                        user_data = UserData(qq_id=qq_id, group_id=group_id, access_token=access_token, openid=openid, platform=platform, user_name=user_name)
                         user_data_database = UserDataDatabase(session)
                         if not await user_data_database.add_user_data(user_data):
                             await bind_delta_login.finish("保存用户数据失败，请稍查看日志", reply_message=True)
                         await user_data_database.commit()
-                        user_name = res['data']['player']['charac_name']
-                        scheduler.add_job(watch_all_record, 'interval', seconds=interval, id=f'delta_watch_record_{qq_id}', next_run_time=datetime.datetime.now() + datetime.timedelta(seconds=10), replace_existing=True, kwargs={'user_name': user_name, 'qq_id': qq_id}, max_instances=1)
+                        await clear_token_quarantine(user_data_database, qq_id)
+                        user_name_cache[qq_id] = user_name
+                        # 重新绑定后可能换了群，先从原来的群榜单中移除，下次更新或重建榜单时加入新群
+                        group_leaderboard.remove_user(qq_id)
+                        if is_watch_owner(qq_id):
+                            scheduler.add_job(watch_all_record, 'interval', seconds=interval, id=f'delta_watch_record_{qq_id}', next_run_time=datetime.datetime.now() + datetime.timedelta(seconds=10), replace_existing=True, kwargs={'user_name': user_name, 'qq_id': qq_id}, max_instances=1)
                         try:
                             renderer = await get_renderer()
                             img_data = await renderer.render_login_success(user_name, Util.trans_num_easy_for_read(res['data']['money']))
@@ -527,13 +589,18 @@ async def _(event: MessageEvent, session: async_scoped_session, args: Message =
                         await bind_delta_login.finish(f"绑定失败：{res['message']}", reply_message=True)
                     res = await deltaapi.get_player_info(access_token=access_token, openid=openid)
                     if res['status']:
-                        user_data = UserData(qq_id=qq_id, group_id=group_id, access_token=access_token, openid=openid, platform=platform)
+                        user_name = res['data']['player']['charac_name']
+                        user_data = UserData(qq_id=qq_id, group_id=group_id, access_token=access_token, openid=openid, platform=platform, user_name=user_name)
                         user_data_database = UserDataDatabase(session)
                         if not await user_data_database.add_user_data(user_data):
                             await bind_delta_login.finish("保存用户数据失败，请稍查看日志", reply_message=True)
                         await user_data_database.commit()
-                        user_name = res['data']['player']['charac_name']
-                        scheduler.add_job(watch_all_record, 'interval', seconds=interval, id=f'delta_watch_record_{qq_id}', next_run_time=datetime.datetime.now() + datetime.timedelta(seconds=10), replace_existing=True, kwargs={'user_name': user_name, 'qq_id': qq_id}, max_instances=1)
+                        await clear_token_quarantine(user_data_database, qq_id)
+                        user_name_cache[qq_id] = user_name
+                        # 重新绑定后可能换了群，先从原来的群榜单中移除，下次更新或重建榜单时加入新群
+                        group_leaderboard.remove_user(qq_id)
+                        if is_watch_owner(qq_id):
+                            scheduler.add_job(watch_all_record, 'interval', seconds=interval, id=f'delta_watch_record_{qq_id}', next_run_time=datetime.datetime.now() + datetime.timedelta(seconds=10), replace_existing=True, kwargs={'user_name': user_name, 'qq_id': qq_id}, max_instances=1)
                         try:
                             renderer = await get_renderer()
                             img_data = await renderer.render_login_success(user_name, Util.trans_num_easy_for_read(res['data']['money']))
@@ -554,6 +621,7 @@ async def _(event: MessageEvent, session: async_scoped_session, args: Message =
             await asyncio.sleep(0.5)
 
 @bind_delta_player_info.handle()
+@trace_command("三角洲信息")
 async def _(event: MessageEvent, session: async_scoped_session):
     user_data_database = UserDataDatabase(session)
     user_data = await user_data_database.get_user_data(event.user_id)
@@ -656,6 +724,7 @@ async def _(event: MessageEvent, session: async_scoped_session):
         await bind_delta_player_info.finish(f"查询角色信息失败，可以需要重新登录\n详情请查看日志", reply_message=True)
 
 @bind_delta_safehouse.handle()
+@trace_command("三角洲特勤处")
 async def _(event: MessageEvent, session: async_scoped_session):
     user_data_database = UserDataDatabase(session)
     user_data = await user_data_database.get_user_data(event.user_id)
@@ -729,6 +798,7 @@ async def _(event: MessageEvent, session: async_scoped_session):
         await bind_delta_safehouse.finish(f"获取特勤处状态失败：{res['message']}", reply_message=True)
 
 @bind_delta_password.handle()
+@trace_command("三角洲密码")
 async def _(event: MessageEvent, session: async_scoped_session):
     user_data_database = UserDataDatabase(session)
     user_data_list = await user_data_database.get_user_data_list()
@@ -748,6 +818,7 @@ async def _(event: MessageEvent, session: async_scoped_session):
     await bind_delta_password.finish("所有已绑定账号已过期，请先用\"三角洲登录\"命令登录至少一个账号", reply_message=True)
 
 @bind_delta_daily_report.handle()
+@trace_command("三角洲日报")
 async def _(event: MessageEvent, session: async_scoped_session):
     user_data_database = UserDataDatabase(session)
     user_data = await user_data_database.get_user_data(event.user_id)
@@ -799,6 +870,7 @@ async def _(event: MessageEvent, session: async_scoped_session):
         await bind_delta_daily_report.finish(f"获取三角洲日报失败：{res['message']}", reply_message=True)
 
 @bind_delta_weekly_report.handle()
+@trace_command("三角洲周报")
 async def _(event: MessageEvent, session: async_scoped_session):
     user_data_database = UserDataDatabase(session)
     user_data = await user_data_database.get_user_data(event.user_id)
@@ -814,16 +886,22 @@ async def _(event: MessageEvent, session: async_scoped_session):
         user_name = res['data']['player']['charac_name']
     else:
         await bind_delta_weekly_report.finish("获取角色信息失败，可能需要重新登录", reply_message=True)
+    weekly_report_engine = WeeklyReportEngine(user_data_database)
     for i in range (1,3):
         statDate, statDate_str = Util.get_Sunday_date(i)
-        res = await deltaapi.get_weekly_report(access_token=access_token, openid=openid, statDate=statDate)
-        if res['status'] and res['data']:
+        # 优先使用本地统计，本地数据不完整时回退到官方周报接口
+        report = await weekly_report_engine.get_weekly_report(event.user_id, statDate)
+        if not report:
+            res = await deltaapi.get_weekly_report(access_token=access_token, openid=openid, statDate=statDate)
+            if res['status'] and res['data']:
+                report = await run_cpu('parse_weekly_report', parse_weekly_report, res['data'])
+        if report:
             # 解析总带出
-            Gained_Price = int(res['data'].get('Gained_Price', 0))
+            Gained_Price = report['gained_price']
             Gained_Price_Str = Util.trans_num_easy_for_read(Gained_Price)
 
             # 解析总带入
-            consume_Price = int(res['data'].get('consume_Price', 0))
+            consume_Price = report['consume_price']
             consume_Price_Str = Util.trans_num_easy_for_read(consume_Price)
 
             # 解析总利润
@@ -831,49 +909,39 @@ async def _(event: MessageEvent, session: async_scoped_session):
             profit_str = f"{'-' if profit < 0 else ''}{Util.trans_num_easy_for_read(abs(profit))}"
 
             # 解析使用干员信息
-            total_ArmedForceId_num = res['data'].get('total_ArmedForceId_num', '')
-            total_ArmedForceId_num = total_ArmedForceId_num.replace("'", '"')
-            total_ArmedForceId_num_list = list(map(json.loads, total_ArmedForceId_num.split('#')))
-            total_ArmedForceId_num_list.sort(key=lambda x: x['inum'], reverse=True)
+            total_ArmedForceId_num_list = report['armed_force_list']
 
             # 解析资产变化
-            Total_Price = res['data'].get('Total_Price', '')
-            import re
-            def extract_price(text: str) -> str:
-                m = re.match(r'(\w+)-(\d+)-(\d+)', text)
-                if m:
-                    return m.group(3)
-                return ""
-            price_list = list(map(extract_price, Total_Price.split(',')))
+            price_list = report['price_list']
 
             # 解析资产净增
-            rise_Price = int(price_list[-1]) - int(price_list[0])
-            rise_Price_Str = f"{'-' if rise_Price < 0 else ''}{Util.trans_num_easy_for_read(abs(rise_Price))}"
+            if report['rise_price'] is not None:
+                rise_Price = report['rise_price']
+                rise_Price_Str = f"{'-' if rise_Price < 0 else ''}{Util.trans_num_easy_for_read(abs(rise_Price))}"
+            else:
+                rise_Price = 0
+                rise_Price_Str = "未知"
 
             # 解析总场次
-            total_sol_num = res['data'].get('total_sol_num', '0')
+            total_sol_num = report['sol_num']
 
             # 解析总击杀
-            total_Kill_Player = res['data'].get('total_Kill_Player', '0')
+            total_Kill_Player = report['kill_num']
 
             # 解析总死亡
-            total_Death_Count = res['data'].get('total_Death_Count', '0')
+            total_Death_Count = report['death_num']
 
             # 解析总在线时间
-            total_Online_Time = res['data'].get('total_Online_Time', '0')
-            total_Online_Time_str = Util.seconds_to_duration(total_Online_Time)
+            total_Online_Time_str = Util.seconds_to_duration(report['online_time'])
 
             # 解析撤离成功次数
-            total_exacuation_num = res['data'].get('total_exacuation_num', '0')
+            total_exacuation_num = report['escape_num']
 
             # 解析百万撤离次数
-            GainedPrice_overmillion_num = res['data'].get('GainedPrice_overmillion_num', '0')
+            GainedPrice_overmillion_num = report['overmillion_num']
 
             # 解析游玩地图信息
-            total_mapid_num = res['data'].get('total_mapid_num', '')
-            total_mapid_num = total_mapid_num.replace("'", '"')
-            total_mapid_num_list = list(map(json.loads, total_mapid_num.split('#')))
-            total_mapid_num_list.sort(key=lambda x: x['inum'], reverse=True)
+            total_mapid_num_list = report['map_list']
 
             res = await deltaapi.get_weekly_friend_report(access_token=access_token, openid=openid, statDate=statDate)
 
@@ -923,7 +991,8 @@ async def _(event: MessageEvent, session: async_scoped_session):
             message += Text(f"KD： {total_Kill_Player}杀/{total_Death_Count}死\n")
             message += Text(f"在线时间：{total_Online_Time_str}\n")
             message += Text(f"总带出：{Gained_Price_Str} | 总带入：{consume_Price_Str}\n")
-            message += Text(f"资产变化：{Util.trans_num_easy_for_read(price_list[0])} -> {Util.trans_num_easy_for_read(price_list[-1])} | 资产净增：{rise_Price_Str}\n")
+            if price_list:
+                message += Text(f"资产变化：{Util.trans_num_easy_for_read(price_list[0])} -> {Util.trans_num_easy_for_read(price_list[-1])} | 资产净增：{rise_Price_Str}\n")
             msgs.append(message)
             message = Text(f"--- 干员使用情况 ---")
             for armed_force in total_ArmedForceId_num_list:
@@ -951,13 +1020,15 @@ async def _(event: MessageEvent, session: async_scoped_session):
                     profit, rise_Price,
                     total_sol_num, total_Online_Time_str, total_Kill_Player,
                     total_Death_Count, total_exacuation_num, GainedPrice_overmillion_num, price_list)
-                await Image(image=img_data).finish()
+                with span('send'):
+                    await Image(image=img_data).finish()
             except FinishedException:
                 raise
             except Exception as e:
                 logger.error(f"渲染周报卡片失败: {e}")
                 # 降级到文本模式
-            await AggregatedMessageFactory(msgs).finish()
+            with span('send'):
+                await AggregatedMessageFactory(msgs).finish()
         else:
             continue
     
@@ -981,6 +1052,7 @@ async def _(event: MessageEvent, session: async_scoped_session):
         set_increaser = True
     )
 ])
+@trace_command("三角洲AI锐评")
 async def _(event: MessageEvent, session: async_scoped_session, increaser: Increaser):
     user_data_database = UserDataDatabase(session)
     user_data = await user_data_database.get_user_data(event.user_id)
@@ -1009,44 +1081,43 @@ async def _(event: MessageEvent, session: async_scoped_session, increaser: Incre
     totalKill = person_center_info.get('totalKill', '0')
     totalGameTime = Util.seconds_to_duration(person_center_info.get('totalGameTime', '0'))
 
+    weekly_report_engine = WeeklyReportEngine(user_data_database)
     for i in range (1,3):
         statDate, statDate_str = Util.get_Sunday_date(i)
-        res = await deltaapi.get_weekly_report(access_token=access_token, openid=openid, statDate=statDate)
-        if res['status'] and res['data']:
+        # 优先使用本地统计，本地数据不完整时回退到官方周报接口
+        report = await weekly_report_engine.get_weekly_report(event.user_id, statDate)
+        if not report:
+            res = await deltaapi.get_weekly_report(access_token=access_token, openid=openid, statDate=statDate)
+            if res['status'] and res['data']:
+                report = await run_cpu('parse_weekly_report', parse_weekly_report, res['data'])
+        if report:
             # 解析总带出
-            Gained_Price = int(res['data'].get('Gained_Price', 0))
+            Gained_Price = report['gained_price']
 
             # 解析资产净增
-            rise_Price = int(res['data'].get('rise_Price', 0))
+            rise_Price = report['rise_price'] if report['rise_price'] is not None else "未知"
 
             # 解析资产变化
-            Total_Price = res['data'].get('Total_Price', '')
-            import re
-            def extract_price(text: str) -> str:
-                m = re.match(r'(\w+)-(\d+)-(\d+)', text)
-                if m:
-                    return m.group(3)
-                return ""
-            price_list = list(map(extract_price, Total_Price.split(',')))
+            price_list = report['price_list']
+            asset_str = f"资产是从{price_list[0]}到{price_list[-1]}，" if price_list else ""
 
             # 解析总场次
-            total_sol_num = res['data'].get('total_sol_num', '0')
+            total_sol_num = report['sol_num']
 
             # 解析总击杀
-            total_Kill_Player = res['data'].get('total_Kill_Player', '0')
+            total_Kill_Player = report['kill_num']
 
             # 解析总死亡
-            total_Death_Count = res['data'].get('total_Death_Count', '0')
+            total_Death_Count = report['death_num']
 
             # 解析总在线时间
-            total_Online_Time = res['data'].get('total_Online_Time', '0')
-            total_Online_Time_str = Util.seconds_to_duration(total_Online_Time)
+            total_Online_Time_str = Util.seconds_to_duration(report['online_time'])
 
             # 解析撤离成功次数
-            total_exacuation_num = res['data'].get('total_exacuation_num', '0')
+            total_exacuation_num = report['escape_num']
 
             # 解析百万撤离次数
-            GainedPrice_overmillion_num = res['data'].get('GainedPrice_overmillion_num', '0')
+            GainedPrice_overmillion_num = report['overmillion_num']
         else:
             continue
         
@@ -1074,7 +1145,7 @@ async def _(event: MessageEvent, session: async_scoped_session, increaser: Incre
             },
             {
                 "role": "user",
-                "content": f"这个玩家的生涯数据：赚损比（每死一次可以赚多少哈夫币）是{profitLossRatio}，绝密行动kda是{highKillDeathRatio}，机密行动kda是{medKillDeathRatio}，常规行动kda是{lowKillDeathRatio}，总场数是{totalFight}，总撤离数是{totalEscape}，总获取哈夫币是{totalGainedPrice}，总游戏时长是{totalGameTime}，总击杀是{totalKill}；这名玩家上周的数据：总场数是{total_sol_num}，总撤离数是{total_exacuation_num}，百万以上撤离次数是{GainedPrice_overmillion_num}，总击杀是{total_Kill_Player}，总死亡是{total_Death_Count}，总游戏时长是{total_Online_Time_str}，总带出是{Gained_Price}，资产是从{price_list[0]}到{price_list[-1]}，资产变化是{rise_Price}。"
+                "content": f"这个玩家的生涯数据：赚损比（每死一次可以赚多少哈夫币）是{profitLossRatio}，绝密行动kda是{highKillDeathRatio}，机密行动kda是{medKillDeathRatio}，常规行动kda是{lowKillDeathRatio}，总场数是{totalFight}，总撤离数是{totalEscape}，总获取哈夫币是{totalGainedPrice}，总游戏时长是{totalGameTime}，总击杀是{totalKill}；这名玩家上周的数据：总场数是{total_sol_num}，总撤离数是{total_exacuation_num}，百万以上撤离次数是{GainedPrice_overmillion_num}，总击杀是{total_Kill_Player}，总死亡是{total_Death_Count}，总游戏时长是{total_Online_Time_str}，总带出是{Gained_Price}，{asset_str}资产变化是{rise_Price}。"
             }
             ]
         )
@@ -1088,6 +1159,7 @@ async def _(event: MessageEvent, session: async_scoped_session, increaser: Incre
             await bind_delta_ai_comment.finish("AI锐评内容为空，请查看日志", reply_message=True)
 
 @bind_delta_get_record.handle()
+@trace_command("三角洲战绩")
 async def get_record(event: MessageEvent, session: async_scoped_session, args: Message = CommandArg()):
     user_data_database = UserDataDatabase(session)
     user_data = await user_data_database.get_user_data(event.user_id)
@@ -1181,38 +1253,20 @@ async def get_record(event: MessageEvent, session: async_scoped_session, args: M
 
             if cur_index > line_limit:
                 break
-            # 解析时间
-            event_time = record.get('dtEventTime', '')
-            # 解析地图
-            map_id = record.get('MapId', '')
-            map_name = Util.get_map_name(map_id)
-            # 解析结果
-            escape_fail_reason = record.get('EscapeFailReason', 0)
-            result_str = "撤离成功" if escape_fail_reason == 1 else "撤离失败"
-            # 解析时长
-            duration_seconds = record.get('DurationS', 0)
-            minutes = duration_seconds // 60
-            seconds = duration_seconds % 60
+            event_time = record.event_time_str
+            map_name = Util.get_map_name(record.map_id)
+            result_str = "撤离成功" if record.is_escape else "撤离失败"
+            # 格式化时长
+            minutes = record.duration // 60
+            seconds = record.duration % 60
             duration_str = f"{minutes}分{seconds}秒"
-            # 解析击杀数
-            kill_count = record.get('KillCount', 0)
-            # 解析收益
-            final_price = record.get('FinalPrice', '0')
-            if final_price is None:
-                final_price = "未知"
-            # 解析纯利润
-            flow_cal_gained_price = record.get('flowCalGainedPrice', 0)
+            kill_count = record.kill_count
+            # 格式化收益，带出价值缺失时显示未知
+            price_str = Util.trans_num_easy_for_read(record.final_price) if record.final_price is not None else "未知"
+            # 格式化纯利润
+            flow_cal_gained_price = record.flow_cal_gained_price
             flow_cal_gained_price_str = f"{'' if flow_cal_gained_price >= 0 else '-'}{Util.trans_num_easy_for_read(abs(flow_cal_gained_price))}"
-            # 格式化收益
-            try:
-                price_int = int(final_price)
-                price_str = Util.trans_num_easy_for_read(price_int)
-            except:
-                price_str = final_price
-
-            # 解析干员
-            ArmedForceId = record.get('ArmedForceId', '')
-            ArmedForce = Util.get_armed_force_name(ArmedForceId)
+            ArmedForce = Util.get_armed_force_name(record.armed_force_id)
 
             fallback_message = (
                 f"#{cur_index} {event_time}\n"
@@ -1269,13 +1323,10 @@ async def get_record(event: MessageEvent, session: async_scoped_session, args: M
         for record in res['data']['operator']:
             cur_index = index
             index += 1
-            # 解析时间
-            event_time = record.get('dtEventTime', '')
-            # 解析地图
-            map_id = record.get('MapID', '')
-            map_name = Util.get_map_name(map_id)
-            # 解析结果
-            MatchResult = record.get('MatchResult', 0)
+            event_time = record.event_time_str
+            map_name = Util.get_map_name(record.map_id)
+            # 格式化结果
+            MatchResult = record.match_result
             if MatchResult == 1:
                 result_str = "胜利"
             elif MatchResult == 2:
@@ -1284,39 +1335,20 @@ async def get_record(event: MessageEvent, session: async_scoped_session, args: M
                 result_str = "中途退出"
             else:
                 result_str = f"未知{MatchResult}"
-            # 解析时长
-            gametime = record.get('gametime', 0)
-            minutes = gametime // 60
-            seconds = gametime % 60
+            # 格式化时长
+            minutes = record.game_time // 60
+            seconds = record.game_time % 60
             duration_str = f"{minutes}分{seconds}秒"
-            # 解析KDA
-            KillNum = record.get('KillNum', 0)
-            Death = record.get('Death', 0)
-            Assist = record.get('Assist', 0)
-
-            # 解析救援数
-            RescueTeammateCount = record.get('RescueTeammateCount', 0)
-            RoomId = record.get('RoomId', '')
-            res = await deltaapi.get_tdm_detail(user_data.access_token, user_data.openid, RoomId)
-            if res['status'] and res['data']:
-                mpDetailList = res['data'].get('mpDetailList', [])
-                for mpDetail in mpDetailList:
-                    if mpDetail.get('isCurrentUser', False):
-                        rescueTeammateCount = mpDetail.get('rescueTeammateCount', 0)
-                        if rescueTeammateCount > 0:
-                            RescueTeammateCount = rescueTeammateCount
-                            break
-            else:
-                logger.error(f"获取战绩详情失败: {res['message']}")
-                
+            KillNum = record.kill_num
+            Death = record.death
+            Assist = record.assist
 
-            # 解析总得分
-            TotalScore = record.get('TotalScore', 0)
-            avgScorePerMinute = int(TotalScore * 60 / gametime) if gametime and gametime > 0 else 0
+            # 获取救援数
+            RescueTeammateCount = await get_rescue_teammate_count(deltaapi, user_data.access_token, user_data.openid, record.room_id) or record.rescue_teammate_count
 
-            # 解析干员
-            ArmedForceId = record.get('ArmedForceId', '')
-            ArmedForce = Util.get_armed_force_name(ArmedForceId)
+            TotalScore = record.total_score
+            avgScorePerMinute = record.avg_score_per_minute
+            ArmedForce = Util.get_armed_force_name(record.armed_force_id)
 
             fallback_message = (
                 f"#{cur_index} {event_time}\n"
@@ -1361,227 +1393,449 @@ async def get_record(event: MessageEvent, session: async_scoped_session, args: M
     
 
 
-async def watch_record(user_name: str, qq_id: int):
-    session = get_session()
+@bind_delta_leaderboard.handle()
+@trace_command("三角洲排行榜")
+async def _(event: MessageEvent, args: Message = CommandArg()):
+    if not isinstance(event, GroupMessageEvent):
+        await bind_delta_leaderboard.finish("排行榜仅支持在群聊中查看", reply_message=True)
+
+    arg = args.extract_plain_text().strip()
+    metric = LEADERBOARD_ALIASES.get(arg)
+    if not metric:
+        await bind_delta_leaderboard.finish("参数错误，榜单可选：收益/击杀/百万撤离/分均", reply_message=True)
+
+    metric_name, _, format_value = LEADERBOARD_METRICS[metric]
+    ranking = group_leaderboard.top(event.group_id, metric)
+    if not ranking:
+        await bind_delta_leaderboard.finish(f"本群本周暂无{metric_name}榜数据，开启战绩播报后会自动统计", reply_message=True)
+
+    message = f"【本群本周{metric_name}榜】"
+    for index, (qq_id, user_name, score) in enumerate(ranking, start=1):
+        message += f"\n{index}. {user_name}：{format_value(score)}"
+    await bind_delta_leaderboard.finish(message)
+
+@bind_delta_token_report.handle()
+@trace_command("三角洲失效账号")
+async def _(session: async_scoped_session):
     user_data_database = UserDataDatabase(session)
-    user_data = await user_data_database.get_user_data(qq_id)
-    if user_data:
-        deltaapi = DeltaApi(user_data.platform)
-        # logger.debug(f"开始获取玩家{user_name}的战绩")
-        res = await deltaapi.get_record(user_data.access_token, user_data.openid)
-        if res['status']:
-            # logger.debug(f"玩家{user_name}的战绩：{res['data']}")
-            
-            # 处理gun模式战绩
-            gun_records = res['data'].get('gun', [])
-            if not gun_records:
-                # logger.debug(f"玩家{user_name}没有gun模式战绩")
-                await session.close()
-                return
-            
-            # 获取最新战绩
-            if gun_records:
-                latest_record = gun_records[0]  # 第一条是最新的
-
-                # 检查时间限制
-                if not is_record_within_time_limit(latest_record):
-                    logger.debug(f"最新战绩时间超过{BROADCAST_EXPIRED_MINUTES}分钟，跳过播报")
-                    await session.close()
-                    return
-               
-                # 生成战绩ID
-                record_id = generate_record_id(latest_record)
-                
-                # 获取之前的最新战绩ID
-                latest_record_data = await user_data_database.get_latest_record(qq_id)
-                
-                # 如果是新战绩（ID不同）
-                if not latest_record_data or latest_record_data.latest_record_id != record_id:
-                    RoomId = latest_record.get('RoomId', '')
-                    res = await deltaapi.get_tdm_detail(user_data.access_token, user_data.openid, RoomId)
-                    if res['status'] and res['data']:
-                        mpDetailList = res['data'].get('mpDetailList', [])
-                        for mpDetail in mpDetailList:
-                            if mpDetail.get('isCurrentUser', False):
-                                rescueTeammateCount = mpDetail.get('rescueTeammateCount', 0)
-                                if rescueTeammateCount > 0:
-                                    latest_record['RescueTeammateCount'] = rescueTeammateCount
-                                    break
-                    else:
-                        logger.error(f"获取战绩详情失败: {res['message']}")
-
-                    # 格式化播报消息
-                    result = await format_record_message(latest_record, user_name)
-                    
-                    # 发送播报消息
-                    try:
-                        if result:
-                            if user_data.group_id != 0:
-                                if isinstance(result, bytes):
-                                    # 有卡片数据
-                                    img_data = result
-                                    try:
-                                        await Image(image=img_data).send_to(target=TargetQQGroup(group_id=user_data.group_id))
-                                    except Exception as e:
-                                        logger.error(f"发送战绩卡片失败: {e}")
-                                else:
-                                    # 只有文本消息
-                                    message = result
-                                    await Text(message).send_to(target=TargetQQGroup(group_id=user_data.group_id))
-                                logger.info(f"播报战绩成功: {user_name} - {record_id}")
-                        
-                            # 更新最新战绩记录
-                            if not latest_record_data:
-                                latest_record_data = LatestRecord(
-                                    qq_id=qq_id,
-                                    latest_record_id=record_id,
-                                    latest_tdm_record_id=""
-                                )
-                            else:
-                                latest_record_data.latest_record_id = record_id
-                            if await user_data_database.update_latest_record(latest_record_data):
-                                await user_data_database.commit()
-                                logger.info(f"更新最新战绩记录成功: {user_name} - {record_id}")
-                            else:
-                                logger.error(f"更新最新战绩记录失败: {user_name} - {record_id}")
-                        
-                    except Exception as e:
-                        logger.error(f"发送播报消息失败: {e}")
-                else:
-                    logger.debug(f"没有新战绩需要播报: {user_name}")
-            
-    try:
-        await session.close()
-    except Exception as e:
-        logger.error(f"关闭数据库会话失败: {e}")
+    quarantines = await user_data_database.get_token_quarantine_list()
+    if not quarantines:
+        await bind_delta_token_report.finish("当前没有登录凭证失效的账号")
+
+    lines = [f"登录凭证失效的账号共{len(quarantines)}个："]
+    for quarantine in quarantines:
+        expired_time = datetime.datetime.fromtimestamp(quarantine.expired_time).strftime('%m-%d %H:%M')
+        if quarantine.next_retry_time:
+            next_retry_time = datetime.datetime.fromtimestamp(quarantine.next_retry_time).strftime('%m-%d %H:%M')
+            state = f"已重新检查{quarantine.retry_count}次，{next_retry_time}再次检查"
+        else:
+            state = "已停止监控，等待重新登录"
+        lines.append(f"{quarantine.qq_id} - {expired_time}失效 - {state}")
+    await bind_delta_token_report.finish("\n".join(lines))
 
-async def watch_record_tdm(user_name: str, qq_id: int):
+@bind_delta_profile.handle()
+async def _(args: Message = CommandArg()):
+    arg = args.extract_plain_text().strip()
+    if arg and not arg.isdigit():
+        await bind_delta_profile.finish(f"参数错误，请输入采样秒数，最长{PROFILE_MAX_SECONDS}秒")
+    seconds = min(int(arg), PROFILE_MAX_SECONDS) if arg else PROFILE_DEFAULT_SECONDS
+    if seconds <= 0:
+        await bind_delta_profile.finish(f"参数错误，请输入采样秒数，最长{PROFILE_MAX_SECONDS}秒")
+    if is_profiling():
+        await bind_delta_profile.finish("已有性能分析在进行中，请稍后再试")
+
+    await bind_delta_profile.send(f"开始性能分析，采样{seconds}秒")
+    res = await run_profile(seconds, get_plugin_data_dir() / "profiles")
+    if not res['status']:
+        await bind_delta_profile.finish(f"性能分析失败：{res['message']}")
+    data = res['data']
+    lines = [f"性能分析完成，共采样{data['sample_count']}次"]
+    lines.append("--- 耗时最多的函数 ---")
+    for function, count in data['top_functions'][:5]:
+        lines.append(f"{function}: {count / max(data['sample_count'], 1):.1%}")
+    lines.append("--- 未完成的任务 ---")
+    for coro_name, count in data['task_counts'][:5]:
+        lines.append(f"{coro_name}: {count}")
+    lines.append(f"折叠栈: {data['profile_file']}")
+    lines.append(f"任务快照: {data['tasks_file']}")
+    logger.info(f"性能分析完成: {data['profile_file']}")
+    await bind_delta_profile.finish("\n".join(lines))
+
+async def refresh_leaderboard():
+    """从数据库重建群排行榜"""
     session = get_session()
-    user_data_database = UserDataDatabase(session)
-    user_data = await user_data_database.get_user_data(qq_id)
-    if user_data:
-        deltaapi = DeltaApi(user_data.platform)
-        # logger.debug(f"开始获取玩家{user_name}的战绩")
-        res = await deltaapi.get_record(user_data.access_token, user_data.openid, type_id=5)
-        if res['status']:
-            # logger.debug(f"玩家{user_name}的战绩：{res['data']}")
-            
-            # 处理operator模式战绩
-            operator_records = res['data'].get('operator', [])
-            if not operator_records:
-                # logger.debug(f"玩家{user_name}没有operator模式战绩")
-                await session.close()
-                return
-            
-            # 获取最新战绩
-            if operator_records:
-                latest_record = operator_records[0]  # 第一条是最新的
-                
-                # 检查时间限制
-                if not is_record_within_time_limit(latest_record, mode="tdm"):
-                    logger.debug(f"最新战绩时间超过{BROADCAST_EXPIRED_MINUTES}分钟，跳过播报")
-                    await session.close()
-                    return
-                
-                # 生成战绩ID
-                record_id = generate_record_id(latest_record)
-                
-                # 获取之前的最新战绩ID
-                latest_record_data = await user_data_database.get_latest_record(qq_id)
-                
-                # 如果是新战绩（ID不同）
-                if not latest_record_data or latest_record_data.latest_tdm_record_id != record_id:
-                    # 格式化播报消息
-                    result = await format_tdm_record_message(latest_record, user_name)
-                    
-                    # 发送播报消息
-                    try:
-                        if result:
-                            if user_data.group_id != 0:
-                                if isinstance(result, bytes):
-                                    # 有卡片数据
-                                    img_data = result
-                                    try:
-                                        await Image(image=img_data).send_to(target=TargetQQGroup(group_id=user_data.group_id))
-                                    except Exception as e:
-                                        logger.error(f"发送战绩卡片失败: {e}")
-                                else:
-                                    # 只有文本消息
-                                    message = result
-                                    await Text(message).send_to(target=TargetQQGroup(group_id=user_data.group_id))
-                                logger.info(f"播报战绩成功: {user_name} - {record_id}")
-                        
-                            # 更新最新战绩记录
-                            if not latest_record_data:
-                                latest_record_data = LatestRecord(
-                                    qq_id=qq_id,
-                                    latest_record_id="",
-                                    latest_tdm_record_id=record_id
-                                )
-                            else:
-                                latest_record_data.latest_tdm_record_id = record_id
-                            if await user_data_database.update_latest_record(latest_record_data):
-                                await user_data_database.commit()
-                                logger.info(f"更新最新战绩记录成功: {user_name} - {record_id}")
-                            else:
-                                logger.error(f"更新最新战绩记录失败: {user_name} - {record_id}")
-                        
-                    except Exception as e:
-                        logger.error(f"发送播报消息失败: {e}")
-                else:
-                    logger.debug(f"没有新战绩需要播报: {user_name}")
-            
     try:
+        await group_leaderboard.load(UserDataDatabase(session))
+    except Exception as e:
+        logger.exception(f"重建群排行榜失败: {e}")
+    finally:
         await session.close()
+
+async def resolve_user_name(deltaapi: DeltaApi, qq_id: int, access_token: str, openid: str) -> str:
+    """获取监控用户的角色名，获取成功后缓存，避免每次监控都请求"""
+    user_name = user_name_cache.get(qq_id)
+    if user_name:
+        cache_requests.inc(cache='user_name', result='hit')
+        return user_name
+    cache_requests.inc(cache='user_name', result='miss')
+    res = await deltaapi.get_player_info(access_token=access_token, openid=openid, with_currency=False)
+    if res['status'] and 'charac_name' in res['data']['player']:
+        user_name = res['data']['player']['charac_name']
+        user_name_cache[qq_id] = user_name
+        return user_name
+    return str(qq_id)
+
+async def send_record_broadcast(result: bytes|str, group_id: int, user_name: str, record_id: str):
+    """发送战绩播报消息"""
+    if group_id == 0:
+        return
+    try:
+        if isinstance(result, bytes):
+            # 有卡片数据
+            await Image(image=result).send_to(target=TargetQQGroup(group_id=group_id))
+        else:
+            # 只有文本消息
+            await Text(result).send_to(target=TargetQQGroup(group_id=group_id))
     except Exception as e:
-        logger.error(f"关闭数据库会话失败: {e}")
+        broadcasts_sent.inc(kind='record', result='error')
+        logger.error(f"发送播报消息失败: {user_name} - {record_id}: {e}")
+        return
+    broadcasts_sent.inc(kind='record', result='ok')
+    logger.info(f"播报战绩成功: {user_name} - {record_id}")
+
+def is_new_record(record: Record, latest_record_id: str|None) -> bool:
+    """判断战绩是否晚于上次播报的战绩"""
+    if not latest_record_id:
+        return True
+    if record.record_id == latest_record_id:
+        return False
+    latest_time = Util.parse_event_time(latest_record_id)
+    return not record.event_time or not latest_time or record.event_time > latest_time
+
+async def process_sol_records(group_id: int, user_name: str, new_records: list[SolRecord], latest_record_id: str|None) -> str|None:
+    """
+    播报本次新获取的烽火战绩中需要播报的战绩
+
+    Args:
+        new_records: 本次新统计的战绩，按时间从旧到新排列
+        latest_record_id: 上次播报的战绩ID
+
+    Returns:
+        最后播报的战绩ID，没有播报时返回None
+    """
+    broadcast_record_id = None
+    for record in new_records:
+        # 检查时间限制，避免补统计的旧战绩被播报
+        if not is_record_within_time_limit(record) or not is_new_record(record, latest_record_id):
+            continue
+        # 格式化播报消息，未达到播报门槛的战绩返回None
+        result = await format_record_message(record, user_name)
+        if not result:
+            continue
+        await send_record_broadcast(result, group_id, user_name, record.record_id)
+        broadcast_record_id = record.record_id
+    return broadcast_record_id
+
+async def process_tdm_records(group_id: int, user_name: str, new_records: list[TdmRecord], latest_tdm_record_id: str|None) -> str|None:
+    """播报本次新获取的战场战绩中需要播报的战绩，参数与返回值同process_sol_records"""
+    broadcast_record_id = None
+    for record in new_records:
+        # 检查时间限制，避免补统计的旧战绩被播报
+        if not is_record_within_time_limit(record) or not is_new_record(record, latest_tdm_record_id):
+            continue
 
-async def watch_all_record(user_name: str, qq_id: int):
-    await watch_record(user_name, qq_id)
-    await watch_record_tdm(user_name, qq_id)
+        # 格式化播报消息
+        result = await format_tdm_record_message(record, user_name)
+        if not result:
+            continue
+        await send_record_broadcast(result, group_id, user_name, record.record_id)
+        broadcast_record_id = record.record_id
+    return broadcast_record_id
+
+async def fetch_unseen_records(deltaapi: DeltaApi, access_token: str, openid: str, type_id: int, last_event_time: datetime.datetime|None) -> tuple[list[Record], bool]:
+    """
+    从最新的战绩开始向前翻页，直到越过已统计到的战绩或达到翻页上限
+
+    Args:
+        type_id: 4为烽火, 5为战场
+        last_event_time: 已统计到的最新战绩时间，为None时只获取第一页
+
+    Returns:
+        获取到的战绩（新的在前），以及是否翻页到了已统计到的战绩（没有更早的战绩时也视为到达）。
+        没有到达时，已统计的战绩与获取到的战绩之间可能有遗漏
+    """
+    key = 'gun' if type_id == 4 else 'operator'
+    records: list[Record] = []
+    for page in range(1, RECORD_MAX_PAGES + 1):
+        res = await deltaapi.get_record(access_token, openid, type_id=type_id, page=page)
+        if not res['status']:
+            # 请求失败时放弃本轮获取的战绩，检查点不变，下一轮重新获取
+            return [], True
+        page_records = res['data'].get(key, [])
+        records.extend(page_records)
+        if not page_records:
+            return records, True
+        if not last_event_time:
+            # 没有检查点时只获取第一页，无法确认更早的战绩是否都已统计
+            return records, False
+        oldest_event_time = page_records[-1].event_time
+        if not oldest_event_time or oldest_event_time <= last_event_time:
+            return records, True
+    return records, False
+
+async def quarantine_user(user_data_database: UserDataDatabase, qq_id: int) -> int:
+    """
+    记录用户登录凭证失效，按指数退避安排下一次检查
+
+    Returns:
+        下一次检查的时间戳，0表示停止监控直到重新登录
+    """
+    now = int(time.time())
+    quarantine = await user_data_database.get_token_quarantine(qq_id)
+    if quarantine is None:
+        quarantine = TokenQuarantine(qq_id=qq_id, expired_time=now, retry_count=0)
+    elif quarantine.next_retry_time == 0 or quarantine.next_retry_time > now:
+        # 另一个监控任务已经记录过本次失效
+        quarantined_users[qq_id] = quarantine.next_retry_time
+        return quarantine.next_retry_time
+    else:
+        quarantine.retry_count += 1
+
+    if quarantine.retry_count >= TOKEN_QUARANTINE_MAX_RETRIES:
+        next_retry_time = 0
+    else:
+        next_retry_time = now + TOKEN_QUARANTINE_BASE_DELAY * 2 ** quarantine.retry_count
+    quarantine.next_retry_time = next_retry_time
+    await user_data_database.update_token_quarantine(quarantine)
+    await user_data_database.commit()
+    quarantined_users[qq_id] = next_retry_time
+    if next_retry_time:
+        logger.warning(f"登录凭证失效: {qq_id}，{next_retry_time - now}秒后重新检查")
+    else:
+        logger.warning(f"登录凭证失效: {qq_id}，已停止监控，等待重新登录")
+    return next_retry_time
+
+async def release_token_quarantine(user_data_database: UserDataDatabase, qq_id: int):
+    """凭证失效的用户请求恢复正常时解除隔离"""
+    if qq_id not in quarantined_users:
+        return
+    await user_data_database.delete_token_quarantine(qq_id)
+    await user_data_database.commit()
+    quarantined_users.pop(qq_id, None)
+    logger.info(f"登录凭证恢复: {qq_id}")
 
-async def send_safehouse_message(qq_id: int, object_name: str, left_time: int):
-    await asyncio.sleep(left_time)
+async def clear_token_quarantine(user_data_database: UserDataDatabase, qq_id: int):
+    """用户重新登录后解除凭证失效隔离，并恢复已停止的特勤处监控"""
+    await user_data_database.delete_token_quarantine(qq_id)
+    await user_data_database.commit()
+    quarantined_users.pop(qq_id, None)
+    user_data = await user_data_database.get_user_data(qq_id)
+    if user_data and user_data.if_remind_safehouse and is_watch_owner(qq_id) and qq_id not in safehouse_poll_queue:
+        safehouse_poll_queue.push(qq_id, time.time())
+
+async def watch_all_record(qq_id: int, user_name: str = ''):
+    """监控用户战绩，烽火和战场战绩同时获取，共用一个数据库会话和请求客户端"""
+    # 上游熔断期间跳过本轮检查，下一轮再获取
+    if not upstream_available():
+        return
+    tick_start = time.perf_counter()
     session = get_session()
     user_data_database = UserDataDatabase(session)
-    user_data = await user_data_database.get_user_data(qq_id)
-    if not user_data:
+    deltaapi = None
+    try:
+        user_data = await user_data_database.get_user_data(qq_id)
+        # 用户已关闭播报或已分配给其他实例时停止本实例的监控任务
+        if not user_data or not user_data.if_broadcast_record or not is_watch_owner(qq_id):
+            job = scheduler.get_job(f'delta_watch_record_{qq_id}')
+            if job:
+                job.remove()
+            return
+        # 提交前先取出后续需要的属性
+        access_token = user_data.access_token
+        openid = user_data.openid
+        group_id = user_data.group_id
+        stored_user_name = user_data.user_name
+        deltaapi = DeltaApi(user_data.platform, background=True)
+        if not user_name:
+            user_name = await resolve_user_name(deltaapi, qq_id, access_token, openid)
+
+        # 以周报统计进度作为检查点，获取检查点之后的所有战绩
+        engine = WeeklyReportEngine(user_data_database)
+        last_sol_time = await engine.get_last_event_time(qq_id, 'sol')
+        last_tdm_time = await engine.get_last_event_time(qq_id, 'tdm')
+        (gun_records, sol_reached), (operator_records, tdm_reached) = await asyncio.gather(
+            fetch_unseen_records(deltaapi, access_token, openid, 4, last_sol_time),
+            fetch_unseen_records(deltaapi, access_token, openid, 5, last_tdm_time)
+        )
+        # 登录凭证失效时推迟或停止监控，不再每轮请求
+        if deltaapi.auth_expired:
+            next_retry_time = await quarantine_user(user_data_database, qq_id)
+            job = scheduler.get_job(f'delta_watch_record_{qq_id}')
+            if job and next_retry_time:
+                job.modify(next_run_time=datetime.datetime.fromtimestamp(next_retry_time))
+            elif job:
+                job.remove()
+            return
+        await release_token_quarantine(user_data_database, qq_id)
+
+        # 累计本地周报统计，得到本次新增的战绩
+        # 长时间未检查（停机、关闭播报、凭证失效、上游熔断）后翻页达到上限仍未到达检查点时，
+        # 中间的战绩无法再获取，相关周的本地统计会标记为不完整，周报改用官方接口
+        if last_sol_time and not sol_reached:
+            logger.warning(f"烽火战绩翻页{RECORD_MAX_PAGES}页仍未到达已统计的战绩，中间的战绩将不计入本地周报: {qq_id}")
+        if last_tdm_time and not tdm_reached:
+            logger.warning(f"战场战绩翻页{RECORD_MAX_PAGES}页仍未到达已统计的战绩，中间的战绩将不计入本地周报: {qq_id}")
+        if not await verify_watch_owner(user_data_database):
+            return
+        new_gun_records = await engine.ingest_sol_records(qq_id, gun_records, sol_reached) if gun_records else []
+        new_operator_records = await engine.ingest_tdm_records(qq_id, operator_records, tdm_reached) if operator_records else []
+        if not new_gun_records and not new_operator_records:
+            return
+        # 角色名变化时保存，重建排行榜时从数据库读取
+        resolved_user_name = user_name_cache.get(qq_id)
+        if resolved_user_name and resolved_user_name != stored_user_name:
+            await user_data_database.update_user_name(qq_id, resolved_user_name)
+        await group_leaderboard.update_user(user_data_database, qq_id, group_id, user_name)
+        await user_data_database.commit()
+
+        if not await verify_watch_owner(user_data_database):
+            return
+        latest_record_data = await user_data_database.get_latest_record(qq_id)
+        sol_record_id = await process_sol_records(
+            group_id, user_name, new_gun_records,
+            latest_record_data.latest_record_id if latest_record_data else None
+        )
+        tdm_record_id = await process_tdm_records(
+            group_id, user_name, new_operator_records,
+            latest_record_data.latest_tdm_record_id if latest_record_data else None
+        )
+        if not sol_record_id and not tdm_record_id:
+            return
+
+        # 两种模式的播报进度一次写入
+        if not latest_record_data:
+            latest_record_data = LatestRecord(
+                qq_id=qq_id,
+                latest_record_id="",
+                latest_tdm_record_id=""
+            )
+        if sol_record_id:
+            latest_record_data.latest_record_id = sol_record_id
+        if tdm_record_id:
+            latest_record_data.latest_tdm_record_id = tdm_record_id
+        record_ids = ', '.join(record_id for record_id in (sol_record_id, tdm_record_id) if record_id)
+        if await user_data_database.update_latest_record(latest_record_data):
+            await user_data_database.commit()
+            logger.info(f"更新最新战绩记录成功: {user_name} - {record_ids}")
+        else:
+            logger.error(f"更新最新战绩记录失败: {user_name} - {record_ids}")
+    except Exception as e:
+        logger.exception(f"监控战绩失败: {qq_id} - {e}")
+    finally:
         await session.close()
+        if deltaapi:
+            await deltaapi.close()
+        watcher_tick_latency.observe(time.perf_counter() - tick_start, watcher='record')
+
+async def send_safehouse_message(key: tuple[int, str], push_time: float):
+    """特勤处设备到达完成时间时发送提醒"""
+    qq_id, device_id = key
+    if not is_watch_owner(qq_id):
         return
+    session = get_session()
+    user_data_database = UserDataDatabase(session)
+    try:
+        safehouse_record = await user_data_database.get_safehouse_record(qq_id, device_id)
+        # 记录已被删除或完成时间已变化（取消或重新生产），以新的记录为准
+        if not safehouse_record or safehouse_record.push_time != push_time:
+            return
+        object_name = safehouse_record.object_name
 
-    if user_data.if_remind_safehouse:
-        message = Mention(user_id=str(qq_id)) + Text(f" {object_name}生产完成！")
-        
-        await message.send_to(target=TargetQQGroup(group_id=user_data.group_id))
-        logger.info(f"特勤处生产完成提醒: {qq_id} - {object_name}")
+        if not await verify_watch_owner(user_data_database):
+            return
+        user_data = await user_data_database.get_user_data(qq_id)
+        if user_data and user_data.if_remind_safehouse and user_data.group_id != 0:
+            group_id = user_data.group_id
+            message = Mention(user_id=str(qq_id)) + Text(f" {object_name}生产完成！")
+            try:
+                await message.send_to(target=TargetQQGroup(group_id=group_id))
+            except Exception:
+                broadcasts_sent.inc(kind='safehouse', result='error')
+                raise
+            broadcasts_sent.inc(kind='safehouse', result='ok')
+            logger.info(f"特勤处生产完成提醒: {qq_id} - {object_name}")
 
-    await session.close()
+        await user_data_database.delete_safehouse_record(qq_id, device_id)
+        await user_data_database.commit()
+    except Exception as e:
+        logger.exception(f"发送特勤处提醒失败: {e}")
+    finally:
+        await session.close()
+
+# 特勤处提醒队列，按设备完成时间触发提醒
+safehouse_reminder_queue: DeadlineQueue[tuple[int, str]] = DeadlineQueue('delta_safehouse_reminder', send_safehouse_message)
 
-async def watch_safehouse(qq_id: int):
-    """监控特勤处生产状态"""
+async def load_safehouse_reminders():
+    """从数据库恢复特勤处提醒队列，停机期间已完成的设备会立即提醒"""
     session = get_session()
     user_data_database = UserDataDatabase(session)
-    user_data = await user_data_database.get_user_data(qq_id)
-    if not user_data:
+    try:
+        deadlines = await user_data_database.get_safehouse_deadlines()
+        count = 0
+        for qq_id, device_id, push_time in deadlines:
+            if is_watch_owner(qq_id):
+                safehouse_reminder_queue.push((qq_id, device_id), push_time)
+                count += 1
+        logger.info(f"恢复特勤处提醒: {count}个设备")
+    except Exception as e:
+        logger.exception(f"恢复特勤处提醒失败: {e}")
+    finally:
         await session.close()
-        return
-    
+
+async def watch_safehouse(qq_id: int, deadline: float = 0):
+    """监控特勤处生产状态，并根据设备完成时间安排下一次检查"""
+    tick_start = time.perf_counter()
+    session = get_session()
+    user_data_database = UserDataDatabase(session)
+    # 获取失败（包括读取数据库失败）时按闲置间隔重试，为None时不再安排检查
+    next_poll_time: float|None = time.time() + SAFEHOUSE_CHECK_INTERVAL
+    deltaapi = None
     try:
-        deltaapi = DeltaApi(user_data.platform)
+        user_data = await user_data_database.get_user_data(qq_id)
+        if not user_data or not user_data.if_remind_safehouse or not is_watch_owner(qq_id):
+            next_poll_time = None
+            return
+
+        # 上游熔断期间推迟检查
+        if not upstream_available():
+            next_poll_time = time.time() + SAFEHOUSE_OUTAGE_RETRY_INTERVAL
+            return
+        deltaapi = DeltaApi(user_data.platform, background=True)
         res = await deltaapi.get_safehousedevice_status(user_data.access_token, user_data.openid)
         
+        # 登录凭证失效时推迟检查，超过重试次数后不再检查
+        if deltaapi.auth_expired:
+            next_poll_time = await quarantine_user(user_data_database, qq_id) or None
+            return
+        await release_token_quarantine(user_data_database, qq_id)
+
         if not res['status']:
             logger.error(f"获取特勤处状态失败: {res['message']}")
-            await session.close()
+            return
+        # 已失去主实例租约时不再写入，由新的主实例继续检查
+        if not await verify_watch_owner(user_data_database):
+            next_poll_time = None
             return
         
         place_data = res['data'].get('placeData', [])
         relate_map = res['data'].get('relateMap', {})
         
         # 获取当前用户的特勤处记录
-        current_records = await user_data_database.get_safehouse_records(qq_id)
-        current_device_ids = {record.device_id for record in current_records}
+        current_records = {record.device_id: record.push_time for record in await user_data_database.get_safehouse_records(qq_id)}
+        deadlines: dict[str, int] = {}
+        has_idle_device = False
         info = ""
+        now = int(time.time())
 
         # 处理每个设备的状态
         for device in place_data:
@@ -1595,7 +1849,13 @@ async def watch_safehouse(qq_id: int):
                 # 获取物品信息
                 object_info = relate_map.get(str(object_id), {})
                 object_name = object_info.get('objectName', f'物品{object_id}')
+                push_time = device.get('pushTime') or now + left_time
                 
+                info += f"{place_name} - {object_name} - 剩余{left_time}秒\n"
+                deadlines[device_id] = push_time
+                if current_records.get(device_id) == push_time:
+                    continue
+
                 # 创建或更新记录
                 safehouse_record = SafehouseRecord(
                     qq_id=qq_id,
@@ -1604,27 +1864,30 @@ async def watch_safehouse(qq_id: int):
                     object_name=object_name,
                     place_name=place_name,
                     left_time=left_time,
-                    push_time=device.get('pushTime', 0)
+                    push_time=push_time
                 )
-                info += f"{place_name} - {object_name} - 剩余{left_time}秒\n"
-                
                 await user_data_database.update_safehouse_record(safehouse_record)
-                current_device_ids.discard(device_id)
-                
-                # 剩余时间小于检查间隔加60s，启动发送提醒任务
-                if left_time <= SAFEHOUSE_CHECK_INTERVAL + 60:
-                    logger.info(f"{left_time}秒后启动发送提醒任务: {qq_id} - {device_id}")
-                    # 启动发送提醒任务
-                    scheduler.add_job(send_safehouse_message, 'date', run_date=datetime.datetime.now(), id=f'delta_send_safehouse_message_{qq_id}_{device_id}', replace_existing=True, kwargs={'qq_id': qq_id, 'object_name': object_name, 'left_time': left_time}, max_instances=1)
-                    
-                    # 删除记录
-                    await user_data_database.delete_safehouse_record(qq_id, device_id)
+            else:
+                has_idle_device = True
         
-        # 删除已完成的记录（设备不再生产）
-        for device_id in current_device_ids:
-            await user_data_database.delete_safehouse_record(qq_id, device_id)
+        # 删除提前结束的记录（设备不再生产），已到完成时间的记录留给提醒任务处理
+        for device_id, push_time in current_records.items():
+            if device_id not in deadlines and push_time > now:
+                await user_data_database.delete_safehouse_record(qq_id, device_id)
+                safehouse_reminder_queue.remove((qq_id, device_id))
         
         await user_data_database.commit()
+        for device_id, push_time in deadlines.items():
+            safehouse_reminder_queue.push((qq_id, device_id), push_time)
+        # 已到完成时间但不在提醒队列中的记录（写入后入队前出错）重新入队，立即提醒
+        for device_id, push_time in current_records.items():
+            if device_id not in deadlines and push_time <= now:
+                safehouse_reminder_queue.push((qq_id, device_id), push_time)
+
+        # 有闲置设备时按固定间隔检查以发现新的生产，否则在最早完成的设备完成后再检查
+        next_poll_time = now + (SAFEHOUSE_CHECK_INTERVAL if has_idle_device else SAFEHOUSE_GUARD_INTERVAL)
+        if deadlines:
+            next_poll_time = min(next_poll_time, min(deadlines.values()) + SAFEHOUSE_FINISH_DELAY)
         if info != "":
             logger.info(f"{qq_id}特勤处状态: {info}")
         else:
@@ -1634,40 +1897,158 @@ async def watch_safehouse(qq_id: int):
         logger.exception(f"监控特勤处状态失败: {e}")
     finally:
         await session.close()
+        if deltaapi:
+            await deltaapi.close()
+        if next_poll_time is not None:
+            safehouse_poll_queue.push(qq_id, next_poll_time)
+        watcher_tick_latency.observe(time.perf_counter() - tick_start, watcher='safehouse')
+
+# 特勤处状态检查队列，所有用户共用，按下一次检查时间触发
+safehouse_poll_queue: DeadlineQueue[int] = DeadlineQueue('delta_safehouse_poll', watch_safehouse, concurrency=SAFEHOUSE_POLL_CONCURRENCY)
+
+async def optimize_sqlite():
+    session = get_session()
+    try:
+        engine = session.get_bind(UserData)
+    finally:
+        await session.close()
+    try:
+        profile = await apply_sqlite_profile(engine)
+    except Exception as e:
+        logger.exception(f"应用SQLite连接参数失败: {e}")
+        return
+    if profile is None:
+        return
+
+    mismatched = {key: value for key, value in profile.items() if str(value).lower() != str(SQLITE_PRAGMAS[key]).lower()}
+    profile_str = ', '.join(f"{key}={value}" for key, value in profile.items())
+    if mismatched:
+        logger.warning(f"SQLite连接参数未完全生效: {profile_str}")
+    else:
+        logger.info(f"已应用SQLite连接参数: {profile_str}")
 
 async def start_watch_record():
+    # 未分片时监控名单只由主实例扫描
+    if shard_coordinator is None and not is_leader():
+        return
     session = get_session()
     user_data_database = UserDataDatabase(session)
-    user_data_list = await user_data_database.get_user_data_list()
-    for user_data in user_data_list:
-        deltaapi = DeltaApi(user_data.platform)
-        try:
-            # 提前获取所有需要的属性，避免在调度器中访问ORM对象
-            qq_id = user_data.qq_id
-            access_token = user_data.access_token
-            openid = user_data.openid
-            if_remind_safehouse = user_data.if_remind_safehouse
-            if_broadcast_record = user_data.if_broadcast_record
-            
-            res = await deltaapi.get_player_info(access_token=access_token, openid=openid)
-            if res['status'] and 'charac_name' in res['data']['player']:
-                user_name = res['data']['player']['charac_name']
-                if enable_broadcast_record and if_broadcast_record:
-                    logger.info(f"启动战绩监控任务: {qq_id} - {user_name}")
-                    scheduler.add_job(watch_all_record, 'interval', seconds=interval, id=f'delta_watch_record_{qq_id}', next_run_time=datetime.datetime.now() + datetime.timedelta(seconds=10), replace_existing=True, kwargs={'user_name': user_name, 'qq_id': qq_id}, max_instances=1)
-                
+    user_count = 0
+    try:
+        quarantined_users.clear()
+        for quarantine in await user_data_database.get_token_quarantine_list():
+            quarantined_users[quarantine.qq_id] = quarantine.next_retry_time
+
+        # 分批读取监控名单，启动时不再逐个请求角色信息，角色名在首次监控时再获取
+        async for roster in user_data_database.iter_watch_roster(include_broadcast=enable_broadcast_record):
+            for user in roster:
+                if not is_watch_owner(user.qq_id):
+                    continue
+                # 登录凭证失效且已停止监控的用户等待重新登录
+                retry_time = quarantined_users.get(user.qq_id)
+                if retry_time == 0:
+                    continue
+                user_count += 1
+                # 按QQ号错开首次执行时间，避免大量任务同时请求；凭证失效的用户推迟到下一次检查时间
+                first_run_time = max(time.time() + 10 + user.qq_id % interval, retry_time or 0)
+                if enable_broadcast_record and user.if_broadcast_record and not scheduler.get_job(f'delta_watch_record_{user.qq_id}'):
+                    next_run_time = datetime.datetime.fromtimestamp(first_run_time)
+                    scheduler.add_job(watch_all_record, 'interval', seconds=interval, id=f'delta_watch_record_{user.qq_id}', next_run_time=next_run_time, replace_existing=True, kwargs={'qq_id': user.qq_id}, max_instances=1)
+
                 # 添加特勤处监控任务
-                if if_remind_safehouse:
-                    logger.info(f"启动特勤处监控任务: {qq_id} - {user_name}")
-                    scheduler.add_job(watch_safehouse, 'interval', seconds=SAFEHOUSE_CHECK_INTERVAL, id=f'delta_watch_safehouse_{qq_id}', next_run_time=datetime.datetime.now() + datetime.timedelta(seconds=10), replace_existing=True, kwargs={'qq_id': qq_id}, max_instances=1)
+                if user.if_remind_safehouse and user.qq_id not in safehouse_poll_queue:
+                    safehouse_poll_queue.push(user.qq_id, max(time.time() + 10 + user.qq_id % SAFEHOUSE_CHECK_INTERVAL, retry_time or 0))
+        logger.info(f"启动监控任务完成: 共{user_count}个用户")
+    except Exception as e:
+        logger.exception(f"启动战绩监控失败: {e}")
+    finally:
+        await session.close()
 
-            else:
-                continue
-        except Exception as e:
-            logger.exception(f"启动战绩监控失败")
-            continue
+async def rebalance_watchers():
+    """按当前的分片归属重新分配本实例的监控任务"""
+    for job in scheduler.get_jobs():
+        if job.id.startswith('delta_watch_record_') and not is_watch_owner(int(job.id.removeprefix('delta_watch_record_'))):
+            job.remove()
+    for qq_id in safehouse_poll_queue.keys():
+        if not is_watch_owner(qq_id):
+            safehouse_poll_queue.remove(qq_id)
+    for qq_id, device_id in safehouse_reminder_queue.keys():
+        if not is_watch_owner(qq_id):
+            safehouse_reminder_queue.remove((qq_id, device_id))
+    await load_safehouse_reminders()
+    await start_watch_record()
 
-    await session.close()
+async def shard_heartbeat(rebalance: bool = True):
+    """分片监控实例心跳，存活实例变化时重新分配监控任务"""
+    if shard_coordinator is None:
+        return
+    session = get_session()
+    try:
+        changed = await shard_coordinator.heartbeat(UserDataDatabase(session))
+    except Exception as e:
+        logger.exception(f"分片监控心跳失败: {e}")
+        return
+    finally:
+        await session.close()
+    if changed and rebalance:
+        await rebalance_watchers()
+
+async def leader_heartbeat():
+    """续期主实例租约，未分片时主实例变化需要重新分配监控任务"""
+    if leader_elector is None:
+        return
+    was_leader = leader_elector.is_leader
+    session = get_session()
+    try:
+        await leader_elector.renew(UserDataDatabase(session))
+    except Exception as e:
+        logger.exception(f"续期主实例租约失败: {e}")
+    finally:
+        await session.close()
+    if shard_coordinator is None and leader_elector.is_leader != was_leader:
+        await rebalance_watchers()
+
+def record_watcher_backlog() -> int:
+    """已到检查时间但还未开始执行的战绩监控任务数"""
+    now = datetime.datetime.now(datetime.timezone.utc)
+    return sum(
+        1 for job in scheduler.get_jobs()
+        if job.id.startswith('delta_watch_record_') and job.next_run_time and job.next_run_time <= now
+    )
+
+watcher_backlog.set_function(record_watcher_backlog, watcher='record')
+watcher_backlog.set_function(safehouse_poll_queue.backlog, watcher='safehouse')
+
+async def handle_metrics(request: Request) -> Response:
+    return Response(200, headers={'Content-Type': CONTENT_TYPE}, content=registry.render())
+
+async def dump_metrics():
+    """把运行指标写入文件，先写临时文件再替换，避免读取到写了一半的内容"""
+    try:
+        tmp_file = f"{metrics_file}.tmp"
+        with open(tmp_file, 'w', encoding='utf-8') as f:
+            f.write(registry.render())
+        os.replace(tmp_file, metrics_file)
+    except Exception as e:
+        logger.exception(f"写入运行指标失败: {e}")
+
+async def instrument_database():
+    """统计插件数据库引擎执行的语句数"""
+    session = get_session()
+    try:
+        instrument_engine(session.get_bind(UserData))
+    except Exception as e:
+        logger.exception(f"统计数据库语句失败: {e}")
+    finally:
+        await session.close()
+
+# 运行指标HTTP接口，需要驱动支持HTTP服务端（如FastAPI）
+if metrics_path:
+    if isinstance(driver, ASGIMixin):
+        driver.setup_http_server(HTTPServerSetup(URL(metrics_path), 'GET', 'delta_helper_metrics', handle_metrics))
+        logger.info(f"已开启运行指标接口: {metrics_path}")
+    else:
+        logger.warning("当前驱动不支持HTTP服务端，无法开启运行指标接口，可以改用delta_helper_metrics_file写入文件")
 
 enable_auto_select_bot()
 
@@ -1675,6 +2056,42 @@ enable_auto_select_bot()
 @driver.on_startup
 async def initialize_plugin():
     """插件初始化"""
+    # 最先启动事件循环监控，初始化过程中的阻塞也能发现
+    if loop_lag_monitor is not None:
+        loop_lag_monitor.start()
+    # 使用SQLite时自动应用连接参数
+    if enable_sqlite_optimize:
+        await optimize_sqlite()
+    await instrument_database()
+    logger.info(f"JSON解析后端: {JSON_BACKEND}")
+    if config.delta_helper_trace_file:
+        scheduler.add_job(flush_traces, 'interval', seconds=TRACE_FLUSH_INTERVAL, id='delta_flush_traces', replace_existing=True, max_instances=1)
+    if metrics_file:
+        scheduler.add_job(dump_metrics, 'interval', seconds=METRICS_DUMP_INTERVAL, id='delta_dump_metrics', replace_existing=True, max_instances=1)
+    # 加载群排行榜
+    await refresh_leaderboard()
+    # 分片模式下先加入集群，再只为分配给本实例的用户启动监控
+    if shard_coordinator is not None:
+        await shard_heartbeat(rebalance=False)
+        scheduler.add_job(shard_heartbeat, 'interval', seconds=SHARD_HEARTBEAT_INTERVAL, id='delta_shard_heartbeat', replace_existing=True, max_instances=1)
+        scheduler.add_job(rebalance_watchers, 'interval', seconds=SHARD_RESCAN_INTERVAL, id='delta_shard_rescan', replace_existing=True, max_instances=1)
+        logger.info(f"已开启分片监控: {shard_coordinator.instance_id}")
+    # 主实例模式下先竞争租约
+    if leader_elector is not None:
+        session = get_session()
+        try:
+            await leader_elector.renew(UserDataDatabase(session))
+        except Exception as e:
+            logger.exception(f"获取主实例租约失败: {e}")
+        finally:
+            await session.close()
+        scheduler.add_job(leader_heartbeat, 'interval', seconds=LEADER_RENEW_INTERVAL, id='delta_leader_heartbeat', replace_existing=True, max_instances=1)
+        # 未分片时主实例同样定期重新扫描监控名单，接管在其他实例登录或开启播报的用户
+        if shard_coordinator is None:
+            scheduler.add_job(rebalance_watchers, 'interval', seconds=SHARD_RESCAN_INTERVAL, id='delta_leader_rescan', replace_existing=True, max_instances=1)
+    # 恢复特勤处提醒
+    await load_safehouse_reminders()
+    scheduler.add_job(refresh_leaderboard, 'interval', seconds=LEADERBOARD_REFRESH_INTERVAL, id='delta_refresh_leaderboard', replace_existing=True, max_instances=1)
     # 启动战绩监控
     await start_watch_record()
     await get_renderer()
@@ -1684,6 +2101,31 @@ async def initialize_plugin():
 @driver.on_shutdown
 async def cleanup_plugin():
     """插件清理"""
+    # 释放主实例租约，其他实例在下一次续期时接管
+    if leader_elector is not None:
+        session = get_session()
+        try:
+            await leader_elector.release(UserDataDatabase(session))
+        except Exception as e:
+            logger.exception(f"释放主实例租约失败: {e}")
+        finally:
+            await session.close()
+    # 退出分片集群，其他实例在下一次心跳时接管
+    if shard_coordinator is not None:
+        session = get_session()
+        try:
+            await shard_coordinator.leave(UserDataDatabase(session))
+        except Exception as e:
+            logger.exception(f"退出分片监控失败: {e}")
+        finally:
+            await session.close()
+    # 关闭前写入最后一次运行指标和缓冲的链路
+    if metrics_file:
+        await dump_metrics()
+    await flush_traces()
     # 关闭渲染器
     await close_renderer()
+    cpu_policy.shutdown()
+    if loop_lag_monitor is not None:
+        await loop_lag_monitor.stop()
     logger.info("三角洲助手插件清理完成")
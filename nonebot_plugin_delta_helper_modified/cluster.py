@@ -0,0 +1,174 @@
+"""
+多实例部署模块
+多个机器人实例共用一个数据库时，分片模式下每个实例在租约表中定期心跳，
+根据存活实例构建一致性哈希环，每个实例只监控哈希到自己的用户；
+实例加入或离开时各实例重新计算归属，只有少量用户会迁移到其他实例。
+主实例模式下各实例竞争同一行带有效期的租约，只有持有租约的实例执行全局任务
+"""
+import bisect
+import hashlib
+import time
+from nonebot.log import logger
+
+from .db import UserDataDatabase
+from .model import LeaderLease
+
+# 每个实例在哈希环上的虚拟节点数，越多分布越均匀
+VIRTUAL_NODES = 64
+
+
+def _hash(key: str) -> int:
+    return int.from_bytes(hashlib.md5(key.encode()).digest()[:8], 'big')
+
+
+class HashRing:
+    """一致性哈希环"""
+
+    def __init__(self, instance_ids: list[str]):
+        self.instance_ids = sorted(instance_ids)
+        self._points: list[int] = []
+        self._owners: list[str] = []
+        for point, instance_id in sorted(
+            (_hash(f"{instance_id}#{i}"), instance_id)
+            for instance_id in self.instance_ids
+            for i in range(VIRTUAL_NODES)
+        ):
+            self._points.append(point)
+            self._owners.append(instance_id)
+
+    def owner(self, qq_id: int) -> str|None:
+        """获取用户所属的实例ID，环为空时返回None"""
+        if not self._points:
+            return None
+        index = bisect.bisect(self._points, _hash(str(qq_id))) % len(self._points)
+        return self._owners[index]
+
+
+class ShardCoordinator:
+    """分片协调器，维护本实例的租约和当前的哈希环"""
+
+    def __init__(self, instance_id: str, lease_ttl: int):
+        """
+        Args:
+            instance_id: 本实例ID，各实例必须不同
+            lease_ttl: 租约有效期（秒），超过该时间没有心跳的实例视为离开
+        """
+        self.instance_id = instance_id
+        self.lease_ttl = lease_ttl
+        self.ring = HashRing([instance_id])
+
+    def owns(self, qq_id: int) -> bool:
+        """判断用户是否由本实例监控"""
+        return self.ring.owner(qq_id) == self.instance_id
+
+    async def heartbeat(self, user_data_database: UserDataDatabase) -> bool:
+        """
+        更新本实例心跳并刷新存活实例列表
+
+        Returns:
+            存活实例是否发生变化，变化时需要重新分配监控任务
+        """
+        now = int(time.time())
+        min_heartbeat_time = now - self.lease_ttl
+        await user_data_database.heartbeat_watcher_instance(self.instance_id, now)
+        await user_data_database.delete_expired_watcher_instances(min_heartbeat_time)
+        await user_data_database.commit()
+
+        instance_ids = await user_data_database.get_live_watcher_instances(min_heartbeat_time)
+        if self.instance_id not in instance_ids:
+            instance_ids.append(self.instance_id)
+        if sorted(instance_ids) == self.ring.instance_ids:
+            return False
+        logger.info(f"监控实例变化: {self.ring.instance_ids} -> {sorted(instance_ids)}")
+        self.ring = HashRing(instance_ids)
+        return True
+
+    async def leave(self, user_data_database: UserDataDatabase) -> None:
+        """删除本实例租约，其他实例在下一次心跳时接管本实例的用户"""
+        await user_data_database.delete_watcher_instance(self.instance_id)
+        await user_data_database.commit()
+
+
+class LeaderElector:
+    """基于数据库租约的主实例选举"""
+
+    def __init__(self, name: str, instance_id: str, lease_ttl: int):
+        """
+        Args:
+            name: 租约名称
+            instance_id: 本实例ID，各实例必须不同
+            lease_ttl: 租约有效期（秒），主实例超过该时间没有续期时其他实例可以接管
+        """
+        self.name = name
+        self.instance_id = instance_id
+        self.lease_ttl = lease_ttl
+        self.token = 0
+        self._expire_time = 0.0
+
+    @property
+    def is_leader(self) -> bool:
+        """本实例当前是否持有有效的租约"""
+        return self._expire_time > time.time()
+
+    async def renew(self, user_data_database: UserDataDatabase) -> bool:
+        """
+        获取或续期租约
+
+        Returns:
+            本实例是否为主实例
+        """
+        was_leader = self.is_leader
+        # 以发起请求的时间计算本地有效期，保证本地认为的有效期不晚于数据库中的
+        now = time.time()
+        expire_time = int(now) + self.lease_ttl
+        lease = await user_data_database.get_leader_lease(self.name)
+        if lease is None:
+            token = 1
+            acquired = await user_data_database.add_leader_lease(
+                LeaderLease(name=self.name, holder=self.instance_id, token=token, expire_time=expire_time)
+            )
+        elif lease.holder == self.instance_id or lease.expire_time < now:
+            # 从其他实例接管时令牌加一，旧的主实例凭旧令牌无法再续期
+            token = lease.token if lease.holder == self.instance_id else lease.token + 1
+            acquired = await user_data_database.update_leader_lease(
+                self.name, lease.token, self.instance_id, token, expire_time, int(now)
+            )
+        else:
+            acquired = False
+        await user_data_database.commit()
+
+        if acquired:
+            self.token = token
+            self._expire_time = now + self.lease_ttl
+            if not was_leader:
+                logger.info(f"成为主实例: {self.instance_id} - 令牌{token}")
+        else:
+            self._expire_time = 0.0
+            if was_leader:
+                logger.warning(f"失去主实例租约: {self.instance_id}")
+        return acquired
+
+    async def verify(self, user_data_database: UserDataDatabase) -> bool:
+        """
+        按数据库中的租约确认本实例仍是主实例，用于播报和写入数据库前的令牌检查。
+        本地有效期内租约也可能已被其他实例接管（如本实例长时间卡顿后恢复），令牌或持有者不一致时立即放弃主实例身份
+
+        Returns:
+            本实例是否仍为主实例
+        """
+        if not self.is_leader:
+            return False
+        lease = await user_data_database.get_leader_lease(self.name)
+        if lease is not None and lease.holder == self.instance_id and lease.token == self.token and lease.expire_time > time.time():
+            return True
+        self._expire_time = 0.0
+        logger.warning(f"主实例租约已被接管: {self.instance_id} - 令牌{self.token}")
+        return False
+
+    async def release(self, user_data_database: UserDataDatabase) -> None:
+        """释放租约，其他实例可以立即接管"""
+        if not self.is_leader:
+            return
+        self._expire_time = 0.0
+        await user_data_database.update_leader_lease(self.name, self.token, self.instance_id, self.token, 0, int(time.time()))
+        await user_data_database.commit()
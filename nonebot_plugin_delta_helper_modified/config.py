@@ -8,4 +8,14 @@ class Config(BaseModel):
     delta_helper_ai_model: str = ""
     delta_helper_ai_proxy: str = ""
     delta_helper_request_proxy: str = ""
+    delta_helper_request_rate_limit: float = 20
     delta_helper_enable_broadcast_record: bool = True
+    delta_helper_sqlite_optimize: bool = True
+    delta_helper_shard_enable: bool = False
+    delta_helper_instance_id: str = ""
+    delta_helper_leader_enable: bool = False
+    delta_helper_metrics_path: str = ""
+    delta_helper_metrics_file: str = ""
+    delta_helper_trace_file: str = ""
+    delta_helper_slow_command_threshold: float = 10
+    delta_helper_slow_callback_threshold: float = 0.5
@@ -1,8 +1,65 @@
 from nonebot_plugin_orm import async_scoped_session, AsyncSession
 from nonebot.log import logger
-from .model import UserData, LatestRecord, SafehouseRecord
+from .model import UserData, LatestRecord, SafehouseRecord, WeeklyReportStat, WatcherInstance, LeaderLease, TokenQuarantine
+from .trace import trace_methods
+from typing import Any, AsyncIterator, Literal, Optional
+from sqlalchemy import Engine, delete, event, or_, update
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.ext.asyncio import AsyncEngine
 from sqlalchemy.future import select
 
+# SQLite连接参数：WAL模式下读写互不阻塞，synchronous=NORMAL在WAL模式下不会损坏数据库
+SQLITE_PRAGMAS: dict[str, Any] = {
+    'journal_mode': 'wal',
+    'synchronous': 1,  # NORMAL
+    'busy_timeout': 5000,  # 毫秒，数据库被锁时等待而不是直接报错
+    'cache_size': -16000,  # 负数单位为KiB，约16MB
+    'mmap_size': 134217728,  # 128MB
+}
+
+def _set_sqlite_pragmas(dbapi_connection, connection_record) -> None:
+    cursor = dbapi_connection.cursor()
+    try:
+        for key, value in SQLITE_PRAGMAS.items():
+            cursor.execute(f"PRAGMA {key}={value}")
+    finally:
+        cursor.close()
+
+async def apply_sqlite_profile(engine: Engine) -> Optional[dict[str, Any]]:
+    """
+    为SQLite数据库的每个连接应用性能参数
+
+    Args:
+        engine: 插件模型绑定的数据库引擎
+
+    Returns:
+        从数据库读回的实际参数，不是SQLite时返回None
+    """
+    if engine.dialect.name != 'sqlite':
+        return None
+    if not event.contains(engine, 'connect', _set_sqlite_pragmas):
+        event.listen(engine, 'connect', _set_sqlite_pragmas)
+
+    # 连接池中已有的连接创建于注册之前，重建连接池使参数对所有连接生效
+    async_engine = AsyncEngine(engine)
+    await async_engine.dispose()
+
+    async with async_engine.connect() as conn:
+        return {key: (await conn.exec_driver_sql(f"PRAGMA {key}")).scalar() for key in SQLITE_PRAGMAS}
+
+class WatchRosterEntry:
+    """监控名单中的单个用户，只包含启动监控所需的字段"""
+    __slots__ = ('qq_id', 'group_id', 'openid', 'platform', 'if_broadcast_record', 'if_remind_safehouse')
+
+    def __init__(self, qq_id: int, group_id: int, openid: str, platform: str, if_broadcast_record: bool, if_remind_safehouse: bool) -> None:
+        self.qq_id = qq_id
+        self.group_id = group_id
+        self.openid = openid
+        self.platform = platform
+        self.if_broadcast_record = if_broadcast_record
+        self.if_remind_safehouse = if_remind_safehouse
+
+@trace_methods
 class UserDataDatabase:
     def __init__(self, session: async_scoped_session|AsyncSession) -> None:
         self.session = session
@@ -34,6 +91,32 @@ class UserDataDatabase:
         stmt = select(UserData)
         return list((await self.session.execute(statement=stmt)).scalars().all())
         
+    async def iter_watch_roster(self, include_broadcast: bool = True, chunk_size: int = 500) -> AsyncIterator[list[WatchRosterEntry]]:
+        """
+        分批获取需要启动监控任务的用户名单
+
+        只查询监控所需的列（不含token），走开关字段上的索引，结果以流的方式分批返回，
+        用户量很大时启动速度和内存占用也保持平稳
+
+        Args:
+            include_broadcast: 是否包含开启战绩播报的用户
+            chunk_size: 每批返回的用户数
+        """
+        conditions = [UserData.if_remind_safehouse == True]
+        if include_broadcast:
+            conditions.append(UserData.if_broadcast_record == True)
+        stmt = select(
+            UserData.qq_id,
+            UserData.group_id,
+            UserData.openid,
+            UserData.platform,
+            UserData.if_broadcast_record,
+            UserData.if_remind_safehouse
+        ).where(or_(*conditions)).execution_options(yield_per=chunk_size)
+        result = await self.session.stream(statement=stmt)
+        async for partition in result.partitions(chunk_size):
+            yield [WatchRosterEntry(*row) for row in partition]
+        
     async def commit(self) -> None:
         await self.session.commit()
 
@@ -58,6 +141,19 @@ class UserDataDatabase:
         stmt = select(SafehouseRecord).where(SafehouseRecord.qq_id == qq_id)
         return list((await self.session.execute(statement=stmt)).scalars().all())
 
+    async def get_safehouse_record(self, qq_id: int, device_id: str) -> SafehouseRecord|None:
+        """获取用户单个设备的特勤处生产记录"""
+        return await self.session.get(SafehouseRecord, (qq_id, device_id))
+
+    async def get_safehouse_deadlines(self) -> list[tuple[int, str, int]]:
+        """获取开启特勤处提醒的用户所有生产记录的(qq_id, 设备ID, 完成时间戳)"""
+        stmt = select(
+            SafehouseRecord.qq_id,
+            SafehouseRecord.device_id,
+            SafehouseRecord.push_time
+        ).join(UserData, UserData.qq_id == SafehouseRecord.qq_id).where(UserData.if_remind_safehouse == True)
+        return [tuple(row) for row in (await self.session.execute(statement=stmt)).all()]
+
     async def update_safehouse_record(self, safehouse_record: SafehouseRecord) -> bool:
         """更新特勤处生产记录"""
         try:
@@ -82,4 +178,126 @@ class UserDataDatabase:
         except Exception as e:
             logger.exception(f'删除特勤处生产记录时发生错误')
             await self.session.rollback()
-            return False
\ No newline at end of file
+            return False
+
+    # 周报本地统计相关方法
+    async def get_weekly_report_stat(self, qq_id: int, stat_date: str) -> WeeklyReportStat|None:
+        """获取用户指定周的周报统计"""
+        return await self.session.get(WeeklyReportStat, (qq_id, stat_date))
+
+    async def get_latest_weekly_report_stat(self, qq_id: int) -> WeeklyReportStat|None:
+        """获取用户最近一周的周报统计"""
+        stmt = select(WeeklyReportStat).where(
+            WeeklyReportStat.qq_id == qq_id
+        ).order_by(WeeklyReportStat.stat_date.desc()).limit(1)
+        return (await self.session.execute(statement=stmt)).scalar_one_or_none()
+
+    async def get_group_weekly_report_stats(self, stat_date: str) -> list[tuple[WeeklyReportStat, int, str]]:
+        """获取指定周所有开启战绩播报的群用户的周统计、所在群号和角色名"""
+        stmt = select(WeeklyReportStat, UserData.group_id, UserData.user_name).join(
+            UserData, UserData.qq_id == WeeklyReportStat.qq_id
+        ).where(
+            WeeklyReportStat.stat_date == stat_date,
+            UserData.group_id != 0,
+            UserData.if_broadcast_record == True
+        )
+        return [(row[0], row[1], row[2]) for row in (await self.session.execute(statement=stmt)).all()]
+
+    async def update_user_name(self, qq_id: int, user_name: str) -> None:
+        """更新用户的角色名"""
+        await self.session.execute(update(UserData).where(UserData.qq_id == qq_id).values(user_name=user_name))
+
+    async def mark_weekly_report_stats_incomplete(self, qq_id: int, mode: Literal["sol", "tdm"], start_date: str|None, end_date: str) -> None:
+        """把用户从start_date到end_date（含）各周的周报统计中该模式标记为不完整，start_date为None时从最早的一周开始"""
+        conditions = [WeeklyReportStat.qq_id == qq_id, WeeklyReportStat.stat_date <= end_date]
+        if start_date:
+            conditions.append(WeeklyReportStat.stat_date >= start_date)
+        values = {'sol_complete': False} if mode == 'sol' else {'tdm_complete': False}
+        await self.session.execute(update(WeeklyReportStat).where(*conditions).values(**values))
+
+    async def update_weekly_report_stat(self, weekly_report_stat: WeeklyReportStat) -> bool:
+        """更新周报统计"""
+        try:
+            await self.session.merge(weekly_report_stat)
+            return True
+        except Exception as e:
+            logger.exception(f'更新周报统计时发生错误')
+            await self.session.rollback()
+            return False
+
+    # 分片监控实例租约相关方法
+    async def heartbeat_watcher_instance(self, instance_id: str, heartbeat_time: int) -> bool:
+        """更新实例心跳，实例不存在时创建"""
+        try:
+            await self.session.merge(WatcherInstance(instance_id=instance_id, heartbeat_time=heartbeat_time))
+            return True
+        except Exception as e:
+            logger.exception(f'更新实例心跳时发生错误')
+            await self.session.rollback()
+            return False
+
+    async def get_live_watcher_instances(self, min_heartbeat_time: int) -> list[str]:
+        """获取心跳未过期的实例ID"""
+        stmt = select(WatcherInstance.instance_id).where(WatcherInstance.heartbeat_time >= min_heartbeat_time)
+        return list((await self.session.execute(statement=stmt)).scalars().all())
+
+    async def delete_expired_watcher_instances(self, min_heartbeat_time: int) -> None:
+        """删除心跳已过期的实例"""
+        await self.session.execute(delete(WatcherInstance).where(WatcherInstance.heartbeat_time < min_heartbeat_time))
+
+    async def delete_watcher_instance(self, instance_id: str) -> None:
+        """删除实例租约"""
+        await self.session.execute(delete(WatcherInstance).where(WatcherInstance.instance_id == instance_id))
+
+    # 主实例租约相关方法
+    async def get_leader_lease(self, name: str) -> LeaderLease|None:
+        """获取主实例租约，总是从数据库重新读取，不使用会话中缓存的对象"""
+        return await self.session.get(LeaderLease, name, populate_existing=True)
+
+    async def add_leader_lease(self, leader_lease: LeaderLease) -> bool:
+        """创建主实例租约，其他实例已先创建时返回False"""
+        try:
+            self.session.add(leader_lease)
+            await self.session.flush()
+            return True
+        except IntegrityError:
+            await self.session.rollback()
+            return False
+
+    async def update_leader_lease(self, name: str, expected_token: int, holder: str, token: int, expire_time: int, now: int) -> bool:
+        """
+        更新主实例租约，只有令牌未变化且租约由本实例持有或已过期时才会更新
+
+        Returns:
+            是否更新成功
+        """
+        stmt = update(LeaderLease).where(
+            LeaderLease.name == name,
+            LeaderLease.token == expected_token,
+            or_(LeaderLease.holder == holder, LeaderLease.expire_time < now)
+        ).values(holder=holder, token=token, expire_time=expire_time).execution_options(synchronize_session=False)
+        return (await self.session.execute(stmt)).rowcount == 1
+
+    # 凭证失效隔离相关方法
+    async def get_token_quarantine(self, qq_id: int) -> TokenQuarantine|None:
+        """获取用户的凭证失效隔离记录"""
+        return await self.session.get(TokenQuarantine, qq_id)
+
+    async def get_token_quarantine_list(self) -> list[TokenQuarantine]:
+        """获取所有凭证失效隔离记录，按失效时间排序"""
+        stmt = select(TokenQuarantine).order_by(TokenQuarantine.expired_time)
+        return list((await self.session.execute(statement=stmt)).scalars().all())
+
+    async def update_token_quarantine(self, token_quarantine: TokenQuarantine) -> bool:
+        """更新凭证失效隔离记录"""
+        try:
+            await self.session.merge(token_quarantine)
+            return True
+        except Exception as e:
+            logger.exception(f'更新凭证失效隔离记录时发生错误')
+            await self.session.rollback()
+            return False
+
+    async def delete_token_quarantine(self, qq_id: int) -> None:
+        """删除凭证失效隔离记录"""
+        await self.session.execute(delete(TokenQuarantine).where(TokenQuarantine.qq_id == qq_id))
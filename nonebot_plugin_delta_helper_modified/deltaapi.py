@@ -6,16 +6,25 @@ import base64
 import json
 import urllib.parse
 import re
+from typing import Any
 
 from nonebot import get_plugin_config
 from .util import Util
 from .config import Config
+from .ratelimit import PRIORITY_BACKGROUND, PRIORITY_INTERACTIVE, UpstreamLimiter
+from .resilience import REQUEST_TIMEOUT, CircuitOpenError, get_breaker, send_with_retry
+from .metrics import upstream_latency, upstream_requests
+from .offload import run_cpu
+from . import jsonlib
+from .records import RECORD_TYPES
+from .trace import span, trace_methods
 
 CONSTANTS = {
     'SIG':'https://xui.ptlogin2.qq.com/ssl/ptqrshow',
     'GETLOGINTICKET':'https://xui.ptlogin2.qq.com/cgi-bin/xlogin',
     'GETLOGINSTATUS':'https://ssl.ptlogin2.qq.com/ptqrlogin',
     'GAMEBASEURL':'https://comm.ams.game.qq.com/ide/',
+    'GAMEBASEHOST':'comm.ams.game.qq.com',
 
     ''
 
@@ -28,18 +37,107 @@ CONSTANTS = {
 
 config = get_plugin_config(Config)
 
+# 登录凭证失效时接口返回的ret
+AUTH_EXPIRED_RETS = {101}
+# 登录凭证失效时接口返回的提示，只做完整匹配，其他提到登录的错误（如登录频繁、维护公告）不算失效
+AUTH_EXPIRED_MESSAGES = {'非常抱歉，请先登录！'}
+# 凭证失效的响应体很短，超过该长度的响应不再解析检查
+AUTH_CHECK_MAX_BYTES = 1024
+
+def is_auth_expired(response: httpx.Response) -> bool:
+    """判断游戏数据接口的响应是否表示登录凭证已失效"""
+    if len(response.content) > AUTH_CHECK_MAX_BYTES:
+        return False
+    try:
+        data = jsonlib.loads(response.content)
+    except ValueError:
+        return False
+    if not isinstance(data, dict) or data.get('ret', 0) == 0:
+        return False
+    return data['ret'] in AUTH_EXPIRED_RETS or str(data.get('sMsg', '')).strip() in AUTH_EXPIRED_MESSAGES
+
+# 所有DeltaApi实例共用的上游限流器，速率不大于0时不限流
+upstream_limiter = UpstreamLimiter(
+    config.delta_helper_request_rate_limit,
+    config.delta_helper_request_rate_limit * 2,
+) if config.delta_helper_request_rate_limit > 0 else None
+
+# 所有DeltaApi实例使用的传输层，用于接入离线模拟的上游，为None时直接请求官方接口
+upstream_transport: httpx.AsyncBaseTransport|None = None
+
+def set_upstream_transport(transport: httpx.AsyncBaseTransport|None) -> None:
+    """设置之后创建的DeltaApi使用的传输层，传入None恢复直接请求官方接口"""
+    global upstream_transport
+    upstream_transport = transport
+
+def upstream_available() -> bool:
+    """游戏数据接口是否可用，熔断期间后台监控应暂停请求"""
+    return not get_breaker(CONSTANTS['GAMEBASEHOST']).is_open
+
+@trace_methods
 class DeltaApi:
-    def __init__(self, platform: str = 'qq'):
+    def __init__(self, platform: str = 'qq', background: bool = False):
+        """
+        Args:
+            platform: 登录平台, qq或wx
+            background: 是否为后台监控发起的请求, 限流排队时让位于用户命令
+        """
         self.platform = platform
+        self.priority = PRIORITY_BACKGROUND if background else PRIORITY_INTERACTIVE
+        # 请求过程中是否发现登录凭证已失效
+        self.auth_expired = False
         proxy = config.delta_helper_request_proxy
-        if proxy:
-            self.client = httpx.AsyncClient(timeout=200, proxy=proxy)
+        if upstream_transport is not None:
+            self.client = httpx.AsyncClient(timeout=REQUEST_TIMEOUT, transport=upstream_transport)
+        elif proxy:
+            self.client = httpx.AsyncClient(timeout=REQUEST_TIMEOUT, proxy=proxy)
         else:
-            self.client = httpx.AsyncClient(timeout=200)
+            self.client = httpx.AsyncClient(timeout=REQUEST_TIMEOUT)
 
     async def close(self):
         await self.client.aclose()
 
+    async def _post_ide(self, params: dict|None = None, data: dict|None = None, cookies: dict|None = None, headers: dict|None = None, retry: bool = True) -> httpx.Response:
+        """
+        向游戏数据接口发送请求，发送前按接口和用户排队限流，失败时按需重试
+
+        Args:
+            retry: 是否允许失败重试，提交类的非幂等请求需要关闭
+        """
+        fields = data or params or {}
+        endpoint = str(fields.get('method') or fields.get('iChartId', ''))
+        user_key = (cookies or {}).get('openid', '')
+
+        async def send() -> httpx.Response:
+            if upstream_limiter is not None:
+                await upstream_limiter.acquire(endpoint, user_key, self.priority)
+            start = time.perf_counter()
+            with span('upstream', endpoint=endpoint) as current:
+                try:
+                    response = await self.client.post(CONSTANTS['GAMEBASEURL'], params=params, data=data, cookies=cookies, headers=headers)
+                except Exception as e:
+                    upstream_requests.inc(endpoint=endpoint, status=type(e).__name__)
+                    raise
+                finally:
+                    upstream_latency.observe(time.perf_counter() - start, endpoint=endpoint)
+                if current:
+                    current.set_attribute('status', response.status_code)
+            upstream_requests.inc(endpoint=endpoint, status=response.status_code)
+            return response
+
+        try:
+            response = await send_with_retry(CONSTANTS['GAMEBASEHOST'], send, retry)
+        except CircuitOpenError:
+            upstream_requests.inc(endpoint=endpoint, status='CircuitOpenError')
+            raise
+        if is_auth_expired(response):
+            self.auth_expired = True
+        return response
+
+    async def _decode(self, response: httpx.Response) -> Any:
+        """解析游戏数据接口的JSON响应，较大的响应（如整页战绩、周报）在线程池中解析"""
+        return await run_cpu('json_decode', jsonlib.loads, response.content, size=len(response.content))
+
     def get_gtk(self, p_skey: str) -> int:
         """计算g_tk值"""
         h = 5381
@@ -364,10 +462,9 @@ class DeltaApi:
                 'sIdeToken': '95ookO',
             }
             
-            url = 'https://comm.ams.game.qq.com/ide/'
-            response = await self.client.post(url, data=form_data, cookies=cookies)
+            response = await self._post_ide(data=form_data, cookies=cookies)
             
-            data = response.json()
+            data = await self._decode(response)
             if data['ret'] != 0:
                 return {'status': False, 'message': '获取失败,检查鉴权是否过期', 'data': {}}
             
@@ -438,9 +535,8 @@ class DeltaApi:
                     'md5str': data['md5str'],
                 }
                 
-                url = 'https://comm.ams.game.qq.com/ide/'
-                response = await self.client.post(url, data=form_data, cookies=cookies)
-                result = response.json()
+                response = await self._post_ide(data=form_data, cookies=cookies, retry=False)
+                result = await self._decode(response)
                 
                 if result['ret'] != 0:
                     return {'status': False, 'message': '绑定失败', 'data': {}}
@@ -454,7 +550,7 @@ class DeltaApi:
             logger.exception(f"绑定失败: {e}")
             return {'status': False, 'message': '绑定失败，详情请查看日志', 'data': {}}
 
-    async def get_player_info(self, access_token: str, openid: str, season_id: int = 0):
+    async def get_player_info(self, access_token: str, openid: str, season_id: int = 0, with_currency: bool = True):
         access_type = self.platform
         try:
             # 参数验证
@@ -483,10 +579,9 @@ class DeltaApi:
                 'seasonid': str(season_id),
             }
             
-            url = CONSTANTS['GAMEBASEURL']
-            response = await self.client.post(url, params=form_params, cookies=cookies, headers=headers)
+            response = await self._post_ide(params=form_params, cookies=cookies, headers=headers)
             
-            data = response.json()
+            data = await self._decode(response)
             # logger.debug(f"玩家基础信息：{data}")
             if data['ret'] == 0:
                 # 处理玩家数据
@@ -495,6 +590,10 @@ class DeltaApi:
                 game_data['player'] = player_data
                 game_data['game'] = data['jData']['careerData']
             
+            # 只需要角色名时不再查询货币信息
+            if not with_currency:
+                return {'status': data['ret'] == 0, 'message': '获取成功' if data['ret'] == 0 else '获取失败', 'data': game_data}
+            
             # 第二步：获取货币信息
             currency_items = {
                 'coin': 17888808888,
@@ -511,8 +610,8 @@ class DeltaApi:
                     'item': item_id,
                 }
                 
-                response = await self.client.post(url, data=form_data, cookies=cookies)
-                data = response.json()
+                response = await self._post_ide(data=form_data, cookies=cookies)
+                data = await self._decode(response)
                 
                 if data['ret'] == 0:
                     game_data[key] = int(data['jData']['data'][0].get('totalMoney', 0))
@@ -544,10 +643,9 @@ class DeltaApi:
                 'source': 2
             }
             
-            url = CONSTANTS['GAMEBASEURL']
-            response = await self.client.post(url, data=form_data, cookies=cookies)
+            response = await self._post_ide(data=form_data, cookies=cookies)
             
-            data = response.json()
+            data = await self._decode(response)
             if data['ret'] != 0:
                 return {'status': False, 'message': '获取失败,检查鉴权是否过期', 'data': {}}
             
@@ -565,7 +663,7 @@ class DeltaApi:
         :param access_type: 登录类型, 默认为'qq'
         :param type_id: 类型, 4为烽火, 5为战场, 默认为4
         :param page: 页码, 默认为1
-        :return: 战绩记录
+        :return: 战绩记录, 烽火为SolRecord列表, 战场为TdmRecord列表
         """
         access_type = self.platform
         try:
@@ -596,13 +694,12 @@ class DeltaApi:
                 'page': page,
             }
             
-            url = CONSTANTS['GAMEBASEURL']
-            response = await self.client.post(url, data=form_data, cookies=cookies)
+            response = await self._post_ide(data=form_data, cookies=cookies)
             
-            data = response.json()
+            data = await self._decode(response)
             if data['ret'] == 0 and data['jData']['data']:
-                # 合并数据
-                game_data[key].extend(data['jData']['data'])
+                # 合并数据，每条战绩转换为战绩对象
+                game_data[key].extend(map(RECORD_TYPES[type_id], data['jData']['data']))
             elif data['ret'] != 0:
                 logger.error(f"获取战绩失败: {data}")
                 return {'status': False, 'message': '获取失败', 'data': {}}
@@ -632,10 +729,9 @@ class DeltaApi:
                 'source': 2
             }
 
-            url = CONSTANTS['GAMEBASEURL']
-            response = await self.client.post(url, params=params, cookies=cookies)
+            response = await self._post_ide(params=params, cookies=cookies)
 
-            data = response.json()
+            data = await self._decode(response)
             if data['ret'] == 0:
                 return {'status': True, 'message': '获取成功', 'data': data['jData']['data']['data']}
             else:
@@ -669,10 +765,9 @@ class DeltaApi:
                 }),
             }
 
-            url = CONSTANTS['GAMEBASEURL']
-            response = await self.client.post(url, params=params, cookies=cookies)
+            response = await self._post_ide(params=params, cookies=cookies)
 
-            data = response.json()
+            data = await self._decode(response)
             if data['ret'] == 0:
                 return {'status': True, 'message': '获取成功', 'data': data['jData']['data']['data']}
             else:
@@ -705,11 +800,9 @@ class DeltaApi:
                 }),
             }
 
-            url = CONSTANTS['GAMEBASEURL']
-
-            response = await self.client.post(url, params=params, cookies=cookies)
+            response = await self._post_ide(params=params, cookies=cookies)
 
-            data = response.json()
+            data = await self._decode(response)
             if data['ret'] == 0:
                 if data['jData']['data']['data']:
                     return {'status': True, 'message': '获取成功', 'data': data['jData']['data']['data']}
@@ -748,10 +841,9 @@ class DeltaApi:
                 }),
             }
 
-            url = CONSTANTS['GAMEBASEURL']
-            response = await self.client.post(url, params=params, cookies=cookies)
+            response = await self._post_ide(params=params, cookies=cookies)
 
-            data = response.json()
+            data = await self._decode(response)
             if data['ret'] == 0:
                 return {'status': True, 'message': '获取成功', 'data': data['jData']['data']['data']}
             else:
@@ -787,10 +879,9 @@ class DeltaApi:
                 }),
             }
 
-            url = CONSTANTS['GAMEBASEURL']
-            response = await self.client.post(url, params=params, cookies=cookies)
+            response = await self._post_ide(params=params, cookies=cookies)
 
-            data = response.json()
+            data = await self._decode(response)
             if data['ret'] == 0:
                 return {'status': True, 'message': '获取成功', 'data': data['jData']['data']['data']}
             else:
@@ -822,10 +913,9 @@ class DeltaApi:
                 'openid': user_openid
             }
 
-            url = CONSTANTS['GAMEBASEURL']
-            response = await self.client.post(url, params=params, cookies=cookies)
+            response = await self._post_ide(params=params, cookies=cookies)
 
-            data = response.json()
+            data = await self._decode(response)
             if data['ret'] == 0:
                 return {'status': True, 'message': '获取成功', 'data': data['jData']['data']}
             else:
@@ -860,10 +950,9 @@ class DeltaApi:
                     })
             }
 
-            url = CONSTANTS['GAMEBASEURL']
-            response = await self.client.post(url, params=params, cookies=cookies)
+            response = await self._post_ide(params=params, cookies=cookies)
 
-            data = response.json()
+            data = await self._decode(response)
             if data['ret'] == 0:
                 return {'status': True, 'message': '获取成功', 'data': data['jData']['data']['data']}
             else:
@@ -897,10 +986,9 @@ class DeltaApi:
                     }),
             }
 
-            url = CONSTANTS['GAMEBASEURL']
-            response = await self.client.post(url, params=params, cookies=cookies)
+            response = await self._post_ide(params=params, cookies=cookies)
 
-            data = response.json()
+            data = await self._decode(response)
             if data['ret'] == 0:
                 return {'status': True, 'message': '获取成功', 'data': data['jData']['data']['data']}
             else:
@@ -0,0 +1,40 @@
+"""
+JSON解析后端
+导入时按orjson、msgspec、标准库json的顺序选择可用的实现，官方接口的响应直接从字节解析。
+解析失败时抛出的异常都是ValueError的子类，与标准库一致；
+orjson会把超过64位的整数解析为浮点数，官方接口中的ID都在64位以内或以字符串返回
+"""
+import json
+from typing import Any, Union
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+try:
+    import msgspec
+except ImportError:
+    msgspec = None
+
+if orjson is not None:
+    JSON_BACKEND = 'orjson'
+
+    def loads(data: Union[bytes, str]) -> Any:
+        # orjson.JSONDecodeError是json.JSONDecodeError的子类
+        return orjson.loads(data)
+elif msgspec is not None:
+    JSON_BACKEND = 'msgspec'
+    _decoder = msgspec.json.Decoder()
+
+    def loads(data: Union[bytes, str]) -> Any:
+        try:
+            return _decoder.decode(data)
+        except msgspec.DecodeError:
+            # 由标准库重新解析，抛出与标准库一致的异常
+            return json.loads(data)
+else:
+    JSON_BACKEND = 'json'
+
+    def loads(data: Union[bytes, str]) -> Any:
+        return json.loads(data)
@@ -0,0 +1,157 @@
+"""
+群排行榜模块
+在内存中为每个群维护本周各项数据的有序榜单，战绩监控任务累计周统计后增量更新，
+查询时直接取前k名；榜单数据来源于已持久化的周统计，启动和定时刷新时从数据库重建
+"""
+import bisect
+import datetime
+from typing import Callable, Optional
+from nonebot.log import logger
+
+from .db import UserDataDatabase
+from .model import WeeklyReportStat
+from .util import Util
+
+
+def _profit(stat: WeeklyReportStat) -> Optional[int]:
+    return stat.gained_price - stat.consume_price if stat.sol_num > 0 else None
+
+
+def _kill(stat: WeeklyReportStat) -> Optional[int]:
+    return stat.kill_num if stat.sol_num > 0 else None
+
+
+def _million(stat: WeeklyReportStat) -> Optional[int]:
+    return stat.overmillion_num if stat.overmillion_num > 0 else None
+
+
+def _tdm_score(stat: WeeklyReportStat) -> Optional[int]:
+    return int(stat.tdm_total_score * 60 / stat.tdm_game_time) if stat.tdm_game_time > 0 else None
+
+
+# 榜单类型: (显示名称, 取值函数, 数值格式化函数)
+LEADERBOARD_METRICS: dict[str, tuple[str, Callable[[WeeklyReportStat], Optional[int]], Callable[[int], str]]] = {
+    'profit': ('收益', _profit, lambda v: f"{'-' if v < 0 else ''}{Util.trans_num_easy_for_read(abs(v))}"),
+    'kill': ('击杀', _kill, lambda v: f"{v}杀"),
+    'million': ('百万撤离', _million, lambda v: f"{v}次"),
+    'tdm_score': ('战场分均得分', _tdm_score, lambda v: f"{v}分"),
+}
+
+LEADERBOARD_ALIASES = {
+    '': 'profit',
+    '收益': 'profit',
+    '利润': 'profit',
+    '赚钱': 'profit',
+    '击杀': 'kill',
+    '百万': 'million',
+    '百万撤离': 'million',
+    '分均': 'tdm_score',
+    '战场': 'tdm_score',
+    '分均得分': 'tdm_score',
+}
+
+
+class SortedBoard:
+    """按分数降序排列的有序榜单"""
+
+    def __init__(self):
+        self._keys: list[tuple[int, int]] = []  # (-分数, qq_id)
+        self._scores: dict[int, int] = {}
+
+    def __len__(self) -> int:
+        return len(self._keys)
+
+    def update(self, qq_id: int, score: Optional[int]) -> None:
+        """更新用户分数，分数为None时移出榜单"""
+        old_score = self._scores.get(qq_id)
+        if old_score == score:
+            return
+        if old_score is not None:
+            index = bisect.bisect_left(self._keys, (-old_score, qq_id))
+            del self._keys[index]
+            del self._scores[qq_id]
+        if score is not None:
+            bisect.insort(self._keys, (-score, qq_id))
+            self._scores[qq_id] = score
+
+    def top(self, k: int) -> list[tuple[int, int]]:
+        """获取前k名的(qq_id, 分数)"""
+        return [(qq_id, -neg_score) for neg_score, qq_id in self._keys[:k]]
+
+
+class GroupLeaderboard:
+    """群排行榜"""
+
+    def __init__(self):
+        self.stat_date = ''
+        self.boards: dict[int, dict[str, SortedBoard]] = {}
+        self.user_groups: dict[int, int] = {}
+        self.user_names: dict[int, str] = {}
+
+    def _check_week(self) -> None:
+        """跨周时清空榜单"""
+        stat_date = Util.get_week_stat_date(datetime.datetime.now())
+        if stat_date != self.stat_date:
+            self.stat_date = stat_date
+            self.boards = {}
+            self.user_groups = {}
+
+    def update_stat(self, group_id: int, stat: WeeklyReportStat, user_name: str = '') -> None:
+        """用户本周统计变化后更新所在群的榜单"""
+        self._check_week()
+        if user_name:
+            self.user_names[stat.qq_id] = user_name
+        if stat.stat_date != self.stat_date:
+            return
+
+        # 用户换绑到其他群时从原来的群榜单中移除
+        old_group_id = self.user_groups.get(stat.qq_id)
+        if old_group_id is not None and old_group_id != group_id:
+            for board in self.boards.get(old_group_id, {}).values():
+                board.update(stat.qq_id, None)
+        if group_id == 0:
+            self.user_groups.pop(stat.qq_id, None)
+            return
+        self.user_groups[stat.qq_id] = group_id
+
+        boards = self.boards.setdefault(group_id, {metric: SortedBoard() for metric in LEADERBOARD_METRICS})
+        for metric, (_, get_value, _) in LEADERBOARD_METRICS.items():
+            boards[metric].update(stat.qq_id, get_value(stat))
+
+    def top(self, group_id: int, metric: str, k: int = 10) -> list[tuple[int, str, int]]:
+        """获取群内某项榜单的前k名(qq_id, 名称, 分数)"""
+        self._check_week()
+        board = self.boards.get(group_id, {}).get(metric)
+        if not board:
+            return []
+        return [(qq_id, self.user_names.get(qq_id, str(qq_id)), score) for qq_id, score in board.top(k)]
+
+    def remove_user(self, qq_id: int) -> None:
+        """用户关闭战绩播报或重新绑定时从所在群的榜单中移除"""
+        group_id = self.user_groups.pop(qq_id, None)
+        if group_id is not None:
+            for board in self.boards.get(group_id, {}).values():
+                board.update(qq_id, None)
+        self.user_names.pop(qq_id, None)
+
+    async def update_user(self, user_data_database: UserDataDatabase, qq_id: int, group_id: int, user_name: str = '') -> None:
+        """从数据库读取用户本周统计并更新榜单"""
+        self._check_week()
+        stat = await user_data_database.get_weekly_report_stat(qq_id, self.stat_date)
+        if stat:
+            self.update_stat(group_id, stat, user_name)
+
+    async def load(self, user_data_database: UserDataDatabase) -> None:
+        """从数据库重建本周榜单"""
+        stat_date = Util.get_week_stat_date(datetime.datetime.now())
+        stats = await user_data_database.get_group_weekly_report_stats(stat_date)
+        self.stat_date = stat_date
+        self.boards = {}
+        self.user_groups = {}
+        for stat, group_id, user_name in stats:
+            self.update_stat(group_id, stat, user_name)
+        logger.debug(f"重建群排行榜完成: {stat_date} - {len(stats)}条统计")
+
+
+# 全局排行榜实例
+group_leaderboard = GroupLeaderboard()
@@ -0,0 +1,119 @@
+"""
+事件循环延迟监控模块
+事件循环中的任务按固定间隔休眠，实际唤醒时间与预期时间之差即调度延迟，记录到运行指标中；
+后台看门狗线程在事件循环超过阈值没有响应时抓取事件循环线程的调用栈，
+事件循环恢复后连同阻塞时长一起输出到日志，用于定位需要移出事件循环的同步计算
+"""
+import asyncio
+import sys
+import threading
+import time
+import traceback
+from collections import deque
+from typing import Optional
+from nonebot.log import logger
+
+from .metrics import registry
+
+# 调度延迟的采样间隔（秒）
+LOOP_LAG_SAMPLE_INTERVAL = 0.5
+
+# 计算延迟分位数时保留的最近采样数，按采样间隔约为10分钟
+LOOP_LAG_WINDOW = 1200
+
+# 阻塞日志中调用栈的最大帧数
+STALL_STACK_LIMIT = 30
+
+loop_lag = registry.histogram(
+    'delta_event_loop_lag_seconds', '事件循环调度延迟',
+    buckets=(0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10))
+loop_lag_quantile = registry.gauge(
+    'delta_event_loop_lag_quantile_seconds', '最近约10分钟事件循环调度延迟的分位数', ('quantile',))
+slow_callbacks = registry.counter(
+    'delta_slow_callbacks_total', '阻塞事件循环超过阈值的次数')
+
+
+class LoopLagMonitor:
+    """事件循环延迟监控"""
+
+    def __init__(self, threshold: float, interval: float = LOOP_LAG_SAMPLE_INTERVAL):
+        """
+        Args:
+            threshold: 事件循环阻塞超过该时长（秒）时抓取调用栈并输出日志
+            interval: 调度延迟的采样间隔（秒）
+        """
+        self.threshold = threshold
+        self.interval = interval
+        self.recent: deque[float] = deque(maxlen=LOOP_LAG_WINDOW)
+        self._task: Optional[asyncio.Task] = None
+        self._watchdog: Optional[threading.Thread] = None
+        self._stop = threading.Event()
+        self._loop_thread: Optional[int] = None
+        # 事件循环最近一次响应的时间，由看门狗线程读取
+        self._last_beat = time.monotonic()
+        self._stall_stack: Optional[str] = None
+
+        for quantile in (0.5, 0.9, 0.99):
+            loop_lag_quantile.set_function(lambda q=quantile: self.percentile(q * 100), quantile=quantile)
+
+    def percentile(self, q: float) -> float:
+        """最近采样中调度延迟的分位数（秒）"""
+        if not self.recent:
+            return 0.0
+        ordered = sorted(self.recent)
+        return ordered[min(len(ordered) - 1, int(len(ordered) * q / 100))]
+
+    def start(self) -> None:
+        if self._task is not None:
+            return
+        self._loop_thread = threading.get_ident()
+        self._last_beat = time.monotonic()
+        self._stop.clear()
+        self._task = asyncio.create_task(self._run())
+        self._watchdog = threading.Thread(target=self._watch, name='delta-helper-loop-watchdog', daemon=True)
+        self._watchdog.start()
+
+    async def stop(self) -> None:
+        self._stop.set()
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        if self._watchdog is not None:
+            self._watchdog.join()
+            self._watchdog = None
+
+    async def _run(self) -> None:
+        while True:
+            expected = time.monotonic() + self.interval
+            await asyncio.sleep(self.interval)
+            now = time.monotonic()
+            self._last_beat = now
+            lag = max(0.0, now - expected)
+            loop_lag.observe(lag)
+            self.recent.append(lag)
+            if lag >= self.threshold:
+                slow_callbacks.inc()
+                stack, self._stall_stack = self._stall_stack, None
+                if stack:
+                    logger.warning(f"事件循环阻塞{lag:.2f}秒，阻塞时的调用栈:\n{stack}")
+                else:
+                    logger.warning(f"事件循环阻塞{lag:.2f}秒")
+
+    def _watch(self) -> None:
+        """看门狗线程，事件循环超过阈值没有响应时记录其调用栈"""
+        check_interval = min(self.interval, self.threshold) / 2
+        captured_beat = None
+        while not self._stop.wait(check_interval):
+            last_beat = self._last_beat
+            # 每次阻塞只抓取一次，阻塞开始后最早的调用栈最能说明原因
+            if last_beat == captured_beat or time.monotonic() - last_beat < self.interval + self.threshold:
+                continue
+            frame = sys._current_frames().get(self._loop_thread)
+            if frame is None:
+                continue
+            self._stall_stack = ''.join(traceback.format_stack(frame, limit=STALL_STACK_LIMIT))
+            captured_beat = last_beat
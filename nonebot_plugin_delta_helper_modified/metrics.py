@@ -0,0 +1,220 @@
+"""
+运行指标模块
+以Prometheus文本格式统计插件的运行指标：上游请求的次数和耗时、监控任务的耗时和积压、
+卡片渲染的耗时和排队数、缓存命中、数据库语句数和播报次数，
+可以挂载为NoneBot驱动的HTTP接口，也可以定期写入文件
+"""
+import time
+from contextlib import contextmanager
+from typing import Callable, Iterator
+from sqlalchemy import Engine, event
+
+# Prometheus文本格式的Content-Type
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+# 耗时直方图的默认分桶（秒）
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)
+
+
+def _escape(value: str) -> str:
+    return value.replace('\\', '\\\\').replace('\n', '\\n').replace('"', '\\"')
+
+def _format_labels(labels: dict[str, str]) -> str:
+    if not labels:
+        return ''
+    return '{' + ','.join(f'{key}="{_escape(value)}"' for key, value in labels.items()) + '}'
+
+def _format_value(value: float) -> str:
+    if value == float('inf'):
+        return '+Inf'
+    if float(value).is_integer():
+        return str(int(value))
+    return repr(float(value))
+
+
+class _Metric:
+    type = ''
+
+    def __init__(self, name: str, documentation: str, labelnames: tuple[str, ...] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = labelnames
+
+    def _key(self, labels: dict[str, object]) -> tuple[str, ...]:
+        if set(labels) != set(self.labelnames):
+            raise ValueError(f"指标{self.name}的标签应为{self.labelnames}，实际为{tuple(labels)}")
+        return tuple(str(labels[name]) for name in self.labelnames)
+
+    def _labels(self, key: tuple[str, ...]) -> dict[str, str]:
+        return dict(zip(self.labelnames, key))
+
+    def samples(self) -> Iterator[tuple[str, dict[str, str], float]]:
+        raise NotImplementedError
+
+    def render(self) -> str:
+        lines = [f'# HELP {self.name} {_escape(self.documentation)}', f'# TYPE {self.name} {self.type}']
+        for name, labels, value in self.samples():
+            lines.append(f'{name}{_format_labels(labels)} {_format_value(value)}')
+        return '\n'.join(lines)
+
+
+class Counter(_Metric):
+    """只增不减的计数"""
+    type = 'counter'
+
+    def __init__(self, name: str, documentation: str, labelnames: tuple[str, ...] = ()):
+        super().__init__(name, documentation, labelnames)
+        self._values: dict[tuple[str, ...], float] = {}
+
+    def inc(self, amount: float = 1, **labels: object) -> None:
+        key = self._key(labels)
+        self._values[key] = self._values.get(key, 0) + amount
+
+    def get(self, **labels: object) -> float:
+        return self._values.get(self._key(labels), 0)
+
+    def samples(self) -> Iterator[tuple[str, dict[str, str], float]]:
+        # 无标签的指标在还没有计数时也导出0
+        values = self._values if self.labelnames or self._values else {(): 0}
+        for key, value in sorted(values.items()):
+            yield self.name, self._labels(key), value
+
+
+class Gauge(_Metric):
+    """可增可减的当前值，也可以在导出时由回调函数计算"""
+    type = 'gauge'
+
+    def __init__(self, name: str, documentation: str, labelnames: tuple[str, ...] = ()):
+        super().__init__(name, documentation, labelnames)
+        self._values: dict[tuple[str, ...], float] = {}
+        self._functions: dict[tuple[str, ...], Callable[[], float]] = {}
+
+    def set(self, value: float, **labels: object) -> None:
+        self._values[self._key(labels)] = value
+
+    def inc(self, amount: float = 1, **labels: object) -> None:
+        key = self._key(labels)
+        self._values[key] = self._values.get(key, 0) + amount
+
+    def dec(self, amount: float = 1, **labels: object) -> None:
+        self.inc(-amount, **labels)
+
+    def set_function(self, function: Callable[[], float], **labels: object) -> None:
+        """导出时调用function获取当前值"""
+        self._functions[self._key(labels)] = function
+
+    def get(self, **labels: object) -> float:
+        key = self._key(labels)
+        if key in self._functions:
+            return self._functions[key]()
+        return self._values.get(key, 0)
+
+    def samples(self) -> Iterator[tuple[str, dict[str, str], float]]:
+        values = dict(self._values)
+        for key, function in self._functions.items():
+            values[key] = function()
+        if not self.labelnames and not values:
+            values[()] = 0
+        for key, value in sorted(values.items()):
+            yield self.name, self._labels(key), value
+
+
+class Histogram(_Metric):
+    """按分桶统计的分布，用于耗时"""
+    type = 'histogram'
+
+    def __init__(self, name: str, documentation: str, labelnames: tuple[str, ...] = (), buckets: tuple[float, ...] = DEFAULT_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets)) + (float('inf'),)
+        # 标签 -> (各分桶的计数, [总和, 总数])，分桶计数不累加，导出时再累加
+        self._values: dict[tuple[str, ...], tuple[list[int], list[float]]] = {}
+
+    def observe(self, value: float, **labels: object) -> None:
+        key = self._key(labels)
+        state = self._values.get(key)
+        if state is None:
+            state = self._values[key] = ([0] * len(self.buckets), [0.0, 0])
+        counts, totals = state
+        for i, bound in enumerate(self.buckets):
+            if value <= bound:
+                counts[i] += 1
+                break
+        totals[0] += value
+        totals[1] += 1
+
+    @contextmanager
+    def time(self, **labels: object) -> Iterator[None]:
+        """统计代码块的耗时，代码块抛出异常时同样计入"""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start, **labels)
+
+    def samples(self) -> Iterator[tuple[str, dict[str, str], float]]:
+        for key, (counts, (total, count)) in sorted(self._values.items()):
+            labels = self._labels(key)
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets, counts):
+                cumulative += bucket_count
+                yield f'{self.name}_bucket', {**labels, 'le': _format_value(bound)}, cumulative
+            yield f'{self.name}_sum', labels, total
+            yield f'{self.name}_count', labels, count
+
+
+class MetricsRegistry:
+    """指标注册表"""
+
+    def __init__(self):
+        self._metrics: dict[str, _Metric] = {}
+
+    def _register(self, metric: _Metric):
+        if metric.name in self._metrics:
+            raise ValueError(f"指标{metric.name}已存在")
+        self._metrics[metric.name] = metric
+        return metric
+
+    def counter(self, name: str, documentation: str, labelnames: tuple[str, ...] = ()) -> Counter:
+        return self._register(Counter(name, documentation, labelnames))
+
+    def gauge(self, name: str, documentation: str, labelnames: tuple[str, ...] = ()) -> Gauge:
+        return self._register(Gauge(name, documentation, labelnames))
+
+    def histogram(self, name: str, documentation: str, labelnames: tuple[str, ...] = (), buckets: tuple[float, ...] = DEFAULT_BUCKETS) -> Histogram:
+        return self._register(Histogram(name, documentation, labelnames, buckets))
+
+    def render(self) -> str:
+        """导出为Prometheus文本格式"""
+        return '\n'.join(metric.render() for metric in self._metrics.values()) + '\n'
+
+
+# 全局指标注册表
+registry = MetricsRegistry()
+
+upstream_requests = registry.counter(
+    'delta_upstream_requests_total', '发往官方接口的请求数，status为HTTP状态码或异常类型', ('endpoint', 'status'))
+upstream_latency = registry.histogram(
+    'delta_upstream_request_seconds', '官方接口单次请求耗时，不含限流排队', ('endpoint',))
+watcher_tick_latency = registry.histogram(
+    'delta_watcher_tick_seconds', '单个用户单次监控检查的耗时', ('watcher',))
+watcher_backlog = registry.gauge(
+    'delta_watcher_backlog', '已到检查时间但还未开始执行的监控任务数', ('watcher',))
+render_latency = registry.histogram(
+    'delta_render_seconds', '卡片渲染耗时', ('template',))
+render_queue_depth = registry.gauge(
+    'delta_render_queue_depth', '正在等待或进行中的卡片渲染数')
+cache_requests = registry.counter(
+    'delta_cache_requests_total', '缓存查询次数，result为hit或miss', ('cache', 'result'))
+db_statements = registry.counter(
+    'delta_db_statements_total', '插件数据库引擎执行的SQL语句数')
+broadcasts_sent = registry.counter(
+    'delta_broadcasts_total', '群播报发送次数，result为ok（发送成功）或error（发送失败）', ('kind', 'result'))
+
+
+def _count_db_statement(*_) -> None:
+    db_statements.inc()
+
+def instrument_engine(engine: Engine) -> None:
+    """统计数据库引擎执行的语句数，重复调用不会重复计数"""
+    if not event.contains(engine, 'before_cursor_execute', _count_db_statement):
+        event.listen(engine, 'before_cursor_execute', _count_db_statement)
@@ -0,0 +1,50 @@
+"""拆分周报完整标记
+
+迁移 ID: b8d4f2a6c1e9
+父迁移: a3e1c7d9b5f2
+创建时间: 2026-10-20 10:24:51.630184
+
+"""
+from __future__ import annotations
+
+from collections.abc import Sequence
+
+from alembic import op
+import sqlalchemy as sa
+
+
+revision: str = 'b8d4f2a6c1e9'
+down_revision: str | Sequence[str] | None = 'a3e1c7d9b5f2'
+branch_labels: str | Sequence[str] | None = None
+depends_on: str | Sequence[str] | None = None
+
+
+def upgrade(name: str = "") -> None:
+    if name:
+        return
+    with op.batch_alter_table('nonebot_plugin_delta_helper_weeklyreportstat', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('sol_complete', sa.Boolean(), server_default=sa.text('false'), nullable=False))
+        batch_op.add_column(sa.Column('tdm_complete', sa.Boolean(), server_default=sa.text('false'), nullable=False))
+
+    # 原来的完整标记同时适用于两种模式
+    op.execute(sa.text(
+        'UPDATE nonebot_plugin_delta_helper_weeklyreportstat SET sol_complete = is_complete, tdm_complete = is_complete'
+    ))
+
+    with op.batch_alter_table('nonebot_plugin_delta_helper_weeklyreportstat', schema=None) as batch_op:
+        batch_op.drop_column('is_complete')
+
+
+def downgrade(name: str = "") -> None:
+    if name:
+        return
+    with op.batch_alter_table('nonebot_plugin_delta_helper_weeklyreportstat', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('is_complete', sa.Boolean(), server_default=sa.text('false'), nullable=False))
+
+    op.execute(sa.text(
+        'UPDATE nonebot_plugin_delta_helper_weeklyreportstat SET is_complete = sol_complete AND tdm_complete'
+    ))
+
+    with op.batch_alter_table('nonebot_plugin_delta_helper_weeklyreportstat', schema=None) as batch_op:
+        batch_op.drop_column('tdm_complete')
+        batch_op.drop_column('sol_complete')
@@ -4,12 +4,13 @@ from nonebot_plugin_orm import Model
 
 class UserData(Model):
     qq_id: Mapped[int] = mapped_column(primary_key=True)
-    group_id: Mapped[int] = mapped_column()
+    group_id: Mapped[int] = mapped_column(index=True)
     access_token: Mapped[str] = mapped_column()
     openid: Mapped[str] = mapped_column()
-    if_remind_safehouse: Mapped[bool] = mapped_column(default=False, server_default=text('false'))
+    if_remind_safehouse: Mapped[bool] = mapped_column(default=False, server_default=text('false'), index=True)
     platform: Mapped[str] = mapped_column(default='qq', server_default=text('qq'))
-    if_broadcast_record: Mapped[bool] = mapped_column(default=True, server_default=text('true'))
+    if_broadcast_record: Mapped[bool] = mapped_column(default=True, server_default=text('true'), index=True)
+    user_name: Mapped[str] = mapped_column(default='', server_default=text("''"))  # 游戏角色名，排行榜显示用
 
 class LatestRecord(Model):
     """用户最新战绩记录"""
@@ -26,3 +27,49 @@ class SafehouseRecord(Model):
     place_name: Mapped[str] = mapped_column()  # 工作台名称
     left_time: Mapped[int] = mapped_column()  # 剩余时间（秒）
     push_time: Mapped[int] = mapped_column()  # 推送时间戳
+
+
+class WeeklyReportStat(Model):
+    """用户烽火周报本地统计"""
+    qq_id: Mapped[int] = mapped_column(primary_key=True)  # 用户QQ号
+    stat_date: Mapped[str] = mapped_column(primary_key=True, index=True)  # 周报日期（该周周日，格式YYYYMMDD）
+    sol_num: Mapped[int] = mapped_column(default=0, server_default=text('0'))  # 总场次
+    escape_num: Mapped[int] = mapped_column(default=0, server_default=text('0'))  # 撤离成功次数
+    kill_num: Mapped[int] = mapped_column(default=0, server_default=text('0'))  # 总击杀
+    death_num: Mapped[int] = mapped_column(default=0, server_default=text('0'))  # 总死亡（撤离失败）
+    overmillion_num: Mapped[int] = mapped_column(default=0, server_default=text('0'))  # 百万撤离次数
+    gained_price: Mapped[int] = mapped_column(default=0, server_default=text('0'))  # 总带出
+    consume_price: Mapped[int] = mapped_column(default=0, server_default=text('0'))  # 总战损
+    online_time: Mapped[int] = mapped_column(default=0, server_default=text('0'))  # 总对局时长（秒）
+    armed_force_num: Mapped[str] = mapped_column(default='{}', server_default=text("'{}'"))  # 干员使用次数（JSON）
+    map_num: Mapped[str] = mapped_column(default='{}', server_default=text("'{}'"))  # 地图游玩次数（JSON）
+    last_event_time: Mapped[str] = mapped_column(default='', server_default=text("''"))  # 已统计的最新战绩时间
+    sol_complete: Mapped[bool] = mapped_column(default=False, server_default=text('false'))  # 烽火战绩是否完整覆盖整周
+    tdm_num: Mapped[int] = mapped_column(default=0, server_default=text('0'))  # 战场总场次
+    tdm_kill_num: Mapped[int] = mapped_column(default=0, server_default=text('0'))  # 战场总击杀
+    tdm_total_score: Mapped[int] = mapped_column(default=0, server_default=text('0'))  # 战场总得分
+    tdm_game_time: Mapped[int] = mapped_column(default=0, server_default=text('0'))  # 战场总时长（秒）
+    last_tdm_event_time: Mapped[str] = mapped_column(default='', server_default=text("''"))  # 已统计的最新战场战绩时间
+    tdm_complete: Mapped[bool] = mapped_column(default=False, server_default=text('false'))  # 战场战绩是否完整覆盖整周
+
+
+class WatcherInstance(Model):
+    """分片监控模式下的实例租约"""
+    instance_id: Mapped[str] = mapped_column(primary_key=True)  # 实例ID
+    heartbeat_time: Mapped[int] = mapped_column(index=True)  # 最近一次心跳时间戳
+
+
+class LeaderLease(Model):
+    """多实例部署时的主实例租约"""
+    name: Mapped[str] = mapped_column(primary_key=True)  # 租约名称
+    holder: Mapped[str] = mapped_column()  # 持有租约的实例ID
+    token: Mapped[int] = mapped_column()  # 防护令牌，每次易主时递增
+    expire_time: Mapped[int] = mapped_column()  # 租约过期时间戳
+
+
+class TokenQuarantine(Model):
+    """登录凭证失效的用户，监控按退避时间暂停"""
+    qq_id: Mapped[int] = mapped_column(primary_key=True)  # 用户QQ号作为主键
+    expired_time: Mapped[int] = mapped_column()  # 首次发现凭证失效的时间戳
+    retry_count: Mapped[int] = mapped_column(default=0)  # 失效后已重新检查的次数
+    next_retry_time: Mapped[int] = mapped_column()  # 下一次检查的时间戳，0表示停止监控直到重新登录
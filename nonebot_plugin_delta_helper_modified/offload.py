@@ -0,0 +1,97 @@
+"""
+CPU任务执行策略模块
+模板渲染、周报解析、大响应的JSON解码等同步计算默认在事件循环中直接执行，
+输入超过大小阈值，或同类任务最近的平均耗时超过阈值时改为在线程池中执行，
+避免单个大周报阻塞其他群的命令；每次执行都记录耗时，平均耗时回落后自动恢复直接执行
+"""
+import asyncio
+import contextvars
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Optional, TypeVar
+
+from .metrics import registry
+
+T = TypeVar('T')
+
+# 输入超过该大小（字节）时直接移出事件循环
+OFFLOAD_SIZE_THRESHOLD = 256 * 1024
+# 同类任务的平均耗时（秒）超过该值时移出事件循环
+OFFLOAD_DURATION_THRESHOLD = 0.01
+# 平均耗时的指数平滑系数
+OFFLOAD_EWMA_ALPHA = 0.2
+# 线程池大小
+OFFLOAD_WORKERS = 4
+
+cpu_task_latency = registry.histogram(
+    'delta_cpu_task_seconds', '同步计算任务的执行耗时，mode为inline（事件循环中执行）或executor（线程池中执行）', ('task', 'mode'),
+    buckets=(0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1))
+
+
+class CpuTaskPolicy:
+    """按输入大小和历史耗时决定同步计算在哪里执行"""
+
+    def __init__(self, size_threshold: int = OFFLOAD_SIZE_THRESHOLD, duration_threshold: float = OFFLOAD_DURATION_THRESHOLD, workers: int = OFFLOAD_WORKERS):
+        self.size_threshold = size_threshold
+        self.duration_threshold = duration_threshold
+        self.workers = workers
+        # 任务名 -> 平均耗时（秒）
+        self.averages: dict[str, float] = {}
+        self._executor: Optional[ThreadPoolExecutor] = None
+
+    def should_offload(self, task: str, size: int = 0) -> bool:
+        return size >= self.size_threshold or self.averages.get(task, 0.0) >= self.duration_threshold
+
+    def _record(self, task: str, mode: str, duration: float) -> None:
+        cpu_task_latency.observe(duration, task=task, mode=mode)
+        average = self.averages.get(task)
+        self.averages[task] = duration if average is None else average + OFFLOAD_EWMA_ALPHA * (duration - average)
+
+    async def run(self, task: str, func: Callable[..., T], *args: Any, size: int = 0) -> T:
+        """
+        执行同步计算
+
+        Args:
+            task: 任务名，同名任务共用平均耗时
+            func: 同步函数
+            args: 函数参数
+            size: 输入大小（字节），未知时为0，只按平均耗时判断
+        """
+        if not self.should_offload(task, size):
+            start = time.perf_counter()
+            try:
+                return func(*args)
+            finally:
+                self._record(task, 'inline', time.perf_counter() - start)
+
+        if self._executor is None:
+            self._executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix='delta-helper-cpu')
+
+        def timed() -> tuple[T, float]:
+            start = time.perf_counter()
+            result = func(*args)
+            return result, time.perf_counter() - start
+
+        # 复制上下文，线程中的代码仍在当前的追踪链路中
+        context = contextvars.copy_context()
+        start = time.perf_counter()
+        try:
+            result, duration = await asyncio.get_running_loop().run_in_executor(self._executor, context.run, timed)
+        except Exception:
+            self._record(task, 'executor', time.perf_counter() - start)
+            raise
+        self._record(task, 'executor', duration)
+        return result
+
+    def shutdown(self) -> None:
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
+
+
+# 全局执行策略
+cpu_policy = CpuTaskPolicy()
+
+async def run_cpu(task: str, func: Callable[..., T], *args: Any, size: int = 0) -> T:
+    """按全局执行策略执行同步计算"""
+    return await cpu_policy.run(task, func, *args, size=size)
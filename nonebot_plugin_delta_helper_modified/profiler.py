@@ -0,0 +1,178 @@
+"""
+采样性能分析模块
+在后台线程中按固定间隔采集事件循环线程的调用栈，按调用栈计数输出为折叠栈格式
+（每行"函数;函数;函数 次数"，可直接用flamegraph.pl或speedscope生成火焰图），
+同时记录采样开始和结束时所有asyncio任务的等待位置，用于在不重启机器人的情况下定位事件循环卡顿
+"""
+import asyncio
+import datetime
+import os
+import sys
+import threading
+from collections import Counter
+from pathlib import Path
+from types import CodeType, FrameType
+from typing import Any, Optional
+
+# 默认采样间隔（秒）
+DEFAULT_SAMPLE_INTERVAL = 0.005
+
+# 任务快照中每种协程最多列出的任务数
+TASK_SNAPSHOT_DETAIL_LIMIT = 20
+
+
+class SamplingProfiler:
+    """对单个线程定时采样调用栈的性能分析器"""
+
+    def __init__(self, interval: float = DEFAULT_SAMPLE_INTERVAL):
+        self.interval = interval
+        self.stacks: Counter[str] = Counter()
+        self.sample_count = 0
+        self._labels: dict[CodeType, str] = {}
+        self._target_thread: Optional[int] = None
+        self._thread: Optional[threading.Thread] = None
+        self._stop = threading.Event()
+
+    @property
+    def running(self) -> bool:
+        return self._thread is not None and self._thread.is_alive()
+
+    def _label(self, code: CodeType) -> str:
+        label = self._labels.get(code)
+        if label is None:
+            name = getattr(code, 'co_qualname', code.co_name)
+            # 折叠栈格式以分号分隔帧、以空格分隔次数，帧名中不能出现这两个字符
+            label = f"{name}({os.path.basename(code.co_filename)}:{code.co_firstlineno})".replace(';', ':').replace(' ', '_')
+            self._labels[code] = label
+        return label
+
+    def _sample(self, frame: FrameType) -> None:
+        stack: list[str] = []
+        current: Optional[FrameType] = frame
+        while current is not None:
+            stack.append(self._label(current.f_code))
+            current = current.f_back
+        stack.reverse()
+        self.stacks[';'.join(stack)] += 1
+        self.sample_count += 1
+
+    def _run(self) -> None:
+        while not self._stop.wait(self.interval):
+            frame = sys._current_frames().get(self._target_thread)
+            if frame is not None:
+                self._sample(frame)
+
+    def start(self, thread_id: Optional[int] = None) -> None:
+        """
+        开始采样
+
+        Args:
+            thread_id: 被采样的线程，默认为调用者所在的线程（即事件循环线程）
+        """
+        if self.running:
+            raise RuntimeError("性能分析已在进行中")
+        self._target_thread = thread_id or threading.get_ident()
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name='delta-helper-profiler', daemon=True)
+        self._thread.start()
+
+    def stop(self) -> None:
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+    def collapsed(self) -> str:
+        """折叠栈格式的采样结果"""
+        return ''.join(f"{stack} {count}\n" for stack, count in self.stacks.most_common())
+
+    def top_functions(self, limit: int = 10) -> list[tuple[str, int]]:
+        """按栈顶函数统计的采样数，即各函数自身（不含子调用）占用的时间"""
+        leaves: Counter[str] = Counter()
+        for stack, count in self.stacks.items():
+            leaves[stack.rsplit(';', 1)[-1]] += count
+        return leaves.most_common(limit)
+
+
+def _frame_location(frame: FrameType) -> str:
+    code = frame.f_code
+    return f"{getattr(code, 'co_qualname', code.co_name)} ({os.path.basename(code.co_filename)}:{frame.f_lineno})"
+
+def snapshot_tasks() -> tuple[Counter[str], str]:
+    """
+    记录当前事件循环中所有未完成的任务
+
+    Returns:
+        按协程统计的任务数，以及每个任务的名称和等待位置
+    """
+    tasks = [task for task in asyncio.all_tasks() if not task.done()]
+    groups: dict[str, list[str]] = {}
+    for task in tasks:
+        coro = task.get_coro()
+        coro_name = getattr(coro, '__qualname__', type(coro).__name__)
+        stack = task.get_stack()
+        # 协程调用链最内层的帧即任务当前等待的位置
+        waiting_at = _frame_location(stack[-1]) if stack else '未开始或正在运行'
+        groups.setdefault(coro_name, []).append(f"{task.get_name()} @ {waiting_at}")
+
+    counts = Counter({coro_name: len(entries) for coro_name, entries in groups.items()})
+    lines = [f"未完成任务数: {len(tasks)}"]
+    for coro_name, count in counts.most_common():
+        lines.append(f"\n{coro_name}: {count}")
+        entries = groups[coro_name]
+        lines.extend(f"  {entry}" for entry in entries[:TASK_SNAPSHOT_DETAIL_LIMIT])
+        if len(entries) > TASK_SNAPSHOT_DETAIL_LIMIT:
+            lines.append(f"  ...另有{len(entries) - TASK_SNAPSHOT_DETAIL_LIMIT}个")
+    return counts, '\n'.join(lines) + '\n'
+
+
+# 同一时间只允许一个采样
+_active_profiler: Optional[SamplingProfiler] = None
+
+def is_profiling() -> bool:
+    return _active_profiler is not None
+
+async def run_profile(seconds: float, output_dir: Path, interval: float = DEFAULT_SAMPLE_INTERVAL) -> dict[str, Any]:
+    """
+    对事件循环线程采样指定时长，把折叠栈和任务快照写入output_dir
+
+    Returns:
+        {'status': 是否成功, 'message': 说明, 'data': 输出文件、采样数、热点函数和任务统计}
+    """
+    global _active_profiler
+    if _active_profiler is not None:
+        return {'status': False, 'message': "已有性能分析在进行中", 'data': {}}
+
+    profiler = SamplingProfiler(interval)
+    _active_profiler = profiler
+    try:
+        _, tasks_before = snapshot_tasks()
+        profiler.start()
+        try:
+            await asyncio.sleep(seconds)
+        finally:
+            profiler.stop()
+        task_counts, tasks_after = snapshot_tasks()
+    finally:
+        _active_profiler = None
+
+    output_dir.mkdir(parents=True, exist_ok=True)
+    timestamp = datetime.datetime.now().strftime('%Y%m%d-%H%M%S')
+    profile_file = output_dir / f"profile-{timestamp}.collapsed"
+    tasks_file = output_dir / f"tasks-{timestamp}.txt"
+    profile_file.write_text(profiler.collapsed(), encoding='utf-8')
+    tasks_file.write_text(
+        f"=== 采样开始时 ===\n{tasks_before}\n=== 采样结束时 ===\n{tasks_after}",
+        encoding='utf-8'
+    )
+    return {
+        'status': True,
+        'message': "性能分析完成",
+        'data': {
+            'profile_file': profile_file,
+            'tasks_file': tasks_file,
+            'sample_count': profiler.sample_count,
+            'top_functions': profiler.top_functions(),
+            'task_counts': task_counts.most_common(),
+        }
+    }
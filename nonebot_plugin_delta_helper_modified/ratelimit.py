@@ -0,0 +1,140 @@
+"""
+上游请求限流模块
+所有发往官方接口的请求在发送前从全局令牌桶和所属接口的令牌桶各取一个令牌，
+令牌不足时排队等待；排队的请求按优先级分级，用户主动发起的命令优先于后台监控，
+同一优先级内按用户轮流放行，避免个别用户的大量请求占满额度
+"""
+import asyncio
+import time
+from collections import OrderedDict, deque
+from typing import Optional
+
+# 请求优先级，数值越小越优先
+PRIORITY_INTERACTIVE = 0
+PRIORITY_BACKGROUND = 1
+
+# 单个接口的速率（次/秒）和突发容量
+ENDPOINT_RATE = 8.0
+ENDPOINT_BURST = 16
+
+
+class TokenBucket:
+    """令牌桶"""
+
+    def __init__(self, rate: float, capacity: float):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = time.monotonic()
+
+    def _refill(self, now: float) -> None:
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def wait_time(self, now: float) -> float:
+        """获取到有一个可用令牌还需要等待的时间（秒）"""
+        self._refill(now)
+        if self.tokens >= 1:
+            return 0.0
+        return (1 - self.tokens) / self.rate
+
+    def take(self) -> None:
+        self.tokens -= 1
+
+
+class UpstreamLimiter:
+    """全局及单接口的异步限流器，排队时按优先级和用户公平放行"""
+
+    def __init__(self, global_rate: float, global_burst: float, endpoint_rate: float = ENDPOINT_RATE, endpoint_burst: float = ENDPOINT_BURST):
+        self._global = TokenBucket(global_rate, global_burst)
+        self._endpoint_rate = endpoint_rate
+        self._endpoint_burst = endpoint_burst
+        self._endpoints: dict[str, TokenBucket] = {}
+        # 优先级 -> 用户 -> 该用户排队中的(接口, Future)
+        self._queues: dict[int, OrderedDict[str, deque[tuple[str, asyncio.Future]]]] = {}
+        self._wakeup = asyncio.Event()
+        self._dispatcher: Optional[asyncio.Task] = None
+
+    def _endpoint_bucket(self, endpoint: str) -> TokenBucket:
+        bucket = self._endpoints.get(endpoint)
+        if bucket is None:
+            bucket = self._endpoints[endpoint] = TokenBucket(self._endpoint_rate, self._endpoint_burst)
+        return bucket
+
+    def _try_take(self, endpoint: str, now: float) -> float:
+        """尝试取得全局和接口令牌，成功返回0，否则返回需要等待的时间"""
+        wait = max(self._global.wait_time(now), self._endpoint_bucket(endpoint).wait_time(now))
+        if wait <= 0:
+            self._global.take()
+            self._endpoints[endpoint].take()
+        return wait
+
+    async def acquire(self, endpoint: str, user_key: str = '', priority: int = PRIORITY_INTERACTIVE) -> None:
+        """
+        等待直到允许发送请求
+
+        Args:
+            endpoint: 接口标识
+            user_key: 发起请求的用户标识，用于用户间的公平排队
+            priority: 请求优先级
+        """
+        # 没有排队的请求时直接取令牌
+        if not self._queues and self._try_take(endpoint, time.monotonic()) <= 0:
+            return
+
+        future = asyncio.get_running_loop().create_future()
+        users = self._queues.setdefault(priority, OrderedDict())
+        users.setdefault(user_key, deque()).append((endpoint, future))
+        if self._dispatcher is None or self._dispatcher.done():
+            self._dispatcher = asyncio.create_task(self._dispatch())
+        self._wakeup.set()
+        await future
+
+    def _grant(self) -> float:
+        """按优先级和用户轮流放行一个请求，返回0表示已放行，否则返回需要等待的时间"""
+        now = time.monotonic()
+        min_wait = float('inf')
+        for priority in sorted(self._queues):
+            users = self._queues[priority]
+            for user_key in list(users):
+                waiters = users[user_key]
+                # 丢弃已取消的等待
+                while waiters and waiters[0][1].done():
+                    waiters.popleft()
+                if not waiters:
+                    del users[user_key]
+                    continue
+                endpoint, future = waiters[0]
+                wait = self._try_take(endpoint, now)
+                if wait <= 0:
+                    waiters.popleft()
+                    future.set_result(None)
+                    # 放行后把该用户移到队尾
+                    if waiters:
+                        users.move_to_end(user_key)
+                    else:
+                        del users[user_key]
+                    if not users:
+                        del self._queues[priority]
+                    return 0.0
+                min_wait = min(min_wait, wait)
+                # 全局令牌不足时其他请求也无法放行
+                if self._global.wait_time(now) > 0:
+                    return min_wait
+            if not users:
+                del self._queues[priority]
+        return min_wait
+
+    async def _dispatch(self) -> None:
+        while self._queues:
+            wait = self._grant()
+            if wait <= 0:
+                continue
+            if wait == float('inf'):
+                break
+            self._wakeup.clear()
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), wait)
+            except asyncio.TimeoutError:
+                pass
+        self._dispatcher = None
@@ -0,0 +1,124 @@
+"""
+战绩模型
+官方战绩接口返回的每条烽火/战场战绩在获取时转换为紧凑的战绩对象，各字段只解析一次：
+数值字段统一为int，对局时间解析为datetime，之后的周报统计、播报判断、消息格式化和战绩查询都直接读取属性
+"""
+import datetime
+from typing import Any, Literal, Optional
+
+from .util import Util
+
+# 百万撤离判定阈值
+MILLION_PRICE = 1000000
+
+
+def _to_int(value: Any) -> int:
+    """把接口返回的数值字段（可能是字符串或None）转换为int，无法转换时为0"""
+    try:
+        return int(value or 0)
+    except (TypeError, ValueError):
+        return 0
+
+def _to_optional_int(value: Any) -> Optional[int]:
+    """同_to_int，但保留缺失值，无法转换时为None"""
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        return None
+
+
+class SolRecord:
+    """烽火战绩"""
+    __slots__ = (
+        'event_time_str', 'event_time', 'map_id', 'escape_fail_reason', 'duration', 'kill_count',
+        'final_price', 'flow_cal_gained_price', 'armed_force_id', 'room_id', 'rescue_teammate_count',
+    )
+
+    def __init__(self, data: dict) -> None:
+        """
+        Args:
+            data: 官方战绩接口返回的单条烽火战绩
+        """
+        # 原始时间字符串同时作为战绩ID
+        self.event_time_str: str = data.get('dtEventTime') or ''
+        self.event_time = Util.parse_event_time(self.event_time_str)
+        self.map_id = str(data.get('MapId', 0))
+        self.escape_fail_reason = _to_int(data.get('EscapeFailReason'))
+        self.duration = _to_int(data.get('DurationS'))
+        self.kill_count = _to_int(data.get('KillCount'))
+        # 带出价值，接口偶尔返回null，此时为None
+        self.final_price = _to_optional_int(data.get('FinalPrice', 0))
+        self.flow_cal_gained_price = _to_int(data.get('flowCalGainedPrice'))
+        self.armed_force_id = _to_int(data.get('ArmedForceId'))
+        self.room_id = str(data.get('RoomId', ''))
+        self.rescue_teammate_count = _to_int(data.get('RescueTeammateCount'))
+
+    @property
+    def record_id(self) -> str:
+        return self.event_time_str
+
+    @property
+    def end_time(self) -> Optional[datetime.datetime]:
+        """判断播报时效使用的时间，烽火战绩的时间即对局结束时间"""
+        return self.event_time
+
+    @property
+    def is_escape(self) -> bool:
+        return self.escape_fail_reason == 1
+
+    @property
+    def loss(self) -> int:
+        """战损，即带出价值减去纯利润"""
+        return (self.final_price or 0) - self.flow_cal_gained_price
+
+    def classify(self) -> Literal["gain", "loss"]|None:
+        """判断是否需要播报，百万撤离返回gain，百万战损返回loss，不需要播报返回None"""
+        if not self.duration or self.final_price is None:
+            return None
+        if self.flow_cal_gained_price > MILLION_PRICE:
+            return "gain"
+        if self.loss > MILLION_PRICE:
+            return "loss"
+        return None
+
+
+class TdmRecord:
+    """战场战绩"""
+    __slots__ = (
+        'event_time_str', 'event_time', 'end_time', 'map_id', 'match_result', 'kill_num', 'death', 'assist',
+        'total_score', 'game_time', 'armed_force_id', 'room_id', 'rescue_teammate_count',
+    )
+
+    def __init__(self, data: dict) -> None:
+        """
+        Args:
+            data: 官方战绩接口返回的单条战场战绩
+        """
+        # 原始时间字符串同时作为战绩ID，战场战绩的时间为对局开始时间
+        self.event_time_str: str = data.get('dtEventTime') or ''
+        self.event_time = Util.parse_event_time(self.event_time_str)
+        self.end_time = self.event_time + datetime.timedelta(seconds=_to_int(data.get('GameTime'))) if self.event_time else None
+        self.map_id = str(data.get('MapID', 0))
+        self.match_result = _to_int(data.get('MatchResult'))
+        self.kill_num = _to_int(data.get('KillNum'))
+        self.death = _to_int(data.get('Death'))
+        self.assist = _to_int(data.get('Assist'))
+        self.total_score = _to_int(data.get('TotalScore'))
+        self.game_time = _to_int(data.get('gametime'))
+        self.armed_force_id = _to_int(data.get('ArmedForceId'))
+        self.room_id = str(data.get('RoomId', ''))
+        self.rescue_teammate_count = _to_int(data.get('RescueTeammateCount'))
+
+    @property
+    def record_id(self) -> str:
+        return self.event_time_str
+
+    @property
+    def avg_score_per_minute(self) -> int:
+        return int(self.total_score * 60 / self.game_time) if self.game_time > 0 else 0
+
+
+Record = SolRecord|TdmRecord
+
+# 战绩类型 -> 战绩模型，4为烽火, 5为战场
+RECORD_TYPES: dict[int, type[SolRecord]|type[TdmRecord]] = {4: SolRecord, 5: TdmRecord}
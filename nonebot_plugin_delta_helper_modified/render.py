@@ -10,6 +10,9 @@ from typing import Any, Dict, Optional
 from jinja2 import Environment, FileSystemLoader
 from playwright.async_api import async_playwright
 from nonebot.log import logger
+from .metrics import render_latency, render_queue_depth
+from .offload import run_cpu
+from .trace import span
 
 
 class CardRenderer:
@@ -106,6 +109,14 @@ class CardRenderer:
         Returns:
             图片的二进制数据
         """
+        render_queue_depth.inc()
+        try:
+            with render_latency.time(template=template_name), span('render_card', template=template_name):
+                return await self._render_card(template_name, data)
+        finally:
+            render_queue_depth.dec()
+
+    async def _render_card(self, template_name: str, data: Dict[str, Any]) -> bytes:
         max_retries = 2
         for attempt in range(max_retries):
             page = None
@@ -115,7 +126,7 @@ class CardRenderer:
                 
                 # 渲染模板
                 template = self.env.get_template(template_name)
-                html = template.render(**data)
+                html = await run_cpu(f'template:{template_name}', template.render, data)
                 
                 # 创建新页面
                 if not self.context:
@@ -0,0 +1,243 @@
+"""
+周报统计模块
+战绩监控任务拉取到新的烽火/战场战绩时，在本地按周增量累计周报数据；
+周报和AI锐评优先使用本地统计，本地没有完整数据时才回退到官方周报接口
+"""
+import datetime
+import json
+import re
+from typing import Any, Dict, Literal, Optional
+from nonebot.log import logger
+
+from .db import UserDataDatabase
+from .model import WeeklyReportStat
+from .records import MILLION_PRICE, Record, SolRecord, TdmRecord
+from .trace import trace_methods, traced
+from .util import Util
+
+
+@traced()
+def parse_weekly_report(data: Dict[str, Any]) -> Dict[str, Any]:
+    """将官方周报接口返回的数据解析为统一的周报格式"""
+    # 解析使用干员信息
+    total_ArmedForceId_num = data.get('total_ArmedForceId_num', '')
+    total_ArmedForceId_num = total_ArmedForceId_num.replace("'", '"')
+    armed_force_list = list(map(json.loads, total_ArmedForceId_num.split('#'))) if total_ArmedForceId_num else []
+    armed_force_list.sort(key=lambda x: x['inum'], reverse=True)
+
+    # 解析游玩地图信息
+    total_mapid_num = data.get('total_mapid_num', '')
+    total_mapid_num = total_mapid_num.replace("'", '"')
+    map_list = list(map(json.loads, total_mapid_num.split('#'))) if total_mapid_num else []
+    map_list.sort(key=lambda x: x['inum'], reverse=True)
+
+    # 解析资产变化
+    def extract_price(text: str) -> str:
+        m = re.match(r'(\w+)-(\d+)-(\d+)', text)
+        if m:
+            return m.group(3)
+        return ""
+    price_list = list(map(extract_price, data.get('Total_Price', '').split(',')))
+    try:
+        rise_price = int(price_list[-1]) - int(price_list[0])
+    except ValueError:
+        price_list = []
+        rise_price = int(data.get('rise_Price', 0))
+
+    return {
+        'source': 'upstream',
+        'gained_price': int(data.get('Gained_Price', 0)),
+        'consume_price': int(data.get('consume_Price', 0)),
+        'rise_price': rise_price,
+        'price_list': price_list,
+        'sol_num': int(data.get('total_sol_num', 0)),
+        'escape_num': int(data.get('total_exacuation_num', 0)),
+        'overmillion_num': int(data.get('GainedPrice_overmillion_num', 0)),
+        'kill_num': int(data.get('total_Kill_Player', 0)),
+        'death_num': int(data.get('total_Death_Count', 0)),
+        'online_time': int(data.get('total_Online_Time', 0)),
+        'armed_force_list': armed_force_list,
+        'map_list': map_list,
+    }
+
+
+@trace_methods
+class WeeklyReportEngine:
+    """本地周报统计引擎"""
+
+    def __init__(self, user_data_database: UserDataDatabase):
+        self.user_data_database = user_data_database
+
+    async def ingest_sol_records(self, qq_id: int, records: list[SolRecord], reached_checkpoint: bool = True) -> list[SolRecord]:
+        """
+        累计新的烽火战绩到周报统计
+
+        Args:
+            qq_id: 用户QQ号
+            records: 官方接口返回的烽火战绩（新的在前）
+            reached_checkpoint: 获取战绩时是否翻页到了已统计到的战绩，为False时两者之间可能有遗漏的战绩
+
+        Returns:
+            本次新统计的战绩，按时间从旧到新排列
+        """
+        return await self._ingest_records(qq_id, records, 'sol', reached_checkpoint)
+
+    async def ingest_tdm_records(self, qq_id: int, records: list[TdmRecord], reached_checkpoint: bool = True) -> list[TdmRecord]:
+        """累计新的战场战绩到周统计，参数与返回值同ingest_sol_records"""
+        return await self._ingest_records(qq_id, records, 'tdm', reached_checkpoint)
+
+    async def get_last_event_time(self, qq_id: int, mode: Literal["sol", "tdm"]) -> Optional[datetime.datetime]:
+        """获取已统计到的最新战绩时间，没有统计过返回None"""
+        latest_stat = await self.user_data_database.get_latest_weekly_report_stat(qq_id)
+        return self._get_cursor(latest_stat, mode)
+
+    @staticmethod
+    def _get_cursor(latest_stat: Optional[WeeklyReportStat], mode: Literal["sol", "tdm"]) -> Optional[datetime.datetime]:
+        if not latest_stat:
+            return None
+        return Util.parse_event_time(latest_stat.last_event_time if mode == 'sol' else latest_stat.last_tdm_event_time)
+
+    async def _ingest_records(self, qq_id: int, records: list[Record], mode: Literal["sol", "tdm"], reached_checkpoint: bool) -> list[Record]:
+        latest_stat = await self.user_data_database.get_latest_weekly_report_stat(qq_id)
+        last_event_time = self._get_cursor(latest_stat, mode)
+
+        new_records = [
+            record for record in records
+            if record.event_time and not (last_event_time and record.event_time <= last_event_time)
+        ]
+        if not new_records:
+            return []
+        new_records.sort(key=lambda record: record.event_time)
+
+        earliest_stat_date = Util.get_week_stat_date(new_records[0].event_time)
+        # 本批战绩是否与该模式已统计的战绩首尾相接。该模式没有统计过，或获取时没有翻页到检查点，
+        # 说明检查点（没有时为最早）与本批最早的战绩之间可能有遗漏，
+        # 这段时间内的各周（包括另一种模式先创建的周）中该模式不再视为完整，另一种模式不受影响
+        continuous = reached_checkpoint and last_event_time is not None
+        if not continuous:
+            gap_start = Util.get_week_stat_date(last_event_time) if last_event_time else None
+            await self.user_data_database.mark_weekly_report_stats_incomplete(qq_id, mode, gap_start, earliest_stat_date)
+
+        stats: dict[str, WeeklyReportStat] = {}
+        for record in new_records:
+            stat_date = Util.get_week_stat_date(record.event_time)
+            stat = stats.get(stat_date)
+            if not stat:
+                stat = await self.user_data_database.get_weekly_report_stat(qq_id, stat_date)
+            if not stat:
+                # 与之前的统计相接，或本批战绩早于该周的开始，说明该模式在该周的战绩都已被覆盖；
+                # 另一种模式之后统计到该周时，如有遗漏会再标记为不完整
+                complete = continuous or earliest_stat_date < stat_date
+                stat = WeeklyReportStat(
+                    qq_id=qq_id,
+                    stat_date=stat_date,
+                    sol_num=0,
+                    escape_num=0,
+                    kill_num=0,
+                    death_num=0,
+                    overmillion_num=0,
+                    gained_price=0,
+                    consume_price=0,
+                    online_time=0,
+                    armed_force_num='{}',
+                    map_num='{}',
+                    # 新的一周沿用之前的统计进度，避免另一种模式重复统计
+                    last_event_time=latest_stat.last_event_time if latest_stat else '',
+                    sol_complete=complete or mode != 'sol',
+                    tdm_num=0,
+                    tdm_kill_num=0,
+                    tdm_total_score=0,
+                    tdm_game_time=0,
+                    last_tdm_event_time=latest_stat.last_tdm_event_time if latest_stat else '',
+                    tdm_complete=complete or mode != 'tdm'
+                )
+            stats[stat_date] = stat
+            if mode == 'sol':
+                self._accumulate_sol(stat, record)
+            else:
+                self._accumulate_tdm(stat, record)
+
+        # 检查点从最近一周的统计中读取，本批战绩都早于最近一周时（如另一种模式已统计到更新的周），
+        # 也要推进最近一周上该模式的检查点，否则下次会重复统计这些战绩
+        if latest_stat and latest_stat.stat_date > max(stats):
+            latest_event_time_str = new_records[-1].event_time_str
+            if mode == 'sol':
+                latest_stat.last_event_time = latest_event_time_str
+            else:
+                latest_stat.last_tdm_event_time = latest_event_time_str
+            stats[latest_stat.stat_date] = latest_stat
+
+        for stat in stats.values():
+            await self.user_data_database.update_weekly_report_stat(stat)
+        return new_records
+
+    @staticmethod
+    def _accumulate_sol(stat: WeeklyReportStat, record: SolRecord) -> None:
+        """把单条烽火战绩累计到周报统计中"""
+        stat.sol_num += 1
+        stat.kill_num += record.kill_count
+        stat.online_time += record.duration
+        stat.gained_price += record.final_price or 0
+        stat.consume_price += record.loss
+        if record.is_escape:
+            stat.escape_num += 1
+        else:
+            # 撤离失败即计为死亡
+            stat.death_num += 1
+        if record.flow_cal_gained_price > MILLION_PRICE:
+            stat.overmillion_num += 1
+
+        armed_force_num = json.loads(stat.armed_force_num)
+        armed_force_id = str(record.armed_force_id)
+        armed_force_num[armed_force_id] = armed_force_num.get(armed_force_id, 0) + 1
+        stat.armed_force_num = json.dumps(armed_force_num)
+
+        map_num = json.loads(stat.map_num)
+        map_num[record.map_id] = map_num.get(record.map_id, 0) + 1
+        stat.map_num = json.dumps(map_num)
+
+        stat.last_event_time = record.event_time_str
+
+    @staticmethod
+    def _accumulate_tdm(stat: WeeklyReportStat, record: TdmRecord) -> None:
+        """把单条战场战绩累计到周统计中"""
+        stat.tdm_num += 1
+        stat.tdm_kill_num += record.kill_num
+        stat.tdm_total_score += record.total_score
+        stat.tdm_game_time += record.game_time
+        stat.last_tdm_event_time = record.event_time_str
+
+    async def get_weekly_report(self, qq_id: int, stat_date: str) -> Optional[Dict[str, Any]]:
+        """获取本地统计的周报，烽火统计不完整或没有对局时返回None"""
+        stat = await self.user_data_database.get_weekly_report_stat(qq_id, stat_date)
+        if not stat or not stat.sol_complete or stat.sol_num <= 0:
+            return None
+
+        armed_force_list = [
+            {'ArmedForceId': int(armed_force_id), 'inum': num}
+            for armed_force_id, num in json.loads(stat.armed_force_num).items()
+        ]
+        armed_force_list.sort(key=lambda x: x['inum'], reverse=True)
+        map_list = [
+            {'MapId': int(map_id), 'inum': num}
+            for map_id, num in json.loads(stat.map_num).items()
+        ]
+        map_list.sort(key=lambda x: x['inum'], reverse=True)
+
+        logger.debug(f"使用本地周报统计: {qq_id} - {stat_date}")
+        return {
+            'source': 'local',
+            'gained_price': stat.gained_price,
+            'consume_price': stat.consume_price,
+            # 资产曲线只有官方接口提供
+            'rise_price': None,
+            'price_list': [],
+            'sol_num': stat.sol_num,
+            'escape_num': stat.escape_num,
+            'overmillion_num': stat.overmillion_num,
+            'kill_num': stat.kill_num,
+            'death_num': stat.death_num,
+            'online_time': stat.online_time,
+            'armed_force_list': armed_force_list,
+            'map_list': map_list,
+        }
@@ -0,0 +1,140 @@
+"""
+上游请求容错模块
+请求失败（连接错误、超时、5xx）时对幂等的查询按带随机抖动的指数退避重试；
+每个域名维护一个熔断器，连续失败达到阈值后在冷却时间内直接拒绝请求，
+冷却结束后放行一个探测请求，成功则恢复，失败则继续熔断
+"""
+import asyncio
+import random
+import time
+from typing import Awaitable, Callable
+import httpx
+from nonebot.log import logger
+
+# 请求超时（秒），连接超时单独收紧，避免上游卡住时长时间占用监控任务
+REQUEST_TIMEOUT = httpx.Timeout(10, connect=5)
+
+# 重试次数（不含首次请求）和退避时间（秒）
+RETRY_ATTEMPTS = 2
+RETRY_BASE_DELAY = 0.5
+RETRY_MAX_DELAY = 4
+
+# 熔断阈值（连续失败次数）和冷却时间（秒）
+BREAKER_FAILURE_THRESHOLD = 5
+BREAKER_RESET_TIMEOUT = 30
+
+
+class CircuitOpenError(Exception):
+    """熔断期间拒绝请求"""
+
+    def __init__(self, host: str, retry_after: float):
+        super().__init__(f"{host}请求连续失败，暂停请求{retry_after:.0f}秒")
+        self.host = host
+        self.retry_after = retry_after
+
+
+class CircuitBreaker:
+    """熔断器"""
+
+    def __init__(self, failure_threshold: int = BREAKER_FAILURE_THRESHOLD, reset_timeout: float = BREAKER_RESET_TIMEOUT):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.failures = 0
+        self._opened_at: float|None = None
+        self._probing = False
+
+    @property
+    def retry_after(self) -> float:
+        """距离冷却结束的时间（秒），未熔断时为0"""
+        if self._opened_at is None:
+            return 0.0
+        return max(0.0, self._opened_at + self.reset_timeout - time.monotonic())
+
+    @property
+    def is_open(self) -> bool:
+        """是否处于熔断中，冷却结束等待探测时也视为熔断中"""
+        return self._opened_at is not None and (self.retry_after > 0 or self._probing)
+
+    def allow_request(self) -> tuple[bool, bool]:
+        """
+        判断是否放行请求，冷却结束后只放行一个探测请求
+
+        Returns:
+            (是否放行, 是否占用了探测名额)
+        """
+        if self._opened_at is None:
+            return True, False
+        if self.retry_after > 0 or self._probing:
+            return False, False
+        self._probing = True
+        return True, True
+
+    def release_probe(self) -> None:
+        """
+        探测请求没有得到结果（被取消或发送前出错）时释放探测名额，下一个请求重新探测。
+        只能由占用了探测名额的请求调用，否则会让其他进行中的探测失效
+        """
+        self._probing = False
+
+    def record_success(self) -> None:
+        self.failures = 0
+        self._opened_at = None
+        self._probing = False
+
+    def record_failure(self) -> None:
+        self.failures += 1
+        if self._probing or self.failures >= self.failure_threshold:
+            self._opened_at = time.monotonic()
+            self._probing = False
+
+
+# 域名 -> 熔断器
+circuit_breakers: dict[str, CircuitBreaker] = {}
+
+def get_breaker(host: str) -> CircuitBreaker:
+    breaker = circuit_breakers.get(host)
+    if breaker is None:
+        breaker = circuit_breakers[host] = CircuitBreaker()
+    return breaker
+
+async def send_with_retry(host: str, send: Callable[[], Awaitable[httpx.Response]], retry: bool = True) -> httpx.Response:
+    """
+    经过熔断器发送请求，失败时按需重试
+
+    Args:
+        host: 请求的域名，每个域名共用一个熔断器
+        send: 发送一次请求的函数
+        retry: 是否允许重试，只有幂等的请求才能重试
+
+    Raises:
+        CircuitOpenError: 熔断期间拒绝请求
+    """
+    breaker = get_breaker(host)
+    attempts = 1 + (RETRY_ATTEMPTS if retry else 0)
+    for attempt in range(attempts):
+        allowed, probing = breaker.allow_request()
+        if not allowed:
+            raise CircuitOpenError(host, breaker.retry_after)
+        try:
+            response = await send()
+        except (httpx.TimeoutException, httpx.TransportError) as e:
+            breaker.record_failure()
+            if attempt == attempts - 1:
+                raise
+            logger.warning(f"请求{host}失败，准备重试: {type(e).__name__}")
+        except BaseException:
+            # 任务被取消或发送过程中出现其他异常时没有上游的结果，不计入失败，
+            # 但本请求是探测请求时必须释放探测名额，否则熔断器会一直停留在等待探测的状态
+            if probing:
+                breaker.release_probe()
+            raise
+        else:
+            if response.status_code < 500:
+                breaker.record_success()
+                return response
+            breaker.record_failure()
+            if attempt == attempts - 1:
+                return response
+            logger.warning(f"请求{host}失败，准备重试: HTTP {response.status_code}")
+        await asyncio.sleep(random.uniform(0, min(RETRY_MAX_DELAY, RETRY_BASE_DELAY * 2 ** attempt)))
+    raise AssertionError("unreachable")
@@ -0,0 +1,142 @@
+"""
+定时队列模块
+用最小堆维护按截止时间排序的任务，调度器中只保留一个在最早截止时间触发的任务，
+到期后把回调交给后台任务执行并立即重新设置下一次触发时间，慢回调不会推迟后面的截止时间
+"""
+import asyncio
+import datetime
+import heapq
+import itertools
+import time
+from typing import Awaitable, Callable, Generic, Hashable, Optional, TypeVar
+from nonebot.log import logger
+from nonebot_plugin_apscheduler import scheduler
+
+K = TypeVar('K', bound=Hashable)
+
+
+class DeadlineQueue(Generic[K]):
+    """按截止时间触发回调的定时队列，同一个键只保留最后一次设置的截止时间"""
+
+    def __init__(self, job_id: str, callback: Callable[[K, float], Awaitable[None]], concurrency: int = 1):
+        """
+        Args:
+            job_id: 调度器中的任务ID
+            callback: 到期时调用的回调，参数为键和截止时间戳
+            concurrency: 同时到期时并发执行的回调数
+        """
+        self.job_id = job_id
+        self.callback = callback
+        self.concurrency = concurrency
+        self._heap: list[tuple[float, int, K]] = []
+        self._deadlines: dict[K, float] = {}
+        self._counter = itertools.count()
+        self._armed_at: Optional[float] = None
+        self._firing = False
+        # 已出堆但还在等待并发额度的回调数
+        self._waiting = 0
+        # 所有批次共用的并发限制
+        self._semaphore = asyncio.Semaphore(concurrency)
+        # 正在执行回调的键，以及执行期间再次到期、等回调结束后再触发的键 -> 截止时间戳
+        self._running: set[K] = set()
+        self._deferred: dict[K, float] = {}
+        # 持有后台任务的引用，避免执行中被回收
+        self._tasks: set[asyncio.Task[None]] = set()
+
+    def __len__(self) -> int:
+        return len(self._deadlines)
+
+    def __contains__(self, key: K) -> bool:
+        return key in self._deadlines
+
+    def keys(self) -> list[K]:
+        """获取队列中所有的键"""
+        return list(self._deadlines)
+
+    def get(self, key: K) -> Optional[float]:
+        """获取键当前的截止时间戳"""
+        return self._deadlines.get(key)
+
+    def backlog(self, now: Optional[float] = None) -> int:
+        """已到截止时间但回调还未开始执行的键数"""
+        now = time.time() if now is None else now
+        return self._waiting + len(self._deferred) + sum(1 for deadline in self._deadlines.values() if deadline <= now)
+
+    def push(self, key: K, deadline: float) -> None:
+        """设置键的截止时间戳，已存在时覆盖"""
+        if self._deadlines.get(key) == deadline:
+            return
+        self._deadlines[key] = deadline
+        heapq.heappush(self._heap, (deadline, next(self._counter), key))
+        # 被覆盖的旧条目留在堆中，过多时重建
+        if len(self._heap) > 2 * len(self._deadlines) + 64:
+            self._heap = [(d, next(self._counter), k) for k, d in self._deadlines.items()]
+            heapq.heapify(self._heap)
+        self._arm()
+
+    def remove(self, key: K) -> None:
+        """移除键，堆中的条目在出堆时跳过"""
+        self._deferred.pop(key, None)
+        if self._deadlines.pop(key, None) is not None:
+            self._arm()
+
+    def _peek(self) -> Optional[float]:
+        """获取最早的有效截止时间，同时丢弃堆顶已失效的条目"""
+        while self._heap:
+            deadline, _, key = self._heap[0]
+            if self._deadlines.get(key) == deadline:
+                return deadline
+            heapq.heappop(self._heap)
+        return None
+
+    def _arm(self) -> None:
+        """让调度器任务在最早的截止时间触发"""
+        if self._firing:
+            return
+        deadline = self._peek()
+        if deadline == self._armed_at:
+            return
+        self._armed_at = deadline
+        if deadline is None:
+            if scheduler.get_job(self.job_id):
+                scheduler.remove_job(self.job_id)
+            return
+        run_date = datetime.datetime.fromtimestamp(max(deadline, time.time()))
+        # 出堆结束时会重新设置任务，此时上一次执行还未计数完成，需要允许两个实例
+        scheduler.add_job(self._fire, 'date', run_date=run_date, id=self.job_id, replace_existing=True, misfire_grace_time=None, max_instances=2)
+
+    async def _run(self, key: K, deadline: float) -> None:
+        """在并发限制内执行一个回调，结束后触发执行期间再次到期的同一个键"""
+        try:
+            async with self._semaphore:
+                self._waiting -= 1
+                try:
+                    await self.callback(key, deadline)
+                except Exception as e:
+                    logger.exception(f"定时任务回调失败: {self.job_id} - {key}: {e}")
+        finally:
+            self._running.discard(key)
+            deferred = self._deferred.pop(key, None)
+            if deferred is not None and key not in self._deadlines:
+                self.push(key, deferred)
+
+    async def _fire(self) -> None:
+        self._firing = True
+        self._armed_at = None
+        try:
+            now = time.time()
+            while (deadline := self._peek()) is not None and deadline <= now:
+                _, _, key = heapq.heappop(self._heap)
+                del self._deadlines[key]
+                # 同一个键的上一次回调还在执行时，等其结束后再触发，避免同一个键的回调并发执行
+                if key in self._running:
+                    self._deferred[key] = deadline
+                    continue
+                self._running.add(key)
+                self._waiting += 1
+                task = asyncio.create_task(self._run(key, deadline))
+                self._tasks.add(task)
+                task.add_done_callback(self._tasks.discard)
+        finally:
+            self._firing = False
+            self._arm()
@@ -0,0 +1,234 @@
+"""
+链路追踪模块
+以命令为单位记录一次处理过程中各阶段的耗时：命令处理函数的根跨度下嵌套DeltaApi接口、
+每次上游请求、数据库操作和卡片渲染等子跨度，跨度通过contextvars在异步调用链中传递。
+命令结束后链路先放入缓冲区，定期在线程池中按行写入JSONL文件，不在事件循环中读写文件；
+耗时超过阈值时在日志中输出各跨度的耗时明细。
+不在命令中的调用（如后台监控）不记录跨度，几乎没有额外开销
+"""
+import asyncio
+import functools
+import inspect
+import json
+import time
+import uuid
+from collections import deque
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Any, Callable, Iterator, Optional, TypeVar
+from nonebot import get_plugin_config
+from nonebot.exception import MatcherException
+from nonebot.log import logger
+
+from .config import Config
+
+F = TypeVar('F', bound=Callable[..., Any])
+
+config = get_plugin_config(Config)
+trace_file = config.delta_helper_trace_file
+slow_command_threshold = config.delta_helper_slow_command_threshold
+
+# 单条链路最多记录的跨度数，防止异常循环时占用过多内存
+MAX_SPANS_PER_TRACE = 2000
+# 缓冲的链路写入文件的间隔（秒）
+TRACE_FLUSH_INTERVAL = 5
+# 最多缓冲的链路数，写入跟不上时丢弃最早的链路
+MAX_PENDING_TRACES = 1000
+
+
+class Span:
+    """跨度，记录一个阶段的开始和结束时间"""
+    __slots__ = ('trace', 'name', 'span_id', 'parent_id', 'start', 'end', 'attributes', 'error')
+
+    def __init__(self, trace: 'Trace', name: str, parent_id: Optional[str], attributes: dict[str, Any]):
+        self.trace = trace
+        self.name = name
+        self.span_id = uuid.uuid4().hex[:16]
+        self.parent_id = parent_id
+        self.start = time.perf_counter()
+        self.end: Optional[float] = None
+        self.attributes = attributes
+        self.error: Optional[str] = None
+
+    @property
+    def duration(self) -> float:
+        return (self.end if self.end is not None else time.perf_counter()) - self.start
+
+    def set_attribute(self, key: str, value: Any) -> None:
+        self.attributes[key] = value
+
+
+class Trace:
+    """一次命令处理的链路"""
+
+    def __init__(self, name: str):
+        self.trace_id = uuid.uuid4().hex
+        self.name = name
+        self.timestamp = time.time()
+        self.spans: list[Span] = []
+        self.dropped = 0
+
+    def add(self, span: Span) -> None:
+        if len(self.spans) < MAX_SPANS_PER_TRACE:
+            self.spans.append(span)
+        else:
+            self.dropped += 1
+
+    def to_dict(self) -> dict[str, Any]:
+        root = self.spans[0]
+        return {
+            'trace_id': self.trace_id,
+            'name': self.name,
+            'timestamp': self.timestamp,
+            'duration_ms': round(root.duration * 1000, 2),
+            'dropped_spans': self.dropped,
+            'spans': [
+                {
+                    'span_id': span.span_id,
+                    'parent_id': span.parent_id,
+                    'name': span.name,
+                    'start_ms': round((span.start - root.start) * 1000, 2),
+                    'duration_ms': round(span.duration * 1000, 2),
+                    'attributes': span.attributes,
+                    'error': span.error,
+                }
+                for span in self.spans
+            ],
+        }
+
+    def breakdown(self) -> str:
+        """按调用层级输出各跨度的耗时"""
+        children: dict[Optional[str], list[Span]] = {}
+        for span in self.spans:
+            children.setdefault(span.parent_id, []).append(span)
+        lines: list[str] = []
+        def walk(span: Span, depth: int) -> None:
+            attributes = ' '.join(f"{key}={value}" for key, value in span.attributes.items())
+            error = f" [{span.error}]" if span.error else ''
+            lines.append(f"{'  ' * depth}{span.name} {span.duration * 1000:.0f}ms {attributes}{error}".rstrip())
+            for child in children.get(span.span_id, []):
+                walk(child, depth + 1)
+        walk(self.spans[0], 0)
+        if self.dropped:
+            lines.append(f"另有{self.dropped}个跨度未记录")
+        return '\n'.join(lines)
+
+
+_current_span: ContextVar[Optional[Span]] = ContextVar('delta_helper_current_span', default=None)
+
+
+def current_span() -> Optional[Span]:
+    """获取当前的跨度，不在命令链路中时为None"""
+    return _current_span.get()
+
+@contextmanager
+def span(name: str, **attributes: Any) -> Iterator[Optional[Span]]:
+    """
+    在当前链路中记录一个子跨度，不在链路中时什么也不做
+
+    Args:
+        name: 跨度名称
+        attributes: 跨度属性，如接口名、模板名
+    """
+    parent = _current_span.get()
+    if parent is None:
+        yield None
+        return
+    child = Span(parent.trace, name, parent.span_id, attributes)
+    parent.trace.add(child)
+    token = _current_span.set(child)
+    try:
+        yield child
+    except MatcherException:
+        # finish、reject等是命令的正常结束方式
+        raise
+    except BaseException as e:
+        child.error = type(e).__name__
+        raise
+    finally:
+        child.end = time.perf_counter()
+        _current_span.reset(token)
+
+def traced(name: Optional[str] = None) -> Callable[[F], F]:
+    """把函数的每次调用记录为一个跨度，支持同步和异步函数"""
+    def decorator(func: F) -> F:
+        span_name = name or func.__qualname__
+        if inspect.iscoroutinefunction(func):
+            @functools.wraps(func)
+            async def async_wrapper(*args, **kwargs):
+                if _current_span.get() is None:
+                    return await func(*args, **kwargs)
+                with span(span_name):
+                    return await func(*args, **kwargs)
+            return async_wrapper  # type: ignore[return-value]
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            if _current_span.get() is None:
+                return func(*args, **kwargs)
+            with span(span_name):
+                return func(*args, **kwargs)
+        return wrapper  # type: ignore[return-value]
+    return decorator
+
+def trace_methods(cls: type) -> type:
+    """把类中所有公开的异步方法记录为跨度"""
+    for attr, value in list(vars(cls).items()):
+        if not attr.startswith('_') and inspect.iscoroutinefunction(value):
+            setattr(cls, attr, traced(f"{cls.__name__}.{attr}")(value))
+    return cls
+
+# 等待写入文件的链路
+_pending_traces: deque[Trace] = deque(maxlen=MAX_PENDING_TRACES)
+# 保证同一时间只有一次写入，避免多次追加的内容交错
+_flush_lock = asyncio.Lock()
+
+def _write_traces(traces: list[Trace]) -> None:
+    with open(trace_file, 'a', encoding='utf-8') as f:
+        f.writelines(json.dumps(trace.to_dict(), ensure_ascii=False, default=str) + '\n' for trace in traces)
+
+async def flush_traces() -> None:
+    """把缓冲的链路写入追踪文件，序列化和文件读写都在线程池中执行"""
+    async with _flush_lock:
+        if not _pending_traces:
+            return
+        traces = list(_pending_traces)
+        _pending_traces.clear()
+        try:
+            await asyncio.get_running_loop().run_in_executor(None, _write_traces, traces)
+        except Exception as e:
+            logger.error(f"写入链路追踪文件失败: {e}")
+
+def _export(trace: Trace) -> None:
+    duration = trace.spans[0].duration
+    if trace_file:
+        _pending_traces.append(trace)
+    if slow_command_threshold > 0 and duration >= slow_command_threshold:
+        logger.warning(f"命令执行缓慢: {trace.name} 耗时{duration:.2f}秒\n{trace.breakdown()}")
+
+def trace_command(name: str) -> Callable[[F], F]:
+    """
+    把命令处理函数记录为一条链路的根跨度
+
+    放在matcher.handle()之下，保留原函数签名以便NoneBot注入依赖
+    """
+    def decorator(func: F) -> F:
+        @functools.wraps(func)
+        async def wrapper(*args, **kwargs):
+            trace = Trace(name)
+            root = Span(trace, name, None, {})
+            trace.add(root)
+            token = _current_span.set(root)
+            try:
+                return await func(*args, **kwargs)
+            except MatcherException:
+                raise
+            except BaseException as e:
+                root.error = type(e).__name__
+                raise
+            finally:
+                root.end = time.perf_counter()
+                _current_span.reset(token)
+                _export(trace)
+        return wrapper  # type: ignore[return-value]
+    return decorator
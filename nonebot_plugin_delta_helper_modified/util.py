@@ -151,6 +151,29 @@ class Util:
         sunday = today - datetime.timedelta(days=days_to_last_sunday)
         return sunday.strftime('%Y%m%d'), sunday.strftime('%Y-%m-%d')
 
+    @staticmethod
+    def get_week_stat_date(event_time: datetime.datetime) -> str:
+        """获取某个时间所在周的周报日期
+
+        Args:
+            event_time: 对局时间
+
+        Returns:
+            该周周日的日期字符串，格式为"YYYYMMDD"，与get_Sunday_date保持一致
+        """
+        sunday = event_time + datetime.timedelta(days=6 - event_time.weekday())
+        return sunday.strftime('%Y%m%d')
+
+    @staticmethod
+    def parse_event_time(event_time_str: str) -> datetime.datetime|None:
+        """解析战绩时间字符串，如"2025-07-20 20: 04: 29"，解析失败返回None"""
+        if not event_time_str:
+            return None
+        try:
+            return datetime.datetime.strptime(event_time_str.replace(' : ', ':'), '%Y-%m-%d %H:%M:%S')
+        except ValueError:
+            return None
+
     @staticmethod
     def get_armed_force_name(armed_force_id: int|str) -> str:
         if isinstance(armed_force_id, str):
@@ -0,0 +1,34 @@
+import contextlib
+from typing import AsyncIterator
+
+import nonebot
+import pytest
+
+# 插件模块导入时读取配置并依赖其他插件，需要先初始化NoneBot
+nonebot.init(driver='~none', alembic_startup_check=False)
+
+
+@pytest.fixture
+def database():
+    """创建内存SQLite数据库并返回其会话的上下文管理器，只包含本插件的表"""
+    from nonebot_plugin_orm import Model
+    from sqlalchemy.ext.asyncio import AsyncSession, create_async_engine
+    from nonebot_plugin_delta_helper_modified import model
+
+    tables = [
+        cls.__table__ for cls in vars(model).values()
+        if isinstance(cls, type) and issubclass(cls, Model) and cls is not Model
+    ]
+
+    @contextlib.asynccontextmanager
+    async def open_session() -> AsyncIterator[AsyncSession]:
+        engine = create_async_engine('sqlite+aiosqlite://')
+        async with engine.begin() as conn:
+            await conn.run_sync(Model.metadata.create_all, tables=tables)
+        try:
+            async with AsyncSession(engine, expire_on_commit=False) as session:
+                yield session
+        finally:
+            await engine.dispose()
+
+    return open_session
@@ -0,0 +1,31 @@
+import asyncio
+
+import nonebot_plugin_delta_helper_modified as plugin
+from nonebot_plugin_delta_helper_modified.metrics import broadcasts_sent
+
+
+class FakeImage:
+    """发送战绩卡片，fail为True时发送失败"""
+    fail = False
+
+    def __init__(self, image: bytes):
+        self.image = image
+
+    async def send_to(self, target) -> None:
+        if self.fail:
+            raise RuntimeError('发送失败')
+
+
+def test_failed_card_send_is_not_counted_as_sent(monkeypatch):
+    monkeypatch.setattr(plugin, 'Image', FakeImage)
+    ok = broadcasts_sent.get(kind='record', result='ok')
+    error = broadcasts_sent.get(kind='record', result='error')
+
+    monkeypatch.setattr(FakeImage, 'fail', True)
+    asyncio.run(plugin.send_record_broadcast(b'card', 20001, '甲', '2025-07-01 12:00:00'))
+    assert broadcasts_sent.get(kind='record', result='ok') == ok
+    assert broadcasts_sent.get(kind='record', result='error') == error + 1
+
+    monkeypatch.setattr(FakeImage, 'fail', False)
+    asyncio.run(plugin.send_record_broadcast(b'card', 20001, '甲', '2025-07-01 12:00:00'))
+    assert broadcasts_sent.get(kind='record', result='ok') == ok + 1
@@ -0,0 +1,28 @@
+import asyncio
+
+from nonebot_plugin_delta_helper_modified.cluster import LeaderElector
+from nonebot_plugin_delta_helper_modified.db import UserDataDatabase
+
+
+def test_stale_leader_fails_token_check(database):
+    async def main():
+        async with database() as session:
+            db = UserDataDatabase(session)
+            old = LeaderElector('global', 'old', 30)
+            new = LeaderElector('global', 'new', 30)
+            assert await old.renew(db)
+            assert await old.verify(db)
+
+            # 旧主实例卡顿期间租约过期并被接管，本地有效期还未过
+            lease = await db.get_leader_lease('global')
+            lease.expire_time = 0
+            await db.commit()
+            assert await new.renew(db)
+            assert new.token == old.token + 1
+            assert old.is_leader
+
+            assert not await old.verify(db)
+            assert not old.is_leader
+            assert await new.verify(db)
+
+    asyncio.run(main())
@@ -0,0 +1,18 @@
+import httpx
+
+from nonebot_plugin_delta_helper_modified.deltaapi import is_auth_expired
+
+
+def response(ret: int, message: str) -> httpx.Response:
+    return httpx.Response(200, json={'ret': ret, 'iRet': ret, 'sMsg': message, 'jData': []})
+
+
+def test_expired_token_is_detected():
+    assert is_auth_expired(response(101, '非常抱歉，请先登录！'))
+    assert is_auth_expired(response(-1, '非常抱歉，请先登录！'))
+
+
+def test_other_errors_mentioning_login_are_not_expired():
+    assert not is_auth_expired(response(-1, '登录频繁，请稍后再试'))
+    assert not is_auth_expired(response(-2, '系统维护中，暂停登录'))
+    assert not is_auth_expired(response(0, 'ok'))
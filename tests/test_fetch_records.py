@@ -0,0 +1,57 @@
+import asyncio
+import datetime
+
+import nonebot_plugin_delta_helper_modified as plugin
+from nonebot_plugin_delta_helper_modified.records import SolRecord
+
+START = datetime.datetime(2025, 7, 1, 12, 0, 0)
+
+
+class FakeApi:
+    """按页返回烽火战绩，每页3条，新的在前"""
+
+    def __init__(self, count: int, fail_page: int = 0):
+        self.records = [
+            SolRecord({'dtEventTime': (START + datetime.timedelta(hours=k)).strftime('%Y-%m-%d %H:%M:%S')})
+            for k in range(count - 1, -1, -1)
+        ]
+        self.fail_page = fail_page
+        self.pages = 0
+
+    async def get_record(self, access_token, openid, type_id=4, page=1):
+        self.pages += 1
+        if page == self.fail_page:
+            return {'status': False, 'message': '获取失败', 'data': {}}
+        return {'status': True, 'message': '获取成功', 'data': {'gun': self.records[(page - 1) * 3:page * 3]}}
+
+
+def fetch(api: FakeApi, last_event_time):
+    return asyncio.run(plugin.fetch_unseen_records(api, 'token', 'openid', 4, last_event_time))
+
+
+def test_reaches_checkpoint():
+    api = FakeApi(10)
+    records, reached = fetch(api, START + datetime.timedelta(hours=5))
+    assert reached and len(records) == 6
+
+
+def test_page_limit_does_not_reach_checkpoint(monkeypatch):
+    monkeypatch.setattr(plugin, 'RECORD_MAX_PAGES', 2)
+    records, reached = fetch(FakeApi(10), START)
+    assert not reached and len(records) == 6
+
+
+def test_exhausted_history_counts_as_reached():
+    records, reached = fetch(FakeApi(4), START - datetime.timedelta(days=1))
+    assert reached and len(records) == 4
+
+
+def test_first_fetch_only_reads_one_page():
+    api = FakeApi(10)
+    records, reached = fetch(api, None)
+    assert not reached and len(records) == 3 and api.pages == 1
+
+
+def test_failed_page_discards_partial_result():
+    records, reached = fetch(FakeApi(10, fail_page=2), START)
+    assert records == []
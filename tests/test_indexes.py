@@ -0,0 +1,72 @@
+import asyncio
+from typing import Awaitable, Callable
+
+from sqlalchemy import Column, event
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from nonebot_plugin_delta_helper_modified.db import UserDataDatabase
+from nonebot_plugin_delta_helper_modified.model import UserData, WeeklyReportStat
+
+
+def index_name(column: Column) -> str:
+    """获取单列索引的名称，表名前缀随运行环境变化，不能写死"""
+    index, = (index for index in column.table.indexes if list(index.columns) == [column])
+    return index.name
+
+
+async def query_plans(session: AsyncSession, call: Callable[[], Awaitable[object]]) -> list[str]:
+    """执行数据库方法，返回其中每条SELECT语句的EXPLAIN QUERY PLAN结果"""
+    statements: list[tuple[str, tuple]] = []
+
+    def capture(conn, cursor, statement, parameters, context, executemany):
+        if statement.lstrip().upper().startswith('SELECT'):
+            statements.append((statement, parameters))
+
+    sync_engine = session.bind.sync_engine
+    event.listen(sync_engine, 'before_cursor_execute', capture)
+    try:
+        await call()
+    finally:
+        event.remove(sync_engine, 'before_cursor_execute', capture)
+
+    connection = await session.connection()
+    plans = []
+    for statement, parameters in statements:
+        rows = (await connection.exec_driver_sql(f'EXPLAIN QUERY PLAN {statement}', parameters)).all()
+        plans.append('\n'.join(row[3] for row in rows))
+    return plans
+
+
+def test_watch_roster_uses_switch_indexes(database):
+    async def main():
+        async with database() as session:
+            db = UserDataDatabase(session)
+
+            async def load():
+                return [roster async for roster in db.iter_watch_roster()]
+
+            plan, = await query_plans(session, load)
+            assert index_name(UserData.__table__.c.if_remind_safehouse) in plan
+            assert index_name(UserData.__table__.c.if_broadcast_record) in plan
+
+    asyncio.run(main())
+
+
+def test_safehouse_deadlines_use_switch_index(database):
+    async def main():
+        async with database() as session:
+            db = UserDataDatabase(session)
+            plan, = await query_plans(session, db.get_safehouse_deadlines)
+            assert index_name(UserData.__table__.c.if_remind_safehouse) in plan
+
+    asyncio.run(main())
+
+
+def test_group_weekly_stats_use_stat_date_index(database):
+    async def main():
+        async with database() as session:
+            db = UserDataDatabase(session)
+            plan, = await query_plans(session, lambda: db.get_group_weekly_report_stats('20250706'))
+            assert index_name(WeeklyReportStat.__table__.c.stat_date) in plan
+
+    asyncio.run(main())
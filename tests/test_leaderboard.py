@@ -0,0 +1,38 @@
+import asyncio
+import datetime
+
+from nonebot_plugin_delta_helper_modified.db import UserDataDatabase
+from nonebot_plugin_delta_helper_modified.leaderboard import GroupLeaderboard
+from nonebot_plugin_delta_helper_modified.model import UserData, WeeklyReportStat
+from nonebot_plugin_delta_helper_modified.util import Util
+
+GROUP_ID = 20001
+
+
+def add_user(session, qq_id: int, user_name: str, kill_num: int, if_broadcast_record: bool = True) -> None:
+    session.add(UserData(
+        qq_id=qq_id, group_id=GROUP_ID, access_token='', openid='', platform='qq',
+        if_remind_safehouse=False, if_broadcast_record=if_broadcast_record, user_name=user_name
+    ))
+    session.add(WeeklyReportStat(
+        qq_id=qq_id, stat_date=Util.get_week_stat_date(datetime.datetime.now()), sol_num=1, kill_num=kill_num
+    ))
+
+
+def test_load_fills_names_and_skips_disabled_users(database):
+    async def main():
+        async with database() as session:
+            add_user(session, 1, '甲', 5)
+            add_user(session, 2, '乙', 3)
+            add_user(session, 3, '丙', 9, if_broadcast_record=False)
+            await session.commit()
+
+            leaderboard = GroupLeaderboard()
+            await leaderboard.load(UserDataDatabase(session))
+            assert leaderboard.top(GROUP_ID, 'kill') == [(1, '甲', 5), (2, '乙', 3)]
+
+            # 关闭播报后立即从榜单移除
+            leaderboard.remove_user(1)
+            assert leaderboard.top(GROUP_ID, 'kill') == [(2, '乙', 3)]
+
+    asyncio.run(main())
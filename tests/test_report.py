@@ -0,0 +1,83 @@
+import asyncio
+import datetime
+
+from nonebot_plugin_delta_helper_modified.db import UserDataDatabase
+from nonebot_plugin_delta_helper_modified.records import SolRecord, TdmRecord
+from nonebot_plugin_delta_helper_modified.report import WeeklyReportEngine
+from nonebot_plugin_delta_helper_modified.util import Util
+
+QQ_ID = 10001
+# 连续三周的周三
+WEEK1 = datetime.datetime(2025, 7, 2, 20, 0, 0)
+WEEK2 = WEEK1 + datetime.timedelta(weeks=1)
+WEEK3 = WEEK1 + datetime.timedelta(weeks=2)
+
+
+def sol(event_time: datetime.datetime) -> SolRecord:
+    return SolRecord({'dtEventTime': event_time.strftime('%Y-%m-%d %H:%M:%S'), 'DurationS': 600, 'FinalPrice': '100', 'EscapeFailReason': 1})
+
+def tdm(event_time: datetime.datetime) -> TdmRecord:
+    return TdmRecord({'dtEventTime': event_time.strftime('%Y-%m-%d %H:%M:%S'), 'gametime': 600, 'KillNum': 10})
+
+def week(event_time: datetime.datetime) -> str:
+    return Util.get_week_stat_date(event_time)
+
+
+async def completeness(database: UserDataDatabase, *event_times: datetime.datetime, mode: str = 'sol') -> list[bool]:
+    result = []
+    for event_time in event_times:
+        stat = await database.get_weekly_report_stat(QQ_ID, week(event_time))
+        result.append(getattr(stat, f'{mode}_complete') if stat else None)
+    return result
+
+
+def test_continuous_ingest_completes_later_weeks(database):
+    async def main():
+        async with database() as session:
+            db = UserDataDatabase(session)
+            engine = WeeklyReportEngine(db)
+            # 首次统计只有第一页，最早战绩所在的周不完整
+            await engine.ingest_sol_records(QQ_ID, [sol(WEEK2), sol(WEEK1)], reached_checkpoint=False)
+            assert await completeness(db, WEEK1, WEEK2) == [False, True]
+            # 与检查点相接的新战绩所在的新一周完整
+            await engine.ingest_sol_records(QQ_ID, [sol(WEEK3)], reached_checkpoint=True)
+            assert await completeness(db, WEEK3) == [True]
+            assert await engine.get_weekly_report(QQ_ID, week(WEEK3)) is not None
+    asyncio.run(main())
+
+
+def test_gap_marks_weeks_incomplete(database):
+    async def main():
+        async with database() as session:
+            db = UserDataDatabase(session)
+            engine = WeeklyReportEngine(db)
+            await engine.ingest_sol_records(QQ_ID, [sol(WEEK1), sol(WEEK1 - datetime.timedelta(weeks=1))], reached_checkpoint=False)
+            await engine.ingest_tdm_records(QQ_ID, [tdm(WEEK1 - datetime.timedelta(weeks=2))], reached_checkpoint=False)
+            # 战场战绩所在的第二周由战场战绩创建
+            await engine.ingest_tdm_records(QQ_ID, [tdm(WEEK2)], reached_checkpoint=True)
+            assert await completeness(db, WEEK1, WEEK2) == [True, True]
+            # 没有翻页到检查点，检查点到本批最早战绩之间的各周都可能有遗漏
+            await engine.ingest_sol_records(QQ_ID, [sol(WEEK3), sol(WEEK2 + datetime.timedelta(days=2))], reached_checkpoint=False)
+            assert await completeness(db, WEEK1, WEEK2, WEEK3) == [False, False, True]
+            assert await engine.get_weekly_report(QQ_ID, week(WEEK3)) is not None
+            assert await engine.get_weekly_report(QQ_ID, week(WEEK2)) is None
+    asyncio.run(main())
+
+
+def test_tdm_gap_keeps_sol_weeks_complete(database):
+    async def main():
+        async with database() as session:
+            db = UserDataDatabase(session)
+            engine = WeeklyReportEngine(db)
+            await engine.ingest_sol_records(QQ_ID, [sol(WEEK2), sol(WEEK1)], reached_checkpoint=False)
+            assert await completeness(db, WEEK2) == [True]
+            # 战场战绩没有统计过，无法确认本批之前是否还有该周的战场战绩，只影响战场的完整标记
+            await engine.ingest_tdm_records(QQ_ID, [tdm(WEEK2)], reached_checkpoint=True)
+            assert await completeness(db, WEEK1, WEEK2, mode='tdm') == [False, False]
+            assert await completeness(db, WEEK1, WEEK2) == [False, True]
+            # 之后的战场战绩翻页没有到达检查点
+            await engine.ingest_tdm_records(QQ_ID, [tdm(WEEK3)], reached_checkpoint=False)
+            assert await completeness(db, WEEK2, WEEK3, mode='tdm') == [False, False]
+            assert await completeness(db, WEEK2) == [True]
+            assert await engine.get_weekly_report(QQ_ID, week(WEEK2)) is not None
+    asyncio.run(main())
@@ -0,0 +1,112 @@
+import asyncio
+
+import httpx
+import pytest
+
+from nonebot_plugin_delta_helper_modified import resilience
+from nonebot_plugin_delta_helper_modified.resilience import CircuitBreaker, CircuitOpenError, send_with_retry
+
+HOST = 'test.invalid'
+
+
+@pytest.fixture
+def breaker(monkeypatch):
+    """已熔断且冷却结束、等待探测的熔断器"""
+    breaker = CircuitBreaker(failure_threshold=1, reset_timeout=0)
+    breaker.record_failure()
+    monkeypatch.setitem(resilience.circuit_breakers, HOST, breaker)
+    return breaker
+
+
+def test_cancelled_probe_releases_breaker(breaker):
+    async def main():
+        started = asyncio.Event()
+
+        async def hang() -> httpx.Response:
+            started.set()
+            await asyncio.sleep(3600)
+            raise AssertionError("unreachable")
+
+        probe = asyncio.create_task(send_with_retry(HOST, hang, retry=False))
+        await started.wait()
+        assert breaker.is_open
+        probe.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await probe
+
+        # 取消的探测不能让熔断器一直停留在探测中
+        assert not breaker._probing
+
+        async def ok() -> httpx.Response:
+            return httpx.Response(200)
+
+        response = await send_with_retry(HOST, ok, retry=False)
+        assert response.status_code == 200
+        assert not breaker.is_open
+
+    asyncio.run(main())
+
+
+def test_probe_error_releases_breaker(breaker):
+    async def main():
+        async def broken() -> httpx.Response:
+            raise RuntimeError("boom")
+
+        with pytest.raises(RuntimeError):
+            await send_with_retry(HOST, broken, retry=False)
+        assert breaker.allow_request() == (True, True)
+
+    asyncio.run(main())
+
+
+def test_failed_probe_reopens_breaker(breaker):
+    breaker.reset_timeout = 60
+
+    async def main():
+        breaker._opened_at -= 60
+
+        async def timeout() -> httpx.Response:
+            raise httpx.ConnectTimeout("timeout")
+
+        with pytest.raises(httpx.ConnectTimeout):
+            await send_with_retry(HOST, timeout, retry=False)
+        with pytest.raises(CircuitOpenError):
+            await send_with_retry(HOST, timeout, retry=False)
+
+    asyncio.run(main())
+
+
+def test_cancelled_request_keeps_other_probe(monkeypatch):
+    breaker = CircuitBreaker(failure_threshold=1, reset_timeout=0)
+    monkeypatch.setitem(resilience.circuit_breakers, HOST, breaker)
+
+    async def main():
+        started = asyncio.Event()
+
+        async def hang() -> httpx.Response:
+            started.set()
+            await asyncio.sleep(3600)
+            raise AssertionError("unreachable")
+
+        # 熔断前发出的普通请求还在进行中时熔断，冷却结束后另一个请求开始探测
+        request = asyncio.create_task(send_with_retry(HOST, hang, retry=False))
+        await started.wait()
+        breaker.record_failure()
+        started.clear()
+        probe = asyncio.create_task(send_with_retry(HOST, hang, retry=False))
+        await started.wait()
+        assert breaker._probing
+
+        # 普通请求被取消不能释放进行中的探测，熔断器仍只允许一个探测请求
+        request.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await request
+        assert breaker._probing
+        assert breaker.allow_request() == (False, False)
+
+        probe.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await probe
+        assert not breaker._probing
+
+    asyncio.run(main())
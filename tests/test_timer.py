@@ -0,0 +1,45 @@
+import asyncio
+import time
+
+from nonebot_plugin_delta_helper_modified.timer import DeadlineQueue
+
+
+def test_slow_callback_does_not_block_next_deadline():
+    async def main():
+        calls: list[str] = []
+        release = asyncio.Event()
+
+        async def callback(key: str, deadline: float) -> None:
+            calls.append(key)
+            if key == 'slow':
+                await release.wait()
+
+        queue: DeadlineQueue[str] = DeadlineQueue('test_deadline_queue', callback, concurrency=4)
+        queue.push('slow', time.time())
+        await queue._fire()
+        await asyncio.sleep(0)
+        assert calls == ['slow']
+
+        # 上一批的慢回调还未结束，新到期的键照常触发
+        queue.push('fast', time.time())
+        await queue._fire()
+        await asyncio.sleep(0)
+        assert calls == ['slow', 'fast']
+
+        # 同一个键在回调执行期间再次到期时，等上一次回调结束后再触发
+        queue.push('slow', time.time())
+        await queue._fire()
+        await asyncio.sleep(0)
+        assert calls == ['slow', 'fast']
+        assert queue.backlog() == 1
+
+        release.set()
+        await asyncio.sleep(0)
+        await asyncio.sleep(0)
+        assert 'slow' in queue
+        await queue._fire()
+        await asyncio.sleep(0)
+        assert calls == ['slow', 'fast', 'slow']
+        await asyncio.gather(*queue._tasks)
+
+    asyncio.run(main())
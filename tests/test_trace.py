@@ -0,0 +1,27 @@
+import asyncio
+import json
+
+from nonebot_plugin_delta_helper_modified import trace
+from nonebot_plugin_delta_helper_modified.trace import flush_traces, span, trace_command
+
+
+def test_traces_are_buffered_until_flush(tmp_path, monkeypatch):
+    trace_file = tmp_path / 'trace.jsonl'
+    monkeypatch.setattr(trace, 'trace_file', str(trace_file))
+
+    @trace_command('测试命令')
+    async def command():
+        with span('子跨度'):
+            await asyncio.sleep(0)
+
+    async def main():
+        await command()
+        await command()
+        # 命令结束时不在事件循环中写入文件
+        assert not trace_file.exists()
+        await flush_traces()
+
+    asyncio.run(main())
+    lines = trace_file.read_text(encoding='utf-8').splitlines()
+    assert len(lines) == 2
+    assert [item['name'] for item in json.loads(lines[0])['spans']] == ['测试命令', '子跨度']